@@ -1,6 +1,7 @@
 import numpy as np
 import matplotlib.pyplot as plt
-import matplotlib.image as mpimg
+
+from image_io import imread
 
 # Global max and min intensity values for plotting
 max_r = np.iinfo(np.uint8).max
@@ -8,7 +9,7 @@ min_r = np.iinfo(np.uint8).min
 
 if __name__ == "__main__":
 	# Load image to numpy array
-	img = mpimg.imread('data/Fig0310(b)(washed_out_pollen_image).tif')
+	img = imread('data/Fig0310(b)(washed_out_pollen_image).tif')
 
 	fig = plt.figure()
 	fig.suptitle('1A: Histogram', fontsize=20)
@@ -1,6 +1,8 @@
 import numpy as np
 import matplotlib.pyplot as plt
-import matplotlib.image as mpimg
+
+from image_io import imread
+from histogram import equalize_histogram
 
 # Global max and min intensity values for plotting
 max_r = np.iinfo(np.uint8).max
@@ -8,27 +10,11 @@ min_r = np.iinfo(np.uint8).min
 
 if __name__ == "__main__":
 	# Load image to numpy array
-	img = mpimg.imread('data/Fig0310(b)(washed_out_pollen_image).tif')
-	u, v = img.shape
-
-	# Get number of occurences of each intensity level
-	n = np.bincount(img.ravel(), minlength=max_r+1).astype(np.float64)
-
-	# Get cumulative distribution function
-	su = 0
-	s = np.zeros_like(n)
-	for j in range(0, max_r+1):
-		su += n[j]
-		s[j] = su
-
-	s = np.around(s*max_r/img.size)
-
-	# Create output image by mapping intensity values in the input image to s values
-	img_eq = np.zeros_like(img)
-	for i in range(0, u):
-		for j in range(0, v):
-			img_eq[i, j] = s[img[i,j]]
+	img = imread('data/Fig0310(b)(washed_out_pollen_image).tif')
 
+	# Equalize image by mapping intensity values through the cumulative
+	# distribution function of the image
+	img_eq = equalize_histogram(img)
 
 	fig = plt.figure()
 	fig.suptitle('1B: Histogram Equalization', fontsize=20)
@@ -1,7 +1,7 @@
 import numpy as np
 import matplotlib.pyplot as plt
-import matplotlib.image as mpimg
 
+from image_io import imread
 from spatial_filters import spatial_convolution2d
 from scaling_functions import im2double, im2uint8
 
@@ -11,7 +11,7 @@ min_r = np.iinfo(np.uint8).min
 
 if __name__ == "__main__":
 	# Load image
-	img = mpimg.imread('data/Fig0343(a)(skeleton_orig).tif')
+	img = imread('data/Fig0343(a)(skeleton_orig).tif')
 
 	# Initialize laplacian filter
 	l = np.negative(np.ones((3,3)))
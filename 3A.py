@@ -1,8 +1,8 @@
 import numpy as np
 import matplotlib.pyplot as plt
-import matplotlib.image as mpimg
 
-from freq_filters import filter_image_freq
+from image_io import imread
+from freq_filters import power_spectrum
 from scaling_functions import im2double, im2uint8
 
 # Global max and min intensity values for plotting
@@ -11,13 +11,13 @@ min_r = np.iinfo(np.uint8).min
 
 if __name__ == "__main__":
 	# Load images to numpy arrays
-	img1 = mpimg.imread('data/P3_fig1.png')
-	img2 = mpimg.imread('data/P3_fig2.png')
-	img3 = mpimg.imread('data/P3_fig3.png')
+	img1 = imread('data/P3_fig1.png', np.float32)
+	img2 = imread('data/P3_fig2.png', np.float32)
+	img3 = imread('data/P3_fig3.png', np.float32)
 
 
 	# Get power spectrum of image 3
-	_, _, P3 = filter_image_freq(img3)
+	P3 = power_spectrum(img3)
 
 
 	# Scale to uint8 before displaying
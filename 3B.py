@@ -1,7 +1,7 @@
 import numpy as np
 import matplotlib.pyplot as plt
-import matplotlib.image as mpimg
 
+from image_io import imread
 from spatial_filters import mean_filter, adaptive_lnr_filter
 from scaling_functions import im2double, im2uint8
 
@@ -11,7 +11,7 @@ min_r = np.iinfo(np.uint8).min
 
 if __name__ == "__main__":
 	# Load image to numpy array
-	img = mpimg.imread('data/P3_fig1.png')
+	img = imread('data/P3_fig1.png', np.float32)
 
 	# Filter image in spatial domain using a arithmetic mean filter with filter size 5x5
 	g1 = mean_filter(img, s=5, ftype='arithmetic')
@@ -1,7 +1,7 @@
 import numpy as np
 import matplotlib.pyplot as plt
-import matplotlib.image as mpimg
 
+from image_io import imread
 from freq_filters import filter_image_freq
 from scaling_functions import im2double, im2uint8
 
@@ -11,7 +11,7 @@ min_r = np.iinfo(np.uint8).min
 
 if __name__ == "__main__":
 	# Load image to numpy array
-	img = mpimg.imread('data/P3_fig1.png')
+	img = imread('data/P3_fig1.png', np.float32)
 
 	# Filter image in frequency domain using a butterworth lowpass filter of
 	# order 2 with cutoff frequency 160
@@ -1,7 +1,7 @@
 import numpy as np
 import matplotlib.pyplot as plt
-import matplotlib.image as mpimg
 
+from image_io import imread
 from spatial_filters import median_filter, adaptive_median_filter
 from scaling_functions import im2double, im2uint8
 
@@ -11,7 +11,7 @@ min_r = np.iinfo(np.uint8).min
 
 if __name__ == "__main__":
 	# Load image to numpy array
-	img = mpimg.imread('data/P3_fig2.png')
+	img = imread('data/P3_fig2.png', np.float32)
 
 	# Filter image in spatial domain using a standard median filter with
 	# filter size 3x3
@@ -1,8 +1,8 @@
 import numpy as np
 import matplotlib.pyplot as plt
-import matplotlib.image as mpimg
 
-from freq_filters import filter_image_freq
+from image_io import imread
+from filter_chain import FilterChain, filter_chains
 from scaling_functions import im2double, im2uint8
 
 # Global max and min intensity values for plotting
@@ -11,16 +11,21 @@ min_r = np.iinfo(np.uint8).min
 
 if __name__ == "__main__":
 	# Load image to numpy array
-	img = mpimg.imread('data/P3_fig3.png')
+	img = imread('data/P3_fig3.png', np.float32)
 
-	# Filter image in frequency domain using a notch reject filter of order 2
-	# with cutoff frequency 15 at position (150,150) and (-150,-150)
-	G, H, P = filter_image_freq(img, fclass='notchreject', ftype='butterworth',
-								d0=15, n=2, u_k=150, v_k=150)
+	# Notch reject filter of order 2 with cutoff frequency 15 at position
+	# (150,150) and (-150,-150)
+	reject = FilterChain([{'fclass': 'notchreject', 'ftype': 'butterworth',
+						   'd0': 15, 'n': 2, 'u_k': 150, 'v_k': 150}])
 
-	# Get spatial noise pattern using the notch pass filter with same parameters
-	G2, _, _ = filter_image_freq(img, fclass='notchpass', ftype='butterworth',
-								 d0=15, n=2, u_k=150, v_k=150)
+	# Notch pass filter with same parameters to get the spatial noise pattern
+	notch = FilterChain([{'fclass': 'notchpass', 'ftype': 'butterworth',
+						  'd0': 15, 'n': 2, 'u_k': 150, 'v_k': 150}])
+
+	# Filter image in frequency domain with both filters, sharing the fourier
+	# transform of the image
+	(G, G2), P = filter_chains(img, [reject, notch], spectrum=True)
+	H = reject.transfer(img.shape)
 
 	# Scale to uint8 before displaying
 	img = im2uint8(img)
@@ -0,0 +1,272 @@
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from image_io import imread, imwrite
+from histogram import equalize_histogram
+from spatial_filters import spatial_convolution2d, mean_filter, median_filter, adaptive_median_filter, adaptive_lnr_filter
+from freq_filters import filter_image_freq
+from filter_chain import FilterChain, filter_chains
+from scaling_functions import im2double, im2uint8
+
+# File extensions of the images found in input directories
+IMAGE_EXTENSIONS = ('.png', '.tif', '.tiff', '.jpg', '.jpeg', '.bmp', '.npy')
+
+# Global max and min intensity values for plotting
+max_r = np.iinfo(np.uint8).max
+min_r = np.iinfo(np.uint8).min
+
+# Recipes
+###############################################################################
+# Each recipe takes the image read from a file and whether plots are requested,
+# and returns the output images by name (uint8) and the panels of the
+# diagnostic plot as (title, image, whether to show it on the [0, 255] scale).
+# A panel with title 'histogram' is drawn as the histogram of its image.
+###############################################################################
+
+# 1B: Histogram equalization
+def recipe_1B(img, plots):
+	if img.dtype not in (np.uint8, np.uint16):
+		img = im2uint8(img)
+	img_eq = equalize_histogram(img)
+	return {'equalized': img_eq}, [("Equalized Image", img_eq, True), ("histogram", img_eq, True)]
+
+# 2BC: Laplacian sharpening
+def recipe_2BC(img, plots):
+	# Initialize laplacian filter
+	l = np.negative(np.ones((3,3)))
+	l[1, 1] = 8
+
+	img_scaled = im2double(img)
+	lap = spatial_convolution2d(img_scaled, l)
+	sharpimg = im2uint8(img_scaled + lap)
+	lap = im2uint8(im2double(lap))
+
+	return {'laplacian': lap, 'sharpened': sharpimg}, [("Original Image", im2uint8(img_scaled), True),
+		("Laplacian Image", lap, True), ("Laplacian Sharpened Image", sharpimg, True)]
+
+# 3B: Mean and adaptive local noise reduction filters. The noise variance is
+# estimated as the median of the local variances in 5x5 windows, which are
+# mostly flat background for the images of the problem.
+def recipe_3B(img, plots):
+	g1 = mean_filter(img, s=5, ftype='arithmetic')
+	g2 = mean_filter(img, s=5, ftype='geometric')
+
+	# The arithmetic mean is the local mean of the variance estimate
+	var_g = np.median(mean_filter(np.square(img), s=5, ftype='arithmetic') - np.square(g1))
+	g3 = adaptive_lnr_filter(img, var_g, s=5)
+
+	g1, g2, g3 = im2uint8(g1), im2uint8(g2), im2uint8(g3)
+	return {'arithmetic': g1, 'geometric': g2, 'lnr': g3}, [("Original Image", im2uint8(img), True),
+		("Arithmetic Mean Filter (s=5)", g1, True), ("Geometric Mean Filter (s=5)", g2, True),
+		("Adaptive Noise Reduction Filter (s=5)", g3, True)]
+
+# 3D: Butterworth lowpass filter
+def recipe_3D(img, plots):
+	G, H, P = filter_image_freq(img, fclass='lowpass', ftype='butterworth', d0=160, n=2, spectrum=plots, transfer=plots)
+	G = im2uint8(G)
+	return {'result': G}, [("Original Image", im2uint8(img), True), ("Image Power Spectrum", P, False),
+		("Butterworth Lowpass Filter (d0=160, n=2)", H, False), ("Result", G, True)]
+
+# 3E: Median and adaptive median filters
+def recipe_3E(img, plots):
+	g = im2uint8(median_filter(img, s=5))
+	g2 = im2uint8(adaptive_median_filter(img, s=3, s_max=5))
+	return {'median': g, 'adaptive_median': g2}, [("Original Image", im2uint8(img), True),
+		("Median Filter (s=5)", g, True), ("Adaptive Median Filter (s=3, s_max=5)", g2, True)]
+
+# 3F: Notch reject filter, and the noise pattern of the notch pass filter
+def recipe_3F(img, plots):
+	params = {'ftype': 'butterworth', 'd0': 15, 'n': 2, 'u_k': 150, 'v_k': 150}
+	reject = FilterChain([dict(params, fclass='notchreject')])
+	notch = FilterChain([dict(params, fclass='notchpass')])
+	(G, G2), P = filter_chains(img, [reject, notch], spectrum=plots)
+	H = reject.transfer(img.shape) if plots else None
+
+	G = im2uint8(G)
+	G2 = im2uint8(G2)
+	return {'result': G, 'noise': G2}, [("Original Image", im2uint8(img), True), ("Result", G, True),
+		("Image Power Spectrum", P, False), ("Notch Reject Filter (d0=15, n=2, u_k=150, v_k=150)", H, False),
+		("Spatial Noise Pattern", G2, False)]
+
+# Recipes by name, as (function, data type of the input image, title of the
+# plot). Float recipes get images scaled to [0,1].
+RECIPES = {
+	'1B': (recipe_1B, None, '1B: Histogram Equalization'),
+	'2BC': (recipe_2BC, None, '2BC: Spatial Filtering'),
+	'3B': (recipe_3B, np.float32, '3B: Denoising'),
+	'3D': (recipe_3D, np.float32, '3D: Denoising'),
+	'3E': (recipe_3E, np.float32, '3E: Denoising'),
+	'3F': (recipe_3F, np.float32, '3F: Denoising'),
+}
+
+# Find Images
+###############################################################################
+# INPUT
+# inputs:		List of image files, directories (all images in them) or
+#				glob patterns
+###############################################################################
+# OUTPUT
+# paths:		Sorted list of image files, without duplicates
+###############################################################################
+def find_images(inputs):
+	paths = set()
+	for pattern in inputs:
+		if os.path.isdir(pattern):
+			matches = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+		else:
+			matches = glob.glob(pattern)
+		paths.update(path for path in matches
+			if os.path.isfile(path) and os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS)
+	return sorted(paths)
+
+# Process Image File
+###############################################################################
+# INPUT
+# path:			Path of the input image
+# recipe:		Name of the recipe in RECIPES
+# output:		Directory the outputs are written to, as
+#				<name>_<recipe>_<output>.<ext>
+# plots:		Whether to write the diagnostic plot, as <name>_<recipe>_plot.png
+# ext:			File extension of the output images
+###############################################################################
+# OUTPUT
+# result:		Dict with the input 'path', number of 'pixels', 'seconds'
+#				spent, the 'outputs' written, and the 'error' if it failed
+###############################################################################
+def process_file(path, recipe, output, plots=False, ext='.png'):
+	start = time.time()
+	result = {'path': path, 'pixels': 0, 'seconds': 0.0, 'outputs': [], 'error': None}
+	func, dtype, title = RECIPES[recipe]
+	stem = '%s_%s' % (os.path.splitext(os.path.basename(path))[0], recipe)
+
+	try:
+		img = np.asarray(imread(path, dtype))
+		if img.ndim != 2:
+			raise ValueError("Only grayscale images are supported, image has shape %s" % (img.shape,))
+		result['pixels'] = img.size
+
+		outputs, panels = func(img, plots)
+		for name, out in sorted(outputs.items()):
+			out_path = os.path.join(output, '%s_%s%s' % (stem, name, ext))
+			imwrite(out_path, out)
+			result['outputs'].append(out_path)
+
+		if plots:
+			out_path = os.path.join(output, '%s_plot.png' % stem)
+			_save_plot(out_path, title, panels)
+			result['outputs'].append(out_path)
+	except Exception as e:
+		result['error'] = '%s: %s' % (type(e).__name__, e)
+
+	result['seconds'] = time.time() - start
+	return result
+
+# Process Image Files
+###############################################################################
+# INPUT
+# paths:		List of input image files
+# recipe:		Name of the recipe in RECIPES
+# output:		Directory the outputs are written to (created if needed)
+# plots:		Whether to write diagnostic plots
+# ext:			File extension of the output images
+# workers:		Number of worker processes (default is the number of CPUs,
+#				files are processed serially for 1)
+# verbose:		Whether to print each file as it is done
+###############################################################################
+# OUTPUT
+# results:		List of results of process_file, in the order of paths
+# stats:		Dict with the number of 'files', 'failed' files, 'pixels',
+#				wall time 'seconds', 'files_per_second' and
+#				'megapixels_per_second'
+###############################################################################
+def process_files(paths, recipe, output, plots=False, ext='.png', workers=None, verbose=True):
+	if recipe not in RECIPES:
+		raise ValueError("Unknown recipe '%s'" % recipe)
+	if not os.path.isdir(output):
+		os.makedirs(output)
+	if workers is None:
+		workers = os.cpu_count() or 1
+	workers = max(1, min(workers, len(paths)))
+
+	start = time.time()
+	results = []
+
+	def report(result):
+		results.append(result)
+		if verbose:
+			status = 'FAILED %s' % result['error'] if result['error'] else '%.3fs' % result['seconds']
+			print("[%d/%d] %s %s" % (len(results), len(paths), result['path'], status))
+			sys.stdout.flush()
+
+	if workers == 1:
+		for path in paths:
+			report(process_file(path, recipe, output, plots, ext))
+	else:
+		with ProcessPoolExecutor(max_workers=workers) as pool:
+			futures = [pool.submit(process_file, path, recipe, output, plots, ext) for path in paths]
+			for future in futures:
+				report(future.result())
+
+	seconds = time.time() - start
+	pixels = sum(r['pixels'] for r in results if r['error'] is None)
+	stats = {'files': len(results), 'failed': sum(r['error'] is not None for r in results), 'pixels': pixels,
+		'seconds': seconds, 'files_per_second': len(results) / seconds if seconds > 0 else None,
+		'megapixels_per_second': pixels / 1e6 / seconds if seconds > 0 else None}
+
+	return results, stats
+
+# Write the panels of a diagnostic plot with the non-interactive Agg backend.
+# matplotlib is only imported here, so that runs without plots start fast.
+def _save_plot(path, title, panels):
+	import matplotlib
+	matplotlib.use('Agg')
+	import matplotlib.pyplot as plt
+
+	fig = plt.figure(figsize=(5 * min(len(panels), 3), 5 * ((len(panels) + 2) // 3)))
+	fig.suptitle(title, fontsize=20)
+	rows, cols = (len(panels) + 2) // 3, min(len(panels), 3)
+
+	for k, (name, img, scaled) in enumerate(panels):
+		ax = fig.add_subplot(rows, cols, k + 1)
+		if name == 'histogram':
+			ax.set_title("Equalized Histogram")
+			ax.hist(img.ravel(), bins=max_r, range=(min_r, max_r), density=True, color='k')
+			ax.set_xlim((min_r, max_r))
+			continue
+		ax.set_title(name)
+		if scaled:
+			ax.imshow(img, cmap='gray', vmin=min_r, vmax=max_r)
+		else:
+			ax.imshow(img, cmap='gray')
+		ax.axis('off')
+
+	fig.savefig(path)
+	plt.close(fig)
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Apply a recipe of the home exam problems to a batch of images")
+	parser.add_argument('recipe', choices=sorted(RECIPES), help="problem whose processing is applied")
+	parser.add_argument('inputs', nargs='+', help="image files, directories or glob patterns")
+	parser.add_argument('-o', '--output', default='output', help="directory the outputs are written to")
+	parser.add_argument('--plots', action='store_true', help="also write a diagnostic plot of each image")
+	parser.add_argument('--format', default='png', choices=['png', 'tif', 'npy'], help="file format of the outputs")
+	parser.add_argument('-j', '--workers', type=int, help="number of worker processes (default is the number of CPUs)")
+	parser.add_argument('-q', '--quiet', action='store_true', help="only print the summary")
+	args = parser.parse_args()
+
+	paths = find_images(args.inputs)
+	if not paths:
+		parser.error("No images found in %s" % ' '.join(args.inputs))
+
+	results, stats = process_files(paths, args.recipe, args.output, args.plots, '.' + args.format, args.workers, not args.quiet)
+
+	print("%d files (%d failed), %.1f megapixels in %.2fs: %.2f files/s, %.2f megapixels/s" % (stats['files'],
+		stats['failed'], stats['pixels'] / 1e6, stats['seconds'], stats['files_per_second'] or 0,
+		stats['megapixels_per_second'] or 0))
+	sys.exit(1 if stats['failed'] else 0)
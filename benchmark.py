@@ -0,0 +1,202 @@
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+import freq_filters
+import spatial_filters
+from histogram import equalize_histogram, clahe
+from image_io import imread
+
+# Default image sizes of the synthetic inputs
+sizes = [128, 256, 512]
+
+# Data types of the input images
+dtypes = ['uint8', 'float32', 'float64']
+
+# Window sizes of the neighbourhood filters
+windows = [3, 7]
+
+# Number of runs for each measurement, the fastest one is reported
+repeats = 3
+
+# Relative slowdown against the baseline that is reported as a regression
+threshold = 0.25
+
+# Smallest slowdown in seconds that is reported, below it timings are noise
+min_slowdown = 0.001
+
+# Cases of spatial filters, as (name, parameters, function of image and window)
+def spatial_cases(with_loops):
+	cases = []
+	for method in ('direct', 'separable', 'fft'):
+		cases.append(('spatial_convolution2d', {'method': method},
+			lambda img, s, method=method: spatial_filters.spatial_convolution2d(img, np.ones((s, s)) / (s * s), method)))
+	for ftype in ('arithmetic', 'geometric', 'harmonic', 'contraharmonic'):
+		cases.append(('mean_filter', {'ftype': ftype, 'method': 'integral'},
+			lambda img, s, ftype=ftype: spatial_filters.mean_filter(img, s, ftype, 'integral')))
+	for method in ('sort', 'histogram'):
+		cases.append(('median_filter', {'method': method},
+			lambda img, s, method=method: spatial_filters.median_filter(img, s, method)))
+	cases.append(('max_filter', {}, lambda img, s: spatial_filters.max_filter(img, s)))
+	cases.append(('min_filter', {}, lambda img, s: spatial_filters.min_filter(img, s)))
+	cases.append(('adaptive_median_filter', {'method': 'vectorized'},
+		lambda img, s: spatial_filters.adaptive_median_filter(img, s, s + 4)))
+	cases.append(('adaptive_lnr_filter', {'method': 'integral'},
+		lambda img, s: spatial_filters.adaptive_lnr_filter(img, 0.01, s)))
+
+	if with_loops:
+		cases.append(('spatial_convolution2d', {'method': 'loop'},
+			lambda img, s: spatial_filters.spatial_convolution2d(img, np.ones((s, s)) / (s * s), 'loop')))
+		cases.append(('mean_filter', {'ftype': 'geometric', 'method': 'loop'},
+			lambda img, s: spatial_filters.mean_filter(img, s, 'geometric', 'loop')))
+		cases.append(('median_filter', {'method': 'loop'}, lambda img, s: spatial_filters.median_filter(img, s, 'loop')))
+		cases.append(('adaptive_median_filter', {'method': 'loop'},
+			lambda img, s: spatial_filters.adaptive_median_filter(img, s, s + 4, 'loop')))
+		cases.append(('adaptive_lnr_filter', {'method': 'loop'},
+			lambda img, s: spatial_filters.adaptive_lnr_filter(img, 0.01, s, 'loop')))
+	return cases
+
+# Cases of filter builders, as (name, parameters, function of filter shape and
+# data type)
+def builder_cases():
+	cases = []
+	notches = [(40 * k, 30 * k, 10) for k in range(1, 9)]
+	for ftype in ('ideal', 'butterworth', 'gaussian'):
+		p = {'ftype': ftype}
+		cases += [
+			('lowpass_filter', p, lambda shape, dtype, ftype=ftype: freq_filters.lowpass_filter(shape, 60, ftype, dtype=dtype)),
+			('highpass_filter', p, lambda shape, dtype, ftype=ftype: freq_filters.highpass_filter(shape, 60, ftype, dtype=dtype)),
+			('bandreject_filter', p, lambda shape, dtype, ftype=ftype: freq_filters.bandreject_filter(shape, 60, 20, ftype, dtype=dtype)),
+			('bandpass_filter', p, lambda shape, dtype, ftype=ftype: freq_filters.bandpass_filter(shape, 60, 20, ftype, dtype=dtype)),
+			('notch_reject_filter', p, lambda shape, dtype, ftype=ftype: freq_filters.notch_reject_filter(shape, 10, ftype, u_k=40, v_k=30, dtype=dtype)),
+			('notch_pass_filter', p, lambda shape, dtype, ftype=ftype: freq_filters.notch_pass_filter(shape, 10, ftype, u_k=40, v_k=30, dtype=dtype)),
+			('multi_notch_reject_filter', p, lambda shape, dtype, ftype=ftype: freq_filters.multi_notch_reject_filter(shape, notches, ftype, dtype=dtype)),
+			('multi_notch_pass_filter', p, lambda shape, dtype, ftype=ftype: freq_filters.multi_notch_pass_filter(shape, notches, ftype, dtype=dtype)),
+		]
+	return cases
+
+# Cases of frequency domain filtering, as (name, parameters, function of image)
+def freq_cases():
+	cases = []
+	for mode in ('complex', 'real'):
+		for padding in ('double', 'fast'):
+			cases.append(('filter_image_freq', {'mode': mode, 'padding': padding},
+				lambda img, mode=mode, padding=padding: freq_filters.filter_image_freq(img, 'lowpass', 'butterworth', 60,
+					mode=mode, padding=padding, spectrum=False, transfer=False)))
+	return cases
+
+# Cases of histogram processing, as (name, parameters, function of image)
+def histogram_cases():
+	return [('equalize_histogram', {}, equalize_histogram), ('clahe', {}, clahe)]
+
+# Fastest time of repeated calls of func
+def time_call(func, *args):
+	best = np.inf
+	for _ in range(repeats):
+		start = time.time()
+		func(*args)
+		best = min(best, time.time() - start)
+	return best
+
+# Input images, as (name, uint8 image): synthetic noise of each size and the
+# images in data/
+def input_images(image_sizes, with_data):
+	rng = np.random.RandomState(0)
+	images = [('random%dx%d' % (M, M), (rng.rand(M, M) * 256).astype(np.uint8)) for M in image_sizes]
+	if with_data:
+		for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', '*.*'))):
+			img = imread(path)
+			if img.dtype == np.uint8 and img.ndim == 2:
+				images.append((os.path.basename(path), np.ascontiguousarray(img)))
+	return images
+
+# Convert uint8 image to a data type, with floats scaled to [0,1]
+def as_dtype(img, dtype):
+	if dtype == 'uint8':
+		return img
+	return (img / 255.0).astype(dtype)
+
+# Run all cases and return the times by case key
+def run(image_sizes, with_data, with_loops, verbose=True):
+	results = {}
+
+	def record(key, seconds):
+		results[key] = seconds
+		if verbose:
+			print("%-80s %9.4fs" % (key, seconds))
+			sys.stdout.flush()
+
+	for name, img8 in input_images(image_sizes, with_data):
+		for dtype in dtypes:
+			img = as_dtype(img8, dtype)
+			for fname, params, func in spatial_cases(with_loops):
+				# Loops are only timed on the smallest images
+				if params.get('method') == 'loop' and img.size > 128 * 128:
+					continue
+				for s in windows:
+					record(_key(fname, dict(params, s=s), dtype, name), time_call(func, img, s))
+			if dtype != 'uint8':
+				for fname, params, func in freq_cases():
+					record(_key(fname, params, dtype, name), time_call(func, img))
+			else:
+				for fname, params, func in histogram_cases():
+					record(_key(fname, params, dtype, name), time_call(func, img))
+
+	# Builders are timed for the transform shape of each synthetic size
+	for M in image_sizes:
+		for dtype in ('float32', 'float64'):
+			for fname, params, func in builder_cases():
+				record(_key(fname, params, dtype, 'shape%dx%d' % (2*M, 2*M)), time_call(func, (2*M, 2*M), np.dtype(dtype)))
+
+	return results
+
+# Compare results with a baseline, and get the regressions as (key, time,
+# baseline time)
+def compare(results, baseline, limit=threshold):
+	regressions = []
+	for key, seconds in sorted(results.items()):
+		base = baseline.get(key)
+		if base is not None and seconds > base * (1 + limit) and seconds - base > min_slowdown:
+			regressions.append((key, seconds, base))
+	return regressions
+
+# Key of a case
+def _key(fname, params, dtype, image):
+	args = ','.join('%s=%s' % (k, params[k]) for k in sorted(params))
+	return '%s[%s] %s %s' % (fname, args, dtype, image)
+
+# Environment the results were measured in
+def _environment():
+	return {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+		'processor': platform.processor(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Time all filters across image sizes, window sizes and data types")
+	parser.add_argument('--sizes', type=int, nargs='+', default=sizes, help="sizes of the synthetic images")
+	parser.add_argument('--no-data', action='store_true', help="skip the images in data/")
+	parser.add_argument('--loops', action='store_true', help="also time the loop methods on the smallest images")
+	parser.add_argument('--output', default='benchmark_results.json', help="JSON file to write the results to")
+	parser.add_argument('--baseline', help="JSON file with baseline results to compare with")
+	parser.add_argument('--threshold', type=float, default=threshold, help="relative slowdown reported as a regression")
+	args = parser.parse_args()
+
+	results = run(args.sizes, not args.no_data, args.loops)
+
+	with open(args.output, 'w') as f:
+		json.dump({'environment': _environment(), 'results': results}, f, indent=1, sort_keys=True)
+	print("Wrote %d results to %s" % (len(results), args.output))
+
+	if args.baseline:
+		with open(args.baseline) as f:
+			baseline = json.load(f)['results']
+		regressions = compare(results, baseline, args.threshold)
+		for key, seconds, base in regressions:
+			print("REGRESSION %-80s %9.4fs (baseline %.4fs, %+.0f%%)" % (key, seconds, base, 100 * (seconds / base - 1)))
+		print("%d of %d cases slower than the baseline by more than %.0f%%" % (len(regressions), len(results), 100 * args.threshold))
+		sys.exit(1 if regressions else 0)
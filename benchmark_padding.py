@@ -0,0 +1,34 @@
+import time
+
+import numpy as np
+
+from freq_filters import filter_image_freq, padded_shape
+
+# Odd image sizes, most of them prime so that 2M has a large prime factor
+sizes = [251, 331, 499, 509, 683, 761, 1009, 1021]
+
+# Number of runs for each measurement, the fastest one is reported
+repeats = 3
+
+# Time filtering of an image with the given padding
+def time_filter(img, padding):
+	best = np.inf
+	for _ in range(repeats):
+		start = time.time()
+		filter_image_freq(img, fclass='lowpass', ftype='butterworth', d0=160, n=2, padding=padding)
+		best = min(best, time.time() - start)
+	return best
+
+if __name__ == "__main__":
+	rng = np.random.RandomState(0)
+
+	print("%6s %14s %14s %10s %10s %8s" % ("size", "double shape", "fast shape", "double", "fast", "speedup"))
+
+	for M in sizes:
+		img = rng.rand(M, M)
+
+		t_double = time_filter(img, 'double')
+		t_fast = time_filter(img, 'fast')
+
+		print("%6d %14s %14s %9.3fs %9.3fs %7.1fx" % (M, "%dx%d" % padded_shape(img.shape, 'double'),
+			"%dx%d" % padded_shape(img.shape, 'fast'), t_double, t_fast, t_double / t_fast))
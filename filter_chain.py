@@ -0,0 +1,130 @@
+import numpy as np
+
+from freq_filters import filter_params, power_spectrum, _chain_for_image, _forward, _inverse, _log_power
+
+# Filter Chain
+###############################################################################
+# INPUT
+# stages:		Ordered list of stages. A frequency domain stage is a dict
+#				with any of the filter parameters of filter_image_freq
+#				('fclass', 'ftype', 'd0', 'w', 'n', 'u_k', 'v_k' and
+#				'notches'), a spatial stage is a function taking and
+#				returning an image, e.g. lambda f: median_filter(f, 3).
+#				Consecutive frequency domain stages are applied as the
+#				product of their filters, with one forward and one inverse
+#				transform.
+# mode:			Transform mode ('complex' or 'real')
+# padding:		Padding of the transform ('double', 'fast' or 'minimal')
+# support:		Width of the spatial filter kernel in pixels (only applies
+#				for minimal padding)
+###############################################################################
+# OUTPUT
+# chain:		Chain that filters an image when called, chain(img). A chain
+#				with a single frequency domain stage gives the same output as
+#				filter_image_freq. Consecutive frequency domain stages give
+#				the output of their combined filter, which differs from
+#				running filter_image_freq for each of them only by the
+#				cropping (and magnitude in complex mode) between the stages.
+###############################################################################
+class FilterChain(object):
+	def __init__(self, stages, mode='complex', padding='double', support=None):
+		if mode not in ('complex', 'real'):
+			raise ValueError("Unknown transform mode '%s'" % mode)
+		self.mode = mode
+		self.padding = padding
+		self.support = support
+
+		# Spatial stages, and lists of consecutive frequency domain stages
+		self.groups = []
+		for stage in stages:
+			if callable(stage):
+				self.groups.append(stage)
+			elif self.groups and isinstance(self.groups[-1], list):
+				self.groups[-1].append(filter_params(stage))
+			else:
+				self.groups.append([filter_params(stage)])
+
+	def __call__(self, img):
+		return filter_chains(img, [self])[0][0]
+
+	# Combined filter of the k-th group of frequency domain stages for an
+	# M x N image, as the filter image returned by filter_image_freq
+	def transfer(self, img_shape, k=0):
+		groups = [group for group in self.groups if isinstance(group, list)]
+		H, _ = _chain_for_image(img_shape, groups[k], self.mode, self.padding, self.support)
+		return np.abs(H)
+
+	# Settings of the forward transform of the input image, if the chain
+	# starts with frequency domain stages
+	def _transform_key(self):
+		if self.groups and isinstance(self.groups[0], list):
+			return self.mode, self.padding, self.support
+		return None
+
+# Filter Chains
+###############################################################################
+# INPUT
+# img:			Input image
+# chains:		List of filter chains. Chains that start with frequency
+#				domain stages and use the same transform settings share one
+#				forward transform of the image.
+# spectrum:		Whether to compute the power spectrum of the image, with the
+#				transform settings of the first chain
+###############################################################################
+# OUTPUT
+# G:		   List of output images, one for each chain
+# P:		   Power spectrum of input image, or None if spectrum is False
+###############################################################################
+def filter_chains(img, chains, spectrum=False):
+	img = np.asarray(img)
+
+	# Number of chains using each shared transform, so that the last one can
+	# form its product in place
+	users = {}
+	for chain in chains:
+		key = chain._transform_key()
+		if key is not None:
+			users[key] = users.get(key, 0) + 1
+
+	shared = {}
+	pow_spec = None
+	G = []
+
+	for chain in chains:
+		g = img
+		for k, group in enumerate(chain.groups):
+			if callable(group):
+				# Spatial stages work on the output of the previous stage
+				# directly
+				g = group(g)
+				continue
+
+			H, shape = _chain_for_image(g.shape, group, chain.mode, chain.padding, chain.support)
+
+			if k == 0:
+				# Transform the input image once for all chains that share it
+				key = chain._transform_key()
+				if key not in shared:
+					shared[key] = _forward(g, shape, chain.mode)
+					if spectrum and pow_spec is None and chain is chains[0]:
+						pow_spec = _log_power(shared[key])
+				users[key] -= 1
+				F = shared[key]
+				if users[key] == 0:
+					F = shared.pop(key)
+					F *= H
+				else:
+					# Same precision as the product in place
+					F = np.multiply(F, H, out=np.empty_like(F))
+			else:
+				F = _forward(g, shape, chain.mode)
+				F *= H
+
+			g = _inverse(F, g.shape, shape, chain.mode)
+		G.append(g)
+
+	if spectrum and pow_spec is None and chains:
+		chain = chains[0]
+		pow_spec = power_spectrum(img, chain.mode, chain.padding, chain.support)
+
+	return G, pow_spec
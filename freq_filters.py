@@ -1,5 +1,32 @@
+import itertools
+import threading
+from collections import OrderedDict
+
 import numpy as np
 
+from instrumentation import instrumented
+from spatial_filters import mean_filter, max_filter
+
+# Default memory budget of the transfer function cache in bytes
+CACHE_SIZE = 256 * 2**20
+
+# Default memory budget for the transforms of one chunk of filter_stack_freq
+BATCH_SIZE = 512 * 2**20
+
+# Filter parameters and their defaults, as for transfer_function
+FILTER_DEFAULTS = {'fclass': 'lowpass', 'ftype': 'butterworth', 'd0': 160, 'w': 20, 'n': 2, 'u_k': 0, 'v_k': 0, 'notches': None}
+
+# Smallest power of the spectrum searched by find_noise_peaks, relative to its
+# largest power. This is about the precision of float32 image values (1e-6 in
+# amplitude), below which the zero padding leaves deep wells in the spectrum
+# that shift the background of the peaks next to them.
+PEAK_POWER_FLOOR = 1e-12
+
+# Transfer functions built so far, least recently used first
+_cache = OrderedDict()
+_cache_stats = {'hits': 0, 'misses': 0, 'bytes': 0, 'max_bytes': CACHE_SIZE}
+_cache_lock = threading.Lock()
+
 # Lowpass Filter
 ###############################################################################
 # INPUT
@@ -9,37 +36,86 @@ import numpy as np
 # n:			Order of filter (only applies for butterworth filters)
 # u_k:			u position of notch pair (only applies for notch filters)
 # v_k:			v position of notch pair (only applies for notch filters)
+# dtype:		Data type of filter (np.float64 or np.float32)
+# layout:		Frequency layout ('centered', 'unshifted' or 'half')
+# spacing:		Frequency sample spacing along u and v, relative to the grid
+#				that d0, u_k and v_k are given for
+# method:		Filter method ('vectorized' or 'loop')
 ###############################################################################
 # OUTPUT
 # H:		   A lowpass filter with input parameters
 ###############################################################################
-def lowpass_filter(shape, d0=160, ftype='butterworth', n=2, u_k=0, v_k=0):
+@instrumented()
+def lowpass_filter(shape, d0=160, ftype='butterworth', n=2, u_k=0, v_k=0, dtype=np.float64, layout='centered', spacing=(1, 1), method='vectorized'):
+	if method == 'loop':
+		if spacing != (1, 1):
+			raise ValueError("Loop method only supports unit spacing")
+		return _to_layout(_lowpass_filter_loop(shape, d0, ftype, n, u_k, v_k), layout).astype(dtype)
+	elif method != 'vectorized':
+		raise ValueError("Unknown filter method '%s'" % method)
 
-	P, Q = shape
-	# Initialize filter with zeros
-	H = np.zeros((P, Q))
+	# Get euclidean distance from every point D(u,v) to the center
+	D_uv = distance_grid(shape, u_k, v_k, dtype, layout, spacing)
 
-	# Traverse through filter
-	for u in range(0, P):
-		for v in range(0, Q):
-			# Get euclidean distance from point D(u,v) to the center
-			D_uv = np.sqrt((u - P/2 + u_k)**2 + (v - Q/2 + v_k)**2)
+	return _lowpass_response(D_uv, d0, ftype, n)
 
-			# Define lowpass transfer funtion according to filter type
-			if ftype == 'ideal':
+# Lowpass transfer function for distances D_uv from the center
+def _lowpass_response(D_uv, d0, ftype, n):
+	# Define lowpass transfer funtion according to filter type
+	if ftype == 'ideal':
+		H = (D_uv <= d0).astype(D_uv.dtype)
 
-				if D_uv <= d0:
-					H[u, v] = 1.0
+	elif ftype == 'butterworth':
+		H = 1/(1 + (D_uv/d0)**(2*n))
 
-			elif ftype == 'butterworth':
+	elif ftype == 'gaussian':
+		H = np.exp(-D_uv**2 / (2*d0)**2)
 
-				H[u, v] = 1/(1 + (D_uv/d0)**(2*n))
+	else:
+		raise ValueError("Unknown filter type '%s'" % ftype)
 
-			elif ftype == 'gaussian':
+	return H
 
-				H[u, v] = np.exp(-D_uv**2 / (2*d0)**2)
+# Distance grid
+###############################################################################
+# INPUT
+# shape:		P x Q shape of grid
+# u_k:			u offset of the center
+# v_k:			v offset of the center
+# dtype:		Data type of grid
+# layout:		Frequency layout ('centered', 'unshifted' or 'half')
+# spacing:		Frequency sample spacing along u and v, relative to the grid
+#				that d0, u_k and v_k are given for
+###############################################################################
+# OUTPUT
+# D_uv:		   Euclidean distance from every point (u, v) to the center
+###############################################################################
+def distance_grid(shape, u_k=0, v_k=0, dtype=np.float64, layout='centered', spacing=(1, 1)):
+	u, v = _grid_positions(shape, layout, spacing)
 
-	return H
+	# Distances along each axis, broadcast against each other
+	du = (u + u_k).astype(dtype)
+	dv = (v + v_k).astype(dtype)
+
+	return np.sqrt(du[:, np.newaxis]**2 + dv[np.newaxis, :]**2)
+
+# Frequency of every row and column of a grid in the given layout, relative to
+# the center
+def _grid_positions(shape, layout, spacing):
+	P, Q = shape
+
+	# Position of every row and column in the centered layout
+	u = np.arange(P)
+	v = np.arange(Q)
+	if layout in ('unshifted', 'half'):
+		u = np.fft.ifftshift(u)
+		v = np.fft.ifftshift(v)
+		if layout == 'half':
+			v = v[:Q//2 + 1]
+	elif layout != 'centered':
+		raise ValueError("Unknown frequency layout '%s'" % layout)
+
+	return (u - P//2) * spacing[0], (v - Q//2) * spacing[1]
 
 # Highpass Filter
 ###############################################################################
@@ -50,13 +126,18 @@ def lowpass_filter(shape, d0=160, ftype='butterworth', n=2, u_k=0, v_k=0):
 # n:			Order of filter (only applies for butterworth filters)
 # u_k:			u position of notch pair (only applies for notch filters)
 # v_k:			v position of notch pair (only applies for notch filters)
+# dtype:		Data type of filter (np.float64 or np.float32)
+# layout:		Frequency layout ('centered', 'unshifted' or 'half')
+# spacing:		Frequency sample spacing along u and v, relative to the grid
+#				that d0, u_k and v_k are given for
 ###############################################################################
 # OUTPUT
 # H:		   A highpass filter with input parameters
 ###############################################################################
-def highpass_filter(shape, d0=160, ftype='butterworth', n=2, u_k=0, v_k=0):
+@instrumented()
+def highpass_filter(shape, d0=160, ftype='butterworth', n=2, u_k=0, v_k=0, dtype=np.float64, layout='centered', spacing=(1, 1)):
 	# Inverse of lowpass
-	H = 1.0 - lowpass_filter(shape, d0, ftype, n, u_k, v_k)
+	H = 1.0 - lowpass_filter(shape, d0, ftype, n, u_k, v_k, dtype, layout, spacing)
 	return H
 
 # Bandreject Filter
@@ -67,11 +148,394 @@ def highpass_filter(shape, d0=160, ftype='butterworth', n=2, u_k=0, v_k=0):
 # w:			Width of the band
 # ftype:		Filter type ('ideal', 'butterworth' or 'gaussian')
 # n:			Order of filter (only applies for butterworth filters)
+# dtype:		Data type of filter (np.float64 or np.float32)
+# layout:		Frequency layout ('centered', 'unshifted' or 'half')
+# spacing:		Frequency sample spacing along u and v, relative to the grid
+#				that d0, u_k and v_k are given for
+# method:		Filter method ('vectorized' or 'loop')
 ###############################################################################
 # OUTPUT
 # H:		   A bandreject filter with input parameters
 ###############################################################################
-def bandreject_filter(shape, d0=160, w=20, ftype='butterworth', n=2):
+@instrumented()
+def bandreject_filter(shape, d0=160, w=20, ftype='butterworth', n=2, dtype=np.float64, layout='centered', spacing=(1, 1), method='vectorized'):
+	if method == 'loop':
+		if spacing != (1, 1):
+			raise ValueError("Loop method only supports unit spacing")
+		return _to_layout(_bandreject_filter_loop(shape, d0, w, ftype, n), layout).astype(dtype)
+	elif method != 'vectorized':
+		raise ValueError("Unknown filter method '%s'" % method)
+
+	# Get euclidean distance from every point D(u,v) to the center
+	D_uv = distance_grid(shape, dtype=dtype, layout=layout, spacing=spacing)
+
+	# Define bandreject transfer funtion for each filter type
+	with np.errstate(divide='ignore', invalid='ignore'):
+		if ftype == 'ideal':
+			H = np.ones(D_uv.shape, dtype=dtype)
+			H[((d0 - (w/2)) <= D_uv) & (D_uv <= (d0 + (w/2)))] = 0.0
+
+		elif ftype == 'butterworth':
+			H = 1/(1 + ((D_uv*w)/(D_uv**2 - d0**2))**(2*n))
+			H[D_uv == d0] = 0 # To avoid dividing by zero
+
+		elif ftype == 'gaussian':
+			H = 1.0 - np.exp(-((D_uv**2 - d0**2) / (D_uv * w))**2)
+			H[D_uv == 0] = 1 # To avoid dividing by zero
+
+		else:
+			raise ValueError("Unknown filter type '%s'" % ftype)
+
+	return H
+
+# Bandpass Filter
+###############################################################################
+# INPUT
+# shape:		P x Q shape of filter
+# d0:		  	Cutoff frequency
+# w:			Width of the band
+# ftype:		Filter type ('ideal', 'butterworth' or 'gaussian')
+# n:			Order of filter (only applies for butterworth filters)
+# dtype:		Data type of filter (np.float64 or np.float32)
+# layout:		Frequency layout ('centered', 'unshifted' or 'half')
+# spacing:		Frequency sample spacing along u and v, relative to the grid
+#				that d0, u_k and v_k are given for
+###############################################################################
+# OUTPUT
+# H:		   A bandpass filter with input parameters
+###############################################################################
+@instrumented()
+def bandpass_filter(shape, d0=160, w=20, ftype='butterworth', n=2, dtype=np.float64, layout='centered', spacing=(1, 1)):
+	# Inverse of bandreject
+	H = 1.0 - bandreject_filter(shape, d0, w, ftype, n, dtype, layout, spacing)
+	return H
+
+# Notch Reject Filter (see multi_notch_reject_filter for several notch pairs)
+###############################################################################
+# INPUT
+# shape:		P x Q shape of filter
+# d0:		  	Cutoff frequency
+# ftype:		Filter type ('ideal', 'butterworth' or 'gaussian')
+# n:			Order of filter (only applies for butterworth filters)
+# u_k:			u position of notch pair
+# v_k:			v position of notch pair
+# dtype:		Data type of filter (np.float64 or np.float32)
+# layout:		Frequency layout ('centered', 'unshifted' or 'half')
+# spacing:		Frequency sample spacing along u and v, relative to the grid
+#				that d0, u_k and v_k are given for
+###############################################################################
+# OUTPUT
+# H:		   A notch reject filter with input parameters
+###############################################################################
+@instrumented()
+def notch_reject_filter(shape, d0=160, ftype='butterworth', n=2, u_k=0, v_k=0, dtype=np.float64, layout='centered', spacing=(1, 1)):
+	# Form product of highpass filters at position (-u_k, -v_k) and (u_k, v_k)
+	H = highpass_filter(shape, d0, ftype, n, -u_k, -v_k, dtype, layout, spacing) * highpass_filter(shape, d0, ftype, n, u_k, v_k, dtype, layout, spacing)
+	return H
+
+# Notch Pass Filter (see multi_notch_pass_filter for several notch pairs)
+###############################################################################
+# INPUT
+# shape:		P x Q shape of filter
+# d0:		  	Cutoff frequency
+# ftype:		Filter type ('ideal', 'butterworth' or 'gaussian')
+# n:			Order of filter (only applies for butterworth filters)
+# u_k:			u position of notch pair
+# v_k:			v position of notch pair
+# dtype:		Data type of filter (np.float64 or np.float32)
+# layout:		Frequency layout ('centered', 'unshifted' or 'half')
+# spacing:		Frequency sample spacing along u and v, relative to the grid
+#				that d0, u_k and v_k are given for
+###############################################################################
+# OUTPUT
+# H:		   A notch pass filter with input parameters
+###############################################################################
+@instrumented()
+def notch_pass_filter(shape, d0=160, ftype='butterworth', n=2, u_k=0, v_k=0, dtype=np.float64, layout='centered', spacing=(1, 1)):
+	# Inverse of notch reject
+	H = 1.0 - notch_reject_filter(shape, d0, ftype, n, u_k, v_k, dtype, layout, spacing)
+	return H
+
+
+
+# Multi Notch Reject Filter
+###############################################################################
+# INPUT
+# shape:		P x Q shape of filter
+# notches:		List of (u_k, v_k, d0) for each notch pair
+# ftype:		Filter type ('ideal', 'butterworth' or 'gaussian')
+# n:			Order of filter (only applies for butterworth filters)
+# dtype:		Data type of filter (np.float64 or np.float32)
+# layout:		Frequency layout ('centered', 'unshifted' or 'half')
+# spacing:		Frequency sample spacing along u and v, relative to the grid
+#				that d0, u_k and v_k are given for
+# tol:			Each notch is only evaluated where it differs from 1 by more
+#				than tol
+###############################################################################
+# OUTPUT
+# H:		   A notch reject filter with all notch pairs
+###############################################################################
+@instrumented()
+def multi_notch_reject_filter(shape, notches, ftype='butterworth', n=2, dtype=np.float64, layout='centered', spacing=(1, 1), tol=1e-6):
+	u, v = _grid_positions(shape, layout, spacing)
+
+	# Initialize filter with ones
+	H = np.ones((len(u), len(v)), dtype=dtype)
+
+	for u_k, v_k, d0 in notches:
+		radius = _notch_radius(d0, ftype, n, tol)
+
+		# Form product of highpass filters at position (-u_k, -v_k) and (u_k, v_k)
+		for du, dv in ((u - u_k, v - v_k), (u + u_k, v + v_k)):
+			# Only rows and columns within reach of the notch
+			rows = np.nonzero(np.abs(du) <= radius)[0]
+			cols = np.nonzero(np.abs(dv) <= radius)[0]
+			if len(rows) == 0 or len(cols) == 0:
+				continue
+
+			D_uv = np.sqrt(du[rows].astype(dtype)[:, np.newaxis]**2 + dv[cols].astype(dtype)[np.newaxis, :]**2)
+			H[np.ix_(rows, cols)] *= 1.0 - _lowpass_response(D_uv, d0, ftype, n)
+
+	return H
+
+# Multi Notch Pass Filter
+###############################################################################
+# INPUT
+# shape:		P x Q shape of filter
+# notches:		List of (u_k, v_k, d0) for each notch pair
+# ftype:		Filter type ('ideal', 'butterworth' or 'gaussian')
+# n:			Order of filter (only applies for butterworth filters)
+# dtype:		Data type of filter (np.float64 or np.float32)
+# layout:		Frequency layout ('centered', 'unshifted' or 'half')
+# spacing:		Frequency sample spacing along u and v, relative to the grid
+#				that d0, u_k and v_k are given for
+# tol:			Each notch is only evaluated where it differs from 1 by more
+#				than tol
+###############################################################################
+# OUTPUT
+# H:		   A notch pass filter with all notch pairs
+###############################################################################
+@instrumented()
+def multi_notch_pass_filter(shape, notches, ftype='butterworth', n=2, dtype=np.float64, layout='centered', spacing=(1, 1), tol=1e-6):
+	# Inverse of notch reject
+	H = 1.0 - multi_notch_reject_filter(shape, notches, ftype, n, dtype, layout, spacing, tol)
+	return H
+
+# Distance from a notch beyond which its highpass response is within tol of 1
+def _notch_radius(d0, ftype, n, tol):
+	if tol <= 0:
+		return np.inf
+
+	if ftype == 'ideal':
+		return d0
+	elif ftype == 'butterworth':
+		# 1/(1 + (D/d0)**(2n)) < tol
+		return d0 * (1.0/tol - 1)**(1.0/(2*n))
+	elif ftype == 'gaussian':
+		# exp(-D**2 / (2*d0)**2) < tol
+		return 2*d0 * np.sqrt(np.log(1.0/tol))
+	else:
+		raise ValueError("Unknown filter type '%s'" % ftype)
+
+# Transfer Function
+###############################################################################
+# INPUT
+# shape:		P x Q shape of filter
+# fclass:		Filter class ('lowpass', 'highpass', 'bandreject', 'bandpass',
+#				'notchreject' or 'notchpass')
+# ftype:		Filter type ('ideal', 'butterworth' or 'gaussian')
+# d0:			Cutoff frequency
+# w:			Width of the band (only applies for bandpass/bandreject filters)
+# n:			Order of filter (only applies for butterworth filters)
+# u_k:			u position of notch pair (only applies for notch filters)
+# v_k:			v position of notch pair (only applies for notch filters)
+# dtype:		Data type of filter (np.float64 or np.float32)
+# layout:		Frequency layout ('centered', 'unshifted' or 'half')
+# spacing:		Frequency sample spacing along u and v, relative to the grid
+#				that d0, u_k and v_k are given for
+# notches:		List of (u_k, v_k, d0) for each notch pair, used instead of
+#				d0, u_k and v_k (only applies for notch filters)
+###############################################################################
+# OUTPUT
+# H:		   A read-only filter with input parameters, shared between callers
+###############################################################################
+@instrumented()
+def transfer_function(shape, fclass='lowpass', ftype='butterworth', d0=160, w=20, n=2, u_k=0, v_k=0, dtype=np.float64, layout='centered', spacing=(1, 1), notches=None):
+	key = _transfer_key(shape, fclass, ftype, d0, w, n, u_k, v_k, dtype, layout, spacing, notches)
+	H = _cache_get(key)
+	if H is not None:
+		return H
+
+	# Create a filter with input parameters
+	if fclass == 'lowpass':
+		H = lowpass_filter(shape, d0, ftype, n, dtype=dtype, layout=layout, spacing=spacing)
+	elif fclass == 'highpass':
+		H = highpass_filter(shape, d0, ftype, n, dtype=dtype, layout=layout, spacing=spacing)
+	elif fclass == 'bandreject':
+		H = bandreject_filter(shape, d0, w, ftype, n, dtype, layout, spacing)
+	elif fclass == 'bandpass':
+		H = bandpass_filter(shape, d0, w, ftype, n, dtype, layout, spacing)
+	elif fclass == 'notchreject' and notches is not None:
+		H = multi_notch_reject_filter(shape, notches, ftype, n, dtype, layout, spacing)
+	elif fclass == 'notchpass' and notches is not None:
+		H = multi_notch_pass_filter(shape, notches, ftype, n, dtype, layout, spacing)
+	elif fclass == 'notchreject':
+		H = notch_reject_filter(shape, d0, ftype, n, u_k, v_k, dtype, layout, spacing)
+	elif fclass == 'notchpass':
+		H = notch_pass_filter(shape, d0, ftype, n, u_k, v_k, dtype, layout, spacing)
+	else:
+		raise ValueError("Unknown filter class '%s'" % fclass)
+
+	return _cache_put(key, H)
+
+# Combined Transfer Function
+###############################################################################
+# INPUT
+# shape:		P x Q shape of filter
+# stages:		List of filters, each a dict with any of the parameters
+#				'fclass', 'ftype', 'd0', 'w', 'n', 'u_k', 'v_k' and 'notches'
+#				of transfer_function
+# dtype:		Data type of filter (np.float64 or np.float32)
+# layout:		Frequency layout ('centered', 'unshifted' or 'half')
+# spacing:		Frequency sample spacing along u and v, relative to the grid
+#				that d0, u_k and v_k are given for
+###############################################################################
+# OUTPUT
+# H:		   A read-only product of the filters, shared between callers
+###############################################################################
+@instrumented()
+def combined_transfer_function(shape, stages, dtype=np.float64, layout='centered', spacing=(1, 1)):
+	stages = [filter_params(stage) for stage in stages]
+	if len(stages) == 1:
+		return transfer_function(shape, dtype=dtype, layout=layout, spacing=spacing, **stages[0])
+
+	key = ('combined',) + tuple(_transfer_key(shape, dtype=dtype, layout=layout, spacing=spacing, **stage) for stage in stages)
+	H = _cache_get(key)
+	if H is not None:
+		return H
+
+	# Multiply the filters, each of them cached by itself
+	H = np.array(transfer_function(shape, dtype=dtype, layout=layout, spacing=spacing, **stages[0]))
+	for stage in stages[1:]:
+		H *= transfer_function(shape, dtype=dtype, layout=layout, spacing=spacing, **stage)
+
+	return _cache_put(key, H)
+
+# Get all parameters of a filter from a dict of some of them, with defaults
+def filter_params(stage):
+	unknown = set(stage) - set(FILTER_DEFAULTS)
+	if unknown:
+		raise ValueError("Unknown filter parameters %s" % ', '.join(sorted(unknown)))
+	return dict(FILTER_DEFAULTS, **stage)
+
+# Cache key of a filter. Parameters that do not apply to the filter are left
+# out of the key.
+def _transfer_key(shape, fclass, ftype, d0, w, n, u_k, v_k, dtype, layout, spacing, notches):
+	return (tuple(shape), fclass, ftype, d0,
+		w if fclass in ('bandreject', 'bandpass') else None,
+		n if ftype == 'butterworth' else None,
+		(u_k, v_k) if fclass in ('notchreject', 'notchpass') else None,
+		tuple(map(tuple, notches)) if notches is not None else None,
+		np.dtype(dtype).str, layout, tuple(spacing))
+
+# Get a cached filter and mark it as most recently used, or None
+def _cache_get(key):
+	with _cache_lock:
+		H = _cache.get(key)
+		if H is not None:
+			_cache[key] = _cache.pop(key)
+			_cache_stats['hits'] += 1
+			return H
+		_cache_stats['misses'] += 1
+	return None
+
+# Add a filter to the cache, if it fits the budget
+def _cache_put(key, H):
+	# Prevent callers from changing the cached filter
+	H.flags.writeable = False
+
+	with _cache_lock:
+		if H.nbytes <= _cache_stats['max_bytes'] and key not in _cache:
+			_cache[key] = H
+			_cache_stats['bytes'] += H.nbytes
+			_evict(_cache_stats['max_bytes'])
+
+	return H
+
+# Set the memory budget of the transfer function cache in bytes
+def set_cache_size(max_bytes):
+	with _cache_lock:
+		_cache_stats['max_bytes'] = max_bytes
+		_evict(max_bytes)
+
+# Remove all transfer functions from the cache and reset the counters
+def clear_cache():
+	with _cache_lock:
+		_cache.clear()
+		_cache_stats['hits'] = 0
+		_cache_stats['misses'] = 0
+		_cache_stats['bytes'] = 0
+
+# Get hits, misses, number of entries, bytes used and memory budget of the cache
+def cache_info():
+	with _cache_lock:
+		info = dict(_cache_stats)
+		info['entries'] = len(_cache)
+	return info
+
+# Remove least recently used transfer functions until the cache fits the budget
+def _evict(max_bytes):
+	while _cache_stats['bytes'] > max_bytes:
+		_, H = _cache.popitem(last=False)
+		_cache_stats['bytes'] -= H.nbytes
+
+# Rearrange a filter from the centered layout. The unshifted layout has the
+# zero frequency in the first row and column, as returned by np.fft.fft2, and
+# the half layout only keeps the first Q//2 + 1 columns of it, as returned by
+# np.fft.rfft2.
+def _to_layout(H, layout):
+	if layout == 'centered':
+		return H
+	elif layout not in ('unshifted', 'half'):
+		raise ValueError("Unknown frequency layout '%s'" % layout)
+
+	H = np.fft.ifftshift(H)
+	if layout == 'half':
+		H = H[:, :H.shape[1]//2 + 1]
+
+	return H
+
+# Lowpass filter with a loop over every point
+def _lowpass_filter_loop(shape, d0, ftype, n, u_k, v_k):
+
+	P, Q = shape
+	# Initialize filter with zeros
+	H = np.zeros((P, Q))
+
+	# Traverse through filter
+	for u in range(0, P):
+		for v in range(0, Q):
+			# Get euclidean distance from point D(u,v) to the center
+			D_uv = np.sqrt((u - P//2 + u_k)**2 + (v - Q//2 + v_k)**2)
+
+			# Define lowpass transfer funtion according to filter type
+			if ftype == 'ideal':
+
+				if D_uv <= d0:
+					H[u, v] = 1.0
+
+			elif ftype == 'butterworth':
+
+				H[u, v] = 1/(1 + (D_uv/d0)**(2*n))
+
+			elif ftype == 'gaussian':
+
+				H[u, v] = np.exp(-D_uv**2 / (2*d0)**2)
+
+	return H
+
+# Bandreject filter with a loop over every point
+def _bandreject_filter_loop(shape, d0, w, ftype, n):
 
 	P, Q = shape
 	# Initialize filter with ones
@@ -81,7 +545,7 @@ def bandreject_filter(shape, d0=160, w=20, ftype='butterworth', n=2):
 	for u in range(0, P):
 		for v in range(0, Q):
 			# Get euclidean distance from point D(u,v) to the center
-			D_uv = np.sqrt((u - (P/2))**2 + (v - (Q/2))**2)
+			D_uv = np.sqrt((u - (P//2))**2 + (v - (Q//2))**2)
 
 			# Define bandreject transfer funtion for each filter type
 			if ftype == 'ideal':
@@ -105,120 +569,421 @@ def bandreject_filter(shape, d0=160, w=20, ftype='butterworth', n=2):
 
 	return H
 
-# Bandpass Filter
+# Padded Shape
 ###############################################################################
 # INPUT
-# shape:		P x Q shape of filter
-# d0:		  	Cutoff frequency
-# w:			Width of the band
-# ftype:		Filter type ('ideal', 'butterworth' or 'gaussian')
-# n:			Order of filter (only applies for butterworth filters)
+# shape:		M x N shape of image
+# padding:		Padding of the transform ('double', 'fast' or 'minimal')
+#				  double:  2M x 2N
+#				  fast:    smallest 5-smooth sizes of at least 2M-1 x 2N-1,
+#				           the size of a full linear convolution
+#				  minimal: smallest 5-smooth sizes that keep a filter with
+#				           compact spatial support from wrapping around
+# support:		Width of the spatial filter kernel in pixels, as a number or
+#				a pair (only applies for minimal padding)
 ###############################################################################
 # OUTPUT
-# H:		   A bandpass filter with input parameters
+# P, Q:		   Shape of the padded transform
 ###############################################################################
-def bandpass_filter(shape, d0=160, w=20, ftype='butterworth', n=2):
-	# Inverse of bandreject
-	H = 1.0 - bandreject_filter(shape, d0, w, ftype, n)
-	return H
-
-# Notch Reject Filter (several notch pairs not implemented)
+def padded_shape(shape, padding='double', support=None):
+	M, N = shape
+
+	if padding == 'double':
+		return 2*M, 2*N
+	elif padding == 'fast':
+		return next_fast_len(2*M - 1), next_fast_len(2*N - 1)
+	elif padding == 'minimal':
+		if support is None:
+			raise ValueError("Minimal padding needs the support of the filter")
+		a, b = np.broadcast_to(support, (2,))
+		# A kernel centered on the origin reaches support//2 pixels to each
+		# side, which must land in the zero padding when it wraps around
+		return next_fast_len(M + int(a)//2), next_fast_len(N + int(b)//2)
+	else:
+		raise ValueError("Unknown padding '%s'" % padding)
+
+# Smallest 5-smooth number (only prime factors 2, 3 and 5) of at least n,
+# for which FFTs are fast
+def next_fast_len(n):
+	n = max(int(n), 1)
+	while True:
+		m = n
+		for p in (2, 3, 5):
+			while m % p == 0:
+				m //= p
+		if m == 1:
+			return n
+		n += 1
+
+# Spatial Kernel
 ###############################################################################
 # INPUT
-# shape:		P x Q shape of filter
-# d0:		  	Cutoff frequency
+# img_shape:	M x N shape of the image the filter is applied to
+# fclass:		Filter class ('lowpass', 'highpass', 'bandreject', 'bandpass',
+#				'notchreject' or 'notchpass')
 # ftype:		Filter type ('ideal', 'butterworth' or 'gaussian')
+# d0:			Cutoff frequency
+# w:			Width of the band (only applies for bandpass/bandreject filters)
 # n:			Order of filter (only applies for butterworth filters)
-# u_k:			u position of notch pair
-# v_k:			v position of notch pair
+# u_k:			u position of notch pair (only applies for notch filters)
+# v_k:			v position of notch pair (only applies for notch filters)
+# notches:		List of (u_k, v_k, d0) for each notch pair, used instead of
+#				d0, u_k and v_k (only applies for notch filters)
+# tol:			Largest part of the absolute kernel sum that is cropped away,
+#				which bounds the error of filtering with the cropped kernel
+# max_radius:	Largest radius of the kernel, which crops it further
 ###############################################################################
 # OUTPUT
-# H:		   A notch reject filter with input parameters
+# h:		   Spatial convolution kernel of the filter, with odd shape and
+#			   the origin in the center
 ###############################################################################
-def notch_reject_filter(shape, d0=160, ftype='butterworth', n=2, u_k=0, v_k=0):
-	# Form product of highpass filters at position (-u_k, -v_k) and (u_k, v_k)
-	H = highpass_filter(shape, d0, ftype, n, -u_k, -v_k) * highpass_filter(shape, d0, ftype, n, u_k, v_k)
-	return H
+@instrumented()
+def spatial_kernel(img_shape, fclass='lowpass', ftype='butterworth', d0=160, w=20, n=2, u_k=0, v_k=0, notches=None, tol=1e-6, max_radius=None):
+	M, N = img_shape
+	P, Q = padded_shape(img_shape)
+
+	# Sample the filter on a small grid first. The kernel is the inverse
+	# transform of the filter, wrapped around with the period of the grid,
+	# so the grid is doubled until the kernel has decayed well inside it.
+	p, q = min(P, 256), min(Q, 256)
+	while True:
+		H = transfer_function((p, q), fclass, ftype, d0, w, n, u_k, v_k, layout='half', spacing=(2.0*M/p, 2.0*N/q), notches=notches)
+		h = np.fft.fftshift(np.fft.irfft2(H, s=(p, q)))
+
+		# Radius that keeps all but tol of the absolute kernel sum
+		a = np.abs(h)
+		r_u = _kernel_radius(a.sum(axis=1), tol / 2)
+		r_v = _kernel_radius(a.sum(axis=0), tol / 2)
+
+		# Grid sizes beyond the largest radius are not needed
+		if max_radius is not None:
+			P, Q = min(P, max(p, 4*max_radius)), min(Q, max(q, 4*max_radius))
+
+		if (r_u < p//4 or p >= P) and (r_v < q//4 or q >= Q):
+			break
+		p, q = min(2*p, P), min(2*q, Q)
+
+	# An M x N image only reaches offsets up to M-1 x N-1
+	r_u = min(r_u, M - 1, p//2 - 1)
+	r_v = min(r_v, N - 1, q//2 - 1)
+	if max_radius is not None:
+		r_u = min(r_u, max_radius)
+		r_v = min(r_v, max_radius)
+
+	return h[p//2 - r_u:p//2 + r_u + 1, q//2 - r_v:q//2 + r_v + 1]
+
+# Smallest radius around the center of a profile that leaves out at most tol
+# of its sum
+def _kernel_radius(a, tol):
+	c = len(a)//2
+
+	# Sum of the values at each distance from the center
+	dist = np.abs(np.arange(len(a)) - c)
+	mass = np.bincount(dist, weights=a)
+
+	# Sum of the values beyond each radius
+	tail = np.cumsum(mass[::-1])[::-1] - mass
+	return int(np.argmax(tail <= tol * a.sum()))
+
+# Find Noise Peaks
+###############################################################################
+# INPUT
+# img:			Input image
+# d0:			Cutoff frequency of the notches returned for each peak
+# threshold:	Minimum height of a peak above the background, in robust
+#				standard deviations of the log power spectrum
+# exclude:		Radius around the zero frequency where peaks are ignored
+# size:			Shape of the neighbourhood a peak must be the maximum of
+# background:	Shape of the window the background is averaged over
+# max_peaks:	Maximum number of peaks to return, strongest first
+# padding:		Padding of the transform ('double', 'fast' or 'minimal')
+# support:		Width of the spatial filter kernel in pixels (only applies
+#				for minimal padding)
+###############################################################################
+# OUTPUT
+# notches:	   List of (u_k, v_k, d0) for each notch pair, strongest first,
+#			   for multi_notch_reject_filter or the notches argument of
+#			   filter_image_freq
+###############################################################################
+@instrumented()
+def find_noise_peaks(img, d0=15, threshold=5, exclude=30, size=5, background=15, max_peaks=None, padding='double', support=None):
+	M, N = img.shape
+	P, Q = padded_shape(img.shape, padding, support)
+
+	# Peak positions are given for a 2M x 2N transform
+	spacing = (2.0*M/P, 2.0*N/Q)
+
+	# Log power spectrum of the half plane of non-negative v, with the low
+	# frequencies shifted to the center row. The power is floored relative to
+	# its largest value, since exact zeros (e.g. of patterns that are
+	# constant along one axis) would give -inf, which the background filter
+	# turns into NaN.
+	pow_spec = np.abs(np.fft.rfft2(img, s=(P, Q)))**2
+	floor = max(np.amax(pow_spec) * PEAK_POWER_FLOOR, np.finfo(np.float64).tiny)
+	L = np.fft.fftshift(np.log(np.maximum(pow_spec, floor)), axes=0)
+	c = P//2
+
+	# Add the columns for negative v, which mirror the half plane through the
+	# center, so that windows at v = 0 see both sides
+	r = max(size, background)//2
+	mirror = L[(2*c - np.arange(P)) % P, r:0:-1]
+	L = np.hstack((mirror, L))
+
+	# Subtract the local background so that only narrow spikes remain
+	R = L - mean_filter(L, background, 'arithmetic')
+
+	# Peaks are local maxima that stand out from the spread of the spectrum
+	med = np.median(R)
+	sigma = 1.4826 * np.median(np.abs(R - med))
+	peaks = (R >= max_filter(R, size)) & (R - med > threshold * sigma)
+
+	# Drop the mirrored columns
+	peaks = peaks[:, r:]
+	R = R[:, r:]
+
+	# Positions relative to the zero frequency, outside the excluded region
+	rows, cols = np.nonzero(peaks)
+	u = (rows - c) * spacing[0]
+	v = cols * spacing[1]
+	keep = np.hypot(u, v) > exclude
+
+	# Points at v = 0 appear twice, as (u, 0) and (-u, 0)
+	keep &= (v > 0) | (u > 0)
+
+	u = u[keep]
+	v = v[keep]
+	strength = R[rows[keep], cols[keep]]
+
+	# Strongest peaks first. Weaker peaks that a notch around a stronger peak
+	# (or its conjugate) already covers are side lobes of the same spike.
+	notches = []
+	for k in np.argsort(-strength, kind='mergesort'):
+		if max_peaks is not None and len(notches) == max_peaks:
+			break
+		if any(min(np.hypot(u[k] - a, v[k] - b), np.hypot(u[k] + a, v[k] + b)) <= d0 for a, b, _ in notches):
+			continue
+		notches.append((float(u[k]), float(v[k]), d0))
+
+	return notches
 
-# Notch Pass Filter (several notch pairs not implemented)
+# Filter image in frequency domain
 ###############################################################################
 # INPUT
-# shape:		P x Q shape of filter
-# d0:		  	Cutoff frequency
+# img:			Input image
+# fclass:		Filter class ('lowpass', 'highpass', 'bandreject', 'bandpass',
+#				'notchreject' or 'notchpass')
 # ftype:		Filter type ('ideal', 'butterworth' or 'gaussian')
+# d0:			Cutoff frequency
+# w:			Width of the band (only applies for bandpass/bandreject filters)
 # n:			Order of filter (only applies for butterworth filters)
-# u_k:			u position of notch pair
-# v_k:			v position of notch pair
+# u_k:			u position of notch pair (only applies for notch filters)
+# v_k:			v position of notch pair (only applies for notch filters)
+# notches:		List of (u_k, v_k, d0) for each notch pair, used instead of
+#				d0, u_k and v_k (only applies for notch filters)
+# mode:			Transform mode ('complex' or 'real'). The real mode uses the
+#				real-valued transform of a real image, returns the real part
+#				of the output instead of its magnitude, and returns H and the
+#				power spectrum in the half layout.
+# padding:		Padding of the transform ('double', 'fast' or 'minimal')
+# support:		Width of the spatial filter kernel in pixels (only applies
+#				for minimal padding)
+# spectrum:		Whether to compute the power spectrum of the image
+# transfer:		Whether to return the filter image
 ###############################################################################
 # OUTPUT
-# H:		   A notch pass filter with input parameters
+# G:		   Output image
+# H:		   Filter image, or None if transfer is False
+# P:		   Power spectrum of input image, or None if spectrum is False
 ###############################################################################
-def notch_pass_filter(shape, d0=160, ftype='butterworth', n=2, u_k=0, v_k=0):
-	# Inverse of notch reject
-	H = 1.0 - notch_reject_filter(shape, d0, ftype, n, u_k, v_k)
-	return H
+@instrumented(('mode', 'padding'))
+def filter_image_freq(img, fclass='lowpass', ftype='butterworth', d0=160, w=20, n=2, u_k=0, v_k=0, mode='complex', padding='double', support=None, spectrum=True, transfer=True, notches=None):
+	# Create a filter with input parameters, or reuse a cached one
+	H, shape = _filter_for_image(img.shape, fclass, ftype, d0, w, n, u_k, v_k, mode, padding, support, notches)
 
+	# Filter image and get power spectrum
+	G, pow_spec = _filter_freq(img, H, shape, mode, spectrum)
 
+	# Return output image, the filter used and the power spectrum of input image
+	return G, np.abs(H) if transfer else None, pow_spec
 
-# Filter image in frequency domain
+# Power spectrum
 ###############################################################################
 # INPUT
 # img:			Input image
-# fclass:		Filter class ('lowpass', 'highpass', 'bandreject' or 'bandpass')
+# mode:			Transform mode ('complex' or 'real')
+# padding:		Padding of the transform ('double', 'fast' or 'minimal')
+# support:		Width of the spatial filter kernel in pixels (only applies
+#				for minimal padding)
+###############################################################################
+# OUTPUT
+# P:		   Logarithm of the power spectrum of the image, as returned by
+#			   filter_image_freq
+###############################################################################
+@instrumented(('mode', 'padding'))
+def power_spectrum(img, mode='complex', padding='double', support=None):
+	shape = padded_shape(img.shape, padding, support)
+
+	# Take the fourier transform of the image, with padding to shape P X Q
+	if mode == 'complex':
+		F = np.fft.fftshift(np.fft.fft2(img, s=shape), axes=(-2, -1))
+	elif mode == 'real':
+		F = np.fft.rfft2(img, s=shape)
+	else:
+		raise ValueError("Unknown transform mode '%s'" % mode)
+
+	return _log_power(F)
+
+# Filter stack of images in frequency domain
+###############################################################################
+# INPUT
+# stack:		K x M x N stack of images, or an iterable of M x N images
+# fclass:		Filter class ('lowpass', 'highpass', 'bandreject', 'bandpass',
+#				'notchreject' or 'notchpass')
 # ftype:		Filter type ('ideal', 'butterworth' or 'gaussian')
 # d0:			Cutoff frequency
 # w:			Width of the band (only applies for bandpass/bandreject filters)
 # n:			Order of filter (only applies for butterworth filters)
+# u_k:			u position of notch pair (only applies for notch filters)
+# v_k:			v position of notch pair (only applies for notch filters)
+# notches:		List of (u_k, v_k, d0) for each notch pair, used instead of
+#				d0, u_k and v_k (only applies for notch filters)
+# mode:			Transform mode ('complex' or 'real')
+# padding:		Padding of the transform ('double', 'fast' or 'minimal')
+# support:		Width of the spatial filter kernel in pixels (only applies
+#				for minimal padding)
+# spectrum:		Whether to compute the power spectrum of the images
+# transfer:		Whether to return the filter image
+# max_bytes:	Memory budget for the transforms of one chunk of images
 ###############################################################################
 # OUTPUT
-# G:		   Output image
-# H:		   Filter image
-# P:		   Power spectrum of input image
+# G:		   K x M x N stack of output images
+# H:		   Filter image, or None if transfer is False
+# P:		   Stack of power spectra of input images, or None if spectrum is False
 ###############################################################################
-def filter_image_freq(img, fclass='lowpass', ftype='butterworth', d0=160, w=20, n=2, u_k=0, v_k=0):
-
+@instrumented(('mode', 'padding'))
+def filter_stack_freq(stack, fclass='lowpass', ftype='butterworth', d0=160, w=20, n=2, u_k=0, v_k=0, mode='complex', padding='double', support=None, spectrum=False, transfer=False, max_bytes=BATCH_SIZE, notches=None):
+	if isinstance(stack, np.ndarray):
+		if stack.ndim != 3 or len(stack) == 0:
+			raise ValueError("Stack must be a non-empty K x M x N array")
+		first = stack[0]
+	else:
+		# Get the first image to find the image shape
+		frames = iter(stack)
+		try:
+			first = np.asarray(next(frames))
+		except StopIteration:
+			raise ValueError("Stack has no images")
+
+	# Create a filter with input parameters once for all images
+	H, shape = _filter_for_image(first.shape, fclass, ftype, d0, w, n, u_k, v_k, mode, padding, support, notches)
+
+	# Number of images whose transforms fit the memory budget, counting the
+	# transform of the image and of the product with the filter
+	chunk = max(1, int(max_bytes // (2 * H.size * np.dtype(np.complex128).itemsize)))
+
+	# Split into chunks of images, without copying arrays
+	if isinstance(stack, np.ndarray):
+		chunks = (stack[k:k + chunk] for k in range(0, len(stack), chunk))
+	else:
+		frames = itertools.chain([first], frames)
+		chunks = iter(lambda: list(itertools.islice(frames, chunk)), [])
+
+	G = []
+	pow_spec = []
+
+	for chunk_frames in chunks:
+		# Filter all images in the chunk along the last two axes
+		G_chunk, P_chunk = _filter_freq(np.asarray(chunk_frames), H, shape, mode, spectrum)
+		G.append(G_chunk)
+		if spectrum:
+			pow_spec.append(P_chunk)
+
+	G = np.concatenate(G)
+	H = np.abs(H) if transfer else None
+	pow_spec = np.concatenate(pow_spec) if spectrum else None
+
+	return G, H, pow_spec
+
+# Create filter for an M x N image, and get the shape of its padded transform
+def _filter_for_image(img_shape, fclass, ftype, d0, w, n, u_k, v_k, mode, padding, support, notches=None):
+	stage = {'fclass': fclass, 'ftype': ftype, 'd0': d0, 'w': w, 'n': n, 'u_k': u_k, 'v_k': v_k, 'notches': notches}
+	return _chain_for_image(img_shape, [stage], mode, padding, support)
+
+# Create the product of a list of filters for an M x N image, and get the
+# shape of its padded transform
+def _chain_for_image(img_shape, stages, mode, padding, support):
 	# Get padding parameters
-	M, N = img.shape
-	P = 2*M
-	Q = 2*N
+	M, N = img_shape
+	P, Q = padded_shape(img_shape, padding, support)
 
-	# Take the fourier transform of the image, with padding to shape P X Q
-	F = np.fft.fft2(img, s=(P,Q))
+	# Filter parameters are given for a 2M x 2N transform
+	spacing = (2.0*M/P, 2.0*N/Q) if (P, Q) != (2*M, 2*N) else (1, 1)
+
+	# The real-valued transform only has the columns for non-negative
+	# frequencies, without shifting the low frequencies to the center
+	if mode == 'complex':
+		layout = 'centered'
+	elif mode == 'real':
+		layout = 'half'
+	else:
+		raise ValueError("Unknown transform mode '%s'" % mode)
 
-	# Shift the low frequencies to the center.
-	F = np.fft.fftshift(F)
+	H = combined_transfer_function((P, Q), stages, layout=layout, spacing=spacing)
+
+	return H, (P, Q)
+
+# Filter image, or stack of images along the last two axes, with a filter for
+# the padded transform shape. Also returns the logarithm of the power spectrum
+# if requested.
+def _filter_freq(img, H, shape, mode, spectrum):
+	F = _forward(img, shape, mode)
 
 	# Get power spectrum of the image
-	pow_spec = np.abs(F)**2
+	pow_spec = _log_power(F) if spectrum else None
 
-	# Create a filter with input parameters
-	if fclass == 'lowpass':
-		H = lowpass_filter(F.shape, d0, ftype, n)
-	elif fclass == 'highpass':
-		H = highpass_filter(F.shape, d0, ftype, n)
-	elif fclass == 'bandreject':
-		H = bandreject_filter(F.shape, d0, w, ftype, n)
-	elif fclass == 'bandpass':
-		H = bandpass_filter(F.shape, d0, w, ftype, n)
-	elif fclass == 'notchreject':
-		H = notch_reject_filter(F.shape, d0, ftype, n, u_k, v_k)
-	elif fclass == 'notchpass':
-		H = notch_pass_filter(F.shape, d0, ftype, n, u_k, v_k)
+	# Form product of image with filter, reusing the transform
+	F *= H
+
+	return _inverse(F, img.shape[-2:], shape, mode), pow_spec
+
+# Fourier transform of image, or stack of images, padded to shape P x Q
+def _forward(img, shape, mode):
+	if mode == 'complex':
+		# Take the fourier transform of the image, with padding to shape P X Q
+		F = np.fft.fft2(img, s=shape)
+
+		# Shift the low frequencies to the center.
+		return np.fft.fftshift(F, axes=(-2, -1))
 
-	# Form product of image with filter
-	G = F * H
+	# Take the real-valued fourier transform of the image. The filters are
+	# real and symmetric, so the product with the transform of a real image
+	# is conjugate symmetric and only half of it is computed.
+	return np.fft.rfft2(img, s=shape)
 
-	# Shift frequencies back
-	G = np.fft.ifftshift(G)
+# Output image, or stack of images, of size M x N from the product G of the
+# transform and the filter
+def _inverse(G, img_shape, shape, mode):
+	M, N = img_shape
 
-	# Inverse fourier transform to get output image in spatial domain
-	G = np.fft.ifft2(G)
+	if mode == 'complex':
+		# Shift frequencies back
+		G = np.fft.ifftshift(G, axes=(-2, -1))
 
-	# Get real values
-	G = np.abs(G)
+		# Inverse fourier transform to get output image in spatial domain
+		G = np.fft.ifft2(G)
+
+		# Get real values
+		G = np.abs(G)
+
+	else:
+		# The inverse transform of the half plane product is real
+		G = np.fft.irfft2(G, s=shape)
 
 	# Extract M x N image from top left quadrant
-	G = G[0:M, 0:N]
+	return G[..., 0:M, 0:N]
 
-	# Return output image, the filter used and the power spectrum of input image
-	return G, np.abs(H), np.log(pow_spec)
+# Logarithm of the power spectrum of a transform, computed in one array
+def _log_power(F):
+	pow_spec = np.abs(F)
+	pow_spec **= 2
+	return np.log(pow_spec, out=pow_spec)
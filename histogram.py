@@ -0,0 +1,254 @@
+import numpy as np
+
+# Smallest number of rows and columns of a CLAHE tile. Small images get fewer
+# tiles, since tables of tiles with a few pixels map every pixel close to
+# the ends of the range.
+CLAHE_MIN_TILE = 8
+
+# Histogram
+###############################################################################
+# INPUT
+# img:			Input image, or K x M x N stack of images (uint8 or uint16)
+# levels:		Number of intensity levels (default is all levels of the
+#				image data type)
+###############################################################################
+# OUTPUT
+# n:		   Number of occurences of each intensity level, or K x levels
+#			   array with the histogram of each image for a stack
+###############################################################################
+def histogram(img, levels=None):
+	img = np.asarray(img)
+	levels = _levels(img, levels)
+
+	if img.ndim == 2:
+		return np.bincount(img.ravel(), minlength=levels)[:levels]
+
+	# Count all images at once, with the levels of image k offset by k*levels
+	K = len(img)
+	return np.bincount(_stack_index(img, levels).ravel(), minlength=K * levels).reshape(K, levels)
+
+# Histogram Equalization Look-Up Table
+###############################################################################
+# INPUT
+# img:			Input image, or K x M x N stack of images (uint8 or uint16)
+# levels:		Number of intensity levels (default is all levels of the
+#				image data type)
+###############################################################################
+# OUTPUT
+# s:		   Equalized intensity value for each input level, or K x levels
+#			   array with the table of each image for a stack
+###############################################################################
+def equalization_lut(img, levels=None):
+	img = np.asarray(img)
+	levels = _levels(img, levels)
+	max_r = levels - 1
+
+	# Scale cumulative distribution function of each image to the intensity
+	# range, with the same rounding as 1B
+	size = img[0].size if img.ndim == 3 else img.size
+	return np.around(_cdf_lut(histogram(img, levels), size, max_r)).astype(img.dtype)
+
+# Histogram Equalization
+###############################################################################
+# INPUT
+# img:			Input image, or K x M x N stack of images (uint8 or uint16),
+#				each image of a stack is equalized by itself
+# levels:		Number of intensity levels (default is all levels of the
+#				image data type)
+###############################################################################
+# OUTPUT
+# img_eq:		Equalized image or stack
+###############################################################################
+def equalize_histogram(img, levels=None):
+	img = np.asarray(img)
+	return apply_lut(img, equalization_lut(img, levels))
+
+# Contrast Limited Adaptive Histogram Equalization (CLAHE)
+###############################################################################
+# INPUT
+# img:			Input image (uint8, uint16, or float scaled to [0,1])
+# tiles:		Number of tiles along rows and columns, reduced so that tiles
+#				have at least CLAHE_MIN_TILE rows and columns (default is 8x8)
+# clip_limit:	Largest count of a tile histogram bin, relative to the mean
+#				count of the bins. The clipped counts are spread over all
+#				levels, so for images that only use a narrow range of levels
+#				small limits barely change the image: the pollen image
+#				(levels 91 to 138) is stretched to 68-169 with a limit of 2,
+#				22-231 with the default of 8 and 0-255 from 24 on.
+# levels:		Number of intensity levels (default is all levels of the
+#				image data type, or 256 for float images)
+###############################################################################
+# OUTPUT
+# img_eq:		Equalized image, with the data type of the input image
+###############################################################################
+def clahe(img, tiles=(8, 8), clip_limit=8.0, levels=None):
+	img = np.asarray(img)
+	if np.issubdtype(img.dtype, np.floating):
+		# Quantize float image to the intensity levels
+		levels = 256 if levels is None else levels
+		r = np.clip(np.around(img * (levels - 1)), 0, levels - 1)
+		r = r.astype(np.uint8 if levels <= 256 else np.uint16)
+	else:
+		r = img
+	if r.ndim != 2:
+		raise ValueError("CLAHE needs an M x N image")
+	levels = _levels(r, levels)
+	max_r = levels - 1
+
+	# Pad image at the bottom and right so that all tiles have the same shape
+	M, N = r.shape
+	T_u, T_v = tiles
+	if T_u < 1 or T_v < 1:
+		raise ValueError("Number of tiles must be positive, got %s" % (tiles,))
+	T_u = max(1, min(T_u, M // CLAHE_MIN_TILE))
+	T_v = max(1, min(T_v, N // CLAHE_MIN_TILE))
+	t_u = -(-M // T_u)
+	t_v = -(-N // T_v)
+	padded = np.pad(r, ((0, T_u * t_u - M), (0, T_v * t_v - N)), mode='reflect')
+
+	# Get histogram of every tile at once, as a stack of tiles
+	stack = padded.reshape(T_u, t_u, T_v, t_v).swapaxes(1, 2).reshape(T_u * T_v, t_u, t_v)
+	n = histogram(stack, levels).astype(np.float64)
+
+	# Clip histograms and spread the clipped counts evenly over all bins
+	limit = max(clip_limit * t_u * t_v / levels, 1)
+	excess = np.maximum(n - limit, 0).sum(axis=1)
+	n = np.minimum(n, limit) + excess[:, None] / levels
+
+	# Look-up table of every tile, not rounded before blending
+	luts = _cdf_lut(n, t_u * t_v, max_r).reshape(T_u, T_v, levels)
+
+	# Blend tables of the four nearest tile centers bilinearly
+	i0, i1, a = _tile_weights(M, t_u, T_u)
+	j0, j1, b = _tile_weights(N, t_v, T_v)
+	i0, i1, a = i0[:, None], i1[:, None], a[:, None]
+	img_eq = ((1 - a) * ((1 - b) * luts[i0, j0, r] + b * luts[i0, j1, r]) +
+		a * ((1 - b) * luts[i1, j0, r] + b * luts[i1, j1, r]))
+
+	if np.issubdtype(img.dtype, np.floating):
+		return (img_eq / max_r).astype(img.dtype)
+	return np.around(img_eq).astype(img.dtype)
+
+# Histogram Specification Look-Up Table
+###############################################################################
+# INPUT
+# img:			Input image, or K x M x N stack of images (uint8 or uint16)
+# hist:			Specified histogram, counts or probabilities of each level
+###############################################################################
+# OUTPUT
+# z:		   Output intensity value for each input level, or K x levels
+#			   array with the table of each image for a stack
+###############################################################################
+def specification_lut(img, hist):
+	img = np.asarray(img)
+	hist = np.asarray(hist, dtype=np.float64)
+	if hist.ndim != 1 or hist.sum() <= 0:
+		raise ValueError("Specified histogram must be a non-empty 1-D array of counts")
+	levels = _levels(img, len(hist))
+	max_r = levels - 1
+
+	# Equalize input image, s = T(r)
+	s = equalization_lut(img, levels)
+
+	# Equalize specified histogram, G(z)
+	G = np.around(np.cumsum(hist) * max_r / hist.sum())
+
+	# Map s to the smallest z with G(z) >= s, z = G^-1(s)
+	z = np.searchsorted(G, s, side='left')
+	return np.minimum(z, max_r).astype(img.dtype)
+
+# Histogram Specification
+###############################################################################
+# INPUT
+# img:			Input image, or K x M x N stack of images (uint8 or uint16)
+# hist:			Specified histogram, counts or probabilities of each level
+###############################################################################
+# OUTPUT
+# img_sp:		Image or stack with approximately the specified histogram
+###############################################################################
+def specify_histogram(img, hist):
+	img = np.asarray(img)
+	return apply_lut(img, specification_lut(img, hist))
+
+# Histogram Matching
+###############################################################################
+# INPUT
+# img:			Input image, or K x M x N stack of images (uint8 or uint16)
+# ref:			Reference image with the same data type, whose histogram
+#				the output should match
+###############################################################################
+# OUTPUT
+# img_m:		Image or stack with approximately the histogram of ref
+###############################################################################
+def match_histogram(img, ref):
+	img = np.asarray(img)
+	ref = np.asarray(ref)
+	if ref.dtype != img.dtype:
+		raise ValueError("Reference image must have the same data type as the image")
+
+	# Use the combined histogram of all images for a reference stack
+	hist = histogram(ref)
+	if ref.ndim == 3:
+		hist = hist.sum(axis=0)
+	return specify_histogram(img, hist)
+
+# Apply Look-Up Table
+###############################################################################
+# INPUT
+# img:			Input image, or K x M x N stack of images (uint8 or uint16)
+# lut:			Output value for each input level, or K x levels array with
+#				one table for each image of a stack
+###############################################################################
+# OUTPUT
+# result:		Image or stack with every pixel mapped through the table
+###############################################################################
+def apply_lut(img, lut):
+	img = np.asarray(img)
+	lut = np.asarray(lut)
+	_levels(img, lut.shape[-1])
+
+	if lut.ndim == 1:
+		# Map all pixels through the same table
+		return np.take(lut, img)
+
+	if img.ndim != 3 or lut.shape[0] != len(img):
+		raise ValueError("Stack of tables needs a K x M x N stack of images")
+
+	# Map image k through table k, by indexing the flattened tables
+	return np.take(lut.ravel(), _stack_index(img, lut.shape[-1]))
+
+# Scale cumulative distribution function of histograms n to [0, max_r]
+def _cdf_lut(n, size, max_r):
+	s = np.cumsum(n, axis=-1, dtype=np.float64)
+	return s * max_r / size
+
+# Get the two nearest tile centers along an axis, and the weight of the second.
+# Beyond the outer centers both are the same tile, with weight 0 so that its
+# table is used as it is.
+def _tile_weights(length, tile, count):
+	pos = (np.arange(length) + 0.5) / tile - 0.5
+	k0 = np.clip(np.floor(pos).astype(np.intp), 0, count - 1)
+	k1 = np.minimum(k0 + 1, count - 1)
+	weight = np.where(k1 > k0, np.clip(pos - k0, 0, 1), 0)
+	return k0, k1, weight
+
+# Get number of intensity levels of an 8/16-bit image, and check the image
+def _levels(img, levels=None):
+	if img.dtype not in (np.uint8, np.uint16):
+		raise ValueError("Image must be uint8 or uint16, got %s" % img.dtype)
+	if img.ndim not in (2, 3):
+		raise ValueError("Image must be an M x N image or a K x M x N stack")
+
+	max_levels = np.iinfo(img.dtype).max + 1
+	if levels is None:
+		return max_levels
+	if not 0 < levels <= max_levels:
+		raise ValueError("Number of levels must be in [1, %d]" % max_levels)
+	if img.size and img.max() >= levels:
+		raise ValueError("Image has intensity values outside %d levels" % levels)
+	return levels
+
+# Offset the levels of image k in a stack by k*levels
+def _stack_index(img, levels):
+	offset = np.arange(len(img), dtype=np.intp) * levels
+	return img + offset[:, None, None]
@@ -0,0 +1,277 @@
+import os
+import struct
+
+import numpy as np
+
+# File extensions of TIFF images
+TIFF_EXTENSIONS = ('.tif', '.tiff')
+
+# TIFF tags read from the first image file directory
+_TIFF_TAGS = {256: 'width', 257: 'length', 258: 'bits', 259: 'compression', 262: 'photometric', 273: 'offsets',
+	277: 'samples', 278: 'rows_per_strip', 279: 'byte_counts', 284: 'planar', 339: 'sample_format'}
+
+# struct codes of the TIFF field types for the tags above
+_TIFF_TYPES = {1: 'B', 3: 'H', 4: 'I'}
+
+# numpy kinds of the TIFF sample formats (unsigned, signed and float)
+_TIFF_FORMATS = {1: 'u', 2: 'i', 3: 'f'}
+
+# Read Image
+###############################################################################
+# INPUT
+# path:			Path of a .npy, TIFF, PNG or other image file
+# dtype:		Data type of the output image, converted as by convert_dtype
+#				(default is the data type stored in the file). Unsigned images
+#				are scaled to [0,1] when converted to a float type, as
+#				matplotlib does for PNG images.
+# mmap:			Whether to memory-map .npy files and uncompressed TIFF files
+#				instead of reading them
+###############################################################################
+# OUTPUT
+# img:			Image, memory-mapped read-only if possible and no conversion
+#				of the data type is needed
+###############################################################################
+def imread(path, dtype=None, mmap=True):
+	ext = os.path.splitext(path)[1].lower()
+
+	layout = _tiff_layout(path) if ext in TIFF_EXTENSIONS else None
+
+	if ext == '.npy':
+		img = np.load(path, mmap_mode='r' if mmap else None)
+	elif layout is not None:
+		# Pixels of uncompressed TIFF files with contiguous strips are read
+		# directly from the file
+		offset, shape, native = layout
+		img = np.memmap(path, dtype=native, mode='r', offset=offset, shape=shape)
+		if not mmap:
+			img = np.array(img)
+	else:
+		img = _read_pil(path)
+
+	return convert_dtype(img, dtype)
+
+# Lazy Image
+###############################################################################
+# INPUT
+# path:			Path of a .npy, TIFF, PNG or other image file
+# dtype:		Data type of the output image, as for imread
+###############################################################################
+# OUTPUT
+# img:			Image that opens the file on first use, and only reads and
+#				converts the pixels that are sliced from it if the file can
+#				be memory-mapped
+###############################################################################
+class LazyImage(object):
+	def __init__(self, path, dtype=None):
+		self.path = path
+		self._dtype = dtype
+		self._img = None
+
+	# Image in the file, memory-mapped if possible
+	def _pixels(self):
+		if self._img is None:
+			self._img = imread(self.path)
+		return self._img
+
+	@property
+	def shape(self):
+		return self._pixels().shape
+
+	@property
+	def ndim(self):
+		return self._pixels().ndim
+
+	@property
+	def dtype(self):
+		return np.dtype(self._dtype) if self._dtype is not None else self._pixels().dtype
+
+	def __len__(self):
+		return len(self._pixels())
+
+	def __getitem__(self, key):
+		return convert_dtype(np.asarray(self._pixels()[key]), self._dtype)
+
+	def __array__(self, dtype=None, copy=None):
+		img = convert_dtype(np.asarray(self._pixels()), self._dtype)
+		return img if dtype is None else img.astype(dtype)
+
+# Convert Data Type
+###############################################################################
+# INPUT
+# img:			Input image
+# dtype:		Data type of the output image. Integer (and boolean) values
+#				are divided by the largest value of their type when converted
+#				to a float type, so unsigned images are scaled to [0,1].
+#				Conversions to an integer type multiply by its largest value
+#				instead, then round off and clip to its range, as im2uint8
+#				does for float images. Between integer types this scales by
+#				the ratio of the largest values, e.g. uint16 to uint8 divides
+#				by 257 instead of wrapping around.
+###############################################################################
+# OUTPUT
+# img:			Image with the data type, the input image itself if it
+#				already has it or dtype is None
+###############################################################################
+def convert_dtype(img, dtype):
+	if dtype is None or img.dtype == dtype:
+		return img
+	dtype = np.dtype(dtype)
+	if img.dtype.kind not in 'buif' or dtype.kind not in 'uif':
+		raise ValueError("Cannot convert images of type %s to %s" % (img.dtype, dtype))
+
+	if dtype.kind == 'f':
+		if img.dtype.kind == 'f':
+			return img.astype(dtype)
+		return np.divide(img, _max_value(img.dtype), dtype=dtype)
+
+	# Scale to the integer range in float64, round off and clip
+	scale = np.float64(np.iinfo(dtype).max)
+	if img.dtype.kind != 'f':
+		scale /= _max_value(img.dtype)
+	result = np.multiply(img, scale, dtype=np.float64)
+	np.around(result, out=result)
+	np.clip(result, *_float_limits(dtype), out=result)
+	return result.astype(dtype)
+
+# Largest value of an integer or boolean type
+def _max_value(dtype):
+	return 1 if dtype.kind == 'b' else np.iinfo(dtype).max
+
+# Range of an integer type as float64 values that convert back to the type
+def _float_limits(dtype):
+	info = np.iinfo(dtype)
+	low, high = np.float64(info.min), np.float64(info.max)
+	if int(high) > info.max:
+		high = np.nextafter(high, 0)
+	return low, high
+
+# Write Image
+###############################################################################
+# INPUT
+# path:			Path of a .npy, TIFF, PNG or other image file
+# img:			Image to write. TIFF files store any integer or float type
+#				uncompressed, so they can be memory-mapped by imread. Other
+#				formats need uint8 images (uint16 for grayscale PNG).
+###############################################################################
+def imwrite(path, img):
+	img = np.asarray(img)
+	ext = os.path.splitext(path)[1].lower()
+
+	if ext == '.npy':
+		np.save(path, img)
+	elif ext in TIFF_EXTENSIONS:
+		_write_tiff(path, img)
+	else:
+		if np.issubdtype(img.dtype, np.floating):
+			raise ValueError("Float images must be converted to uint8 (im2uint8) before writing %s files" % ext)
+		from PIL import Image
+		Image.fromarray(img).save(path)
+
+# Decode image with PIL, keeping the data type stored in the file
+def _read_pil(path):
+	from PIL import Image
+	with Image.open(path) as im:
+		if im.mode == 'P':
+			im = im.convert('RGBA' if 'transparency' in im.info else 'RGB')
+		return np.array(im)
+
+# Offset, shape and data type of the pixels of an uncompressed TIFF file whose
+# strips follow each other, or None if the pixels cannot be memory-mapped
+def _tiff_layout(path):
+	with open(path, 'rb') as f:
+		head = f.read(8)
+		order = {b'II': '<', b'MM': '>'}.get(head[:2])
+		if order is None or struct.unpack(order + 'H', head[2:4])[0] != 42:
+			return None
+
+		# Read the tags of the first image file directory
+		f.seek(struct.unpack(order + 'I', head[4:8])[0])
+		count = struct.unpack(order + 'H', f.read(2))[0]
+		entries = f.read(12 * count)
+		tags = {}
+		for k in range(count):
+			tag, ftype, n, value = struct.unpack(order + 'HHI4s', entries[12*k:12*k + 12])
+			if tag not in _TIFF_TAGS or ftype not in _TIFF_TYPES:
+				continue
+			code = order + _TIFF_TYPES[ftype] * n
+			if struct.calcsize(code) > 4:
+				# Values that do not fit in the entry are stored elsewhere
+				f.seek(struct.unpack(order + 'I', value)[0])
+				value = f.read(struct.calcsize(code))
+			tags[_TIFF_TAGS[tag]] = struct.unpack(code, value[:struct.calcsize(code)])
+
+	samples = tags.get('samples', (1,))[0]
+	bits = tags.get('bits', (1,))
+	fmt = tags.get('sample_format', (1,))
+
+	# Only BlackIsZero grayscale and RGB(A) pixels are stored as they are
+	# shown, others (e.g. WhiteIsZero or palette images) are decoded by PIL
+	photometric = tags.get('photometric', (None,))[0]
+	if not ((photometric == 1 and samples == 1) or (photometric == 2 and samples in (3, 4))):
+		return None
+	if (tags.get('compression', (1,))[0] != 1 or tags.get('planar', (1,))[0] != 1 or 'offsets' not in tags or
+		'byte_counts' not in tags or len(set(bits)) != 1 or bits[0] not in (8, 16, 32, 64) or
+		len(set(fmt)) != 1 or fmt[0] not in _TIFF_FORMATS):
+		return None
+
+	M, N = tags['length'][0], tags['width'][0]
+	shape = (M, N, samples) if samples > 1 else (M, N)
+	dtype = np.dtype(order + _TIFF_FORMATS[fmt[0]] + str(bits[0] // 8))
+
+	# Strips must be stored one after the other, without gaps
+	offsets, counts = tags['offsets'], tags['byte_counts']
+	if any(offsets[k] + counts[k] != offsets[k + 1] for k in range(len(offsets) - 1)):
+		return None
+	if sum(counts) != M * N * samples * dtype.itemsize:
+		return None
+
+	return offsets[0], shape, dtype
+
+# Write image as an uncompressed little-endian TIFF file with a single strip
+def _write_tiff(path, img):
+	if img.dtype == bool:
+		img = img.astype(np.uint8)
+	if img.dtype.kind not in 'uif' or img.ndim not in (2, 3) or (img.ndim == 3 and img.shape[2] not in (3, 4)):
+		raise ValueError("TIFF images must be M x N, M x N x 3 or M x N x 4 arrays of integers or floats")
+	img = img.astype(img.dtype.newbyteorder('<'), copy=False)
+
+	M, N = img.shape[:2]
+	samples = img.shape[2] if img.ndim == 3 else 1
+	fmt = dict((kind, code) for code, kind in _TIFF_FORMATS.items())[img.dtype.kind]
+
+	# Tags in increasing order, as (tag, field type, values)
+	entries = [(256, 4, [N]), (257, 4, [M]), (258, 3, [8 * img.dtype.itemsize] * samples), (259, 3, [1]),
+		(262, 3, [2 if samples > 1 else 1]), (273, 4, [0]), (277, 3, [samples]), (278, 4, [M]),
+		(279, 4, [img.nbytes]), (284, 3, [1])]
+	if samples == 4:
+		# Fourth sample is unassociated alpha
+		entries.append((338, 3, [2]))
+	entries.append((339, 3, [fmt] * samples))
+
+	# Values that do not fit in an entry follow the image file directory
+	extra_offset = 8 + 2 + 12 * len(entries) + 4
+	extra = b''
+	fields = []
+	for tag, ftype, values in entries:
+		data = struct.pack('<' + _TIFF_TYPES[ftype] * len(values), *values)
+		if len(data) > 4:
+			fields.append((tag, ftype, len(values), struct.pack('<I', extra_offset + len(extra))))
+			extra += data
+		else:
+			fields.append((tag, ftype, len(values), data.ljust(4, b'\0')))
+
+	# Pixels follow the values, aligned to 8 bytes
+	data_offset = -(-(extra_offset + len(extra)) // 8) * 8
+	if data_offset + img.nbytes >= 2**32:
+		raise ValueError("Image is too large for a TIFF file")
+	extra = extra.ljust(data_offset - extra_offset, b'\0')
+	fields = [(tag, ftype, n, struct.pack('<I', data_offset) if tag == 273 else value) for tag, ftype, n, value in fields]
+
+	with open(path, 'wb') as f:
+		f.write(b'II' + struct.pack('<HI', 42, 8))
+		f.write(struct.pack('<H', len(fields)))
+		for tag, ftype, n, value in fields:
+			f.write(struct.pack('<HHI', tag, ftype, n) + value)
+		f.write(struct.pack('<I', 0))
+		f.write(extra)
+		np.ascontiguousarray(img).tofile(f)
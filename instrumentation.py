@@ -0,0 +1,248 @@
+import contextlib
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+# Upper edges of the wall time histogram bins in seconds, powers of 2 from 1 us
+# to about 17 minutes. Longer calls are counted in the last bin.
+TIME_BINS = 2.0**np.arange(0, 31) * 1e-6
+
+# Largest number of calls kept for the Chrome trace, later calls are only
+# aggregated
+MAX_EVENTS = 100000
+
+# Whether calls are recorded, checked by every instrumented function
+_enabled = False
+_memory = False
+
+# Aggregates by (function, backend), recorded calls, and callbacks
+_stats = {}
+_events = []
+_hooks = []
+_lock = threading.Lock()
+_local = threading.local()
+_origin = time.perf_counter()
+
+# Instrumented Function
+###############################################################################
+# INPUT
+# backend:		Function taking the arguments of the instrumented function
+#				and returning the name of the backend it uses, or names of
+#				its arguments whose values name the backend, e.g.
+#				('mode', 'padding') (default is its 'method' argument, if it
+#				has one). A backend the function reports with report_backend
+#				while it runs is used instead, so that functions choosing
+#				their backend (e.g. for method='auto') are not analysed twice.
+###############################################################################
+# OUTPUT
+# decorator:	Decorator that records the wall time, pixels, output bytes
+#				and backend of each call while recording is enabled. When it
+#				is disabled the call only costs one extra check.
+###############################################################################
+def instrumented(backend=None):
+	def decorator(func):
+		name = '%s.%s' % (func.__module__, func.__name__)
+		signature = inspect.signature(func)
+		if callable(backend):
+			get_backend = backend
+		elif backend is not None:
+			get_backend = _argument_backend(signature, backend)
+		elif 'method' in signature.parameters:
+			get_backend = _argument_backend(signature, ('method',))
+		else:
+			get_backend = None
+
+		@functools.wraps(func)
+		def wrapper(*args, **kwargs):
+			if not _enabled:
+				return func(*args, **kwargs)
+			return _record(name, func, args, kwargs, get_backend)
+
+		return wrapper
+	return decorator
+
+# Report the backend chosen by the running instrumented function, recorded in
+# place of its backend argument. Only costs one check when recording is
+# disabled.
+def report_backend(backend):
+	if _enabled:
+		reported = getattr(_local, 'reported', None)
+		if reported:
+			reported[-1] = backend
+
+# Start recording calls of instrumented functions. With memory=True the peak of
+# the memory allocated by each outermost call is traced too (with tracemalloc,
+# which slows down allocations considerably).
+def enable(memory=False):
+	global _enabled, _memory
+	_memory = memory
+	if memory and not tracemalloc.is_tracing():
+		tracemalloc.start()
+	_enabled = True
+
+# Stop recording calls
+def disable():
+	global _enabled, _memory
+	_enabled = False
+	if _memory and tracemalloc.is_tracing():
+		tracemalloc.stop()
+	_memory = False
+
+def is_enabled():
+	return _enabled
+
+# Remove all recorded calls
+def reset():
+	with _lock:
+		_stats.clear()
+		del _events[:]
+
+# Add function called with the record dict of each call, e.g. to forward them to
+# a monitoring system
+def add_hook(hook):
+	with _lock:
+		_hooks.append(hook)
+
+def remove_hook(hook):
+	with _lock:
+		_hooks.remove(hook)
+
+# Record calls of the instrumented functions within a with block, starting
+# from no recorded calls
+@contextlib.contextmanager
+def recording(memory=False):
+	reset()
+	enable(memory)
+	try:
+		yield
+	finally:
+		disable()
+
+# Summary of Recorded Calls
+###############################################################################
+# OUTPUT
+# summary:		Dict by 'function[backend]' with the number of 'calls', the
+#				'total', 'min', 'max' and 'mean' wall time in seconds, the
+#				total 'pixels' and output 'bytes', 'pixels_per_second', the
+#				largest 'peak_bytes' (if memory was traced) and the wall time
+#				'histogram' as counts for the upper bin edges 'bins'
+###############################################################################
+def summary():
+	with _lock:
+		result = {}
+		for (name, backend), s in sorted(_stats.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+			key = '%s[%s]' % (name, backend) if backend is not None else name
+			result[key] = {'function': name, 'backend': backend, 'calls': s['calls'], 'total': s['total'],
+				'min': s['min'], 'max': s['max'], 'mean': s['total'] / s['calls'], 'pixels': s['pixels'],
+				'bytes': s['bytes'], 'peak_bytes': s['peak_bytes'],
+				'pixels_per_second': s['pixels'] / s['total'] if s['total'] > 0 else None,
+				'bins': TIME_BINS.tolist(), 'histogram': s['histogram'].tolist()}
+		return result
+
+# Write the summary to a JSON file
+def export_json(path):
+	with open(path, 'w') as f:
+		json.dump({'functions': summary(), 'dropped_events': _dropped()}, f, indent=1, sort_keys=True)
+
+# Write the recorded calls to a Chrome trace file, which can be opened in
+# chrome://tracing or Perfetto. Nested calls are shown inside each other.
+def export_chrome_trace(path):
+	with _lock:
+		events = [{'name': e['function'], 'cat': e['backend'] or 'default', 'ph': 'X', 'ts': e['start'] * 1e6,
+			'dur': e['time'] * 1e6, 'pid': e['pid'], 'tid': e['thread'],
+			'args': {'backend': e['backend'], 'pixels': e['pixels'], 'bytes': e['bytes'], 'peak_bytes': e['peak_bytes']}}
+			for e in _events]
+	with open(path, 'w') as f:
+		json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+# Call func and record it
+def _record(name, func, args, kwargs, backend):
+	# Only the outermost call traces memory, resetting the peak in nested
+	# calls would hide the allocations of the caller
+	depth = getattr(_local, 'depth', 0)
+	trace = _memory and depth == 0 and tracemalloc.is_tracing()
+	if trace:
+		tracemalloc.reset_peak()
+		base = tracemalloc.get_traced_memory()[0]
+
+	# Slot for the backend reported by this call, nested calls push their own
+	reported = getattr(_local, 'reported', None)
+	if reported is None:
+		reported = _local.reported = []
+	reported.append(None)
+
+	_local.depth = depth + 1
+	start = time.perf_counter()
+	try:
+		result = func(*args, **kwargs)
+	finally:
+		elapsed = time.perf_counter() - start
+		_local.depth = depth
+		chosen = reported.pop()
+
+	if chosen is None and backend:
+		chosen = backend(*args, **kwargs)
+
+	peak = tracemalloc.get_traced_memory()[1] - base if trace else None
+	event = {'function': name, 'backend': chosen,
+		'start': start - _origin, 'time': elapsed, 'pixels': _pixels(args[0]) if args else 0,
+		'bytes': _nbytes(result), 'peak_bytes': peak, 'pid': os.getpid(), 'thread': threading.get_ident()}
+
+	with _lock:
+		s = _stats.get((name, event['backend']))
+		if s is None:
+			s = _stats[(name, event['backend'])] = {'calls': 0, 'total': 0.0, 'min': np.inf, 'max': 0.0,
+				'pixels': 0, 'bytes': 0, 'peak_bytes': None, 'dropped': 0, 'histogram': np.zeros(len(TIME_BINS), dtype=np.int64)}
+		s['calls'] += 1
+		s['total'] += elapsed
+		s['min'] = min(s['min'], elapsed)
+		s['max'] = max(s['max'], elapsed)
+		s['pixels'] += event['pixels']
+		s['bytes'] += event['bytes']
+		if peak is not None:
+			s['peak_bytes'] = max(s['peak_bytes'] or 0, peak)
+		s['histogram'][min(np.searchsorted(TIME_BINS, elapsed), len(TIME_BINS) - 1)] += 1
+		if len(_events) < MAX_EVENTS:
+			_events.append(event)
+		else:
+			s['dropped'] += 1
+		hooks = list(_hooks)
+
+	for hook in hooks:
+		hook(event)
+
+	return result
+
+# Backend as the values of arguments of a call
+def _argument_backend(signature, names):
+	def backend(*args, **kwargs):
+		bound = signature.bind(*args, **kwargs)
+		bound.apply_defaults()
+		return '/'.join(str(bound.arguments[name]) for name in names)
+	return backend
+
+# Number of pixels of an image, stack or filter shape
+def _pixels(x):
+	if isinstance(x, tuple) and all(isinstance(k, (int, np.integer)) for k in x):
+		return int(np.prod(x))
+	size = getattr(x, 'size', None)
+	return int(size) if size is not None else 0
+
+# Number of bytes of the arrays returned by a call
+def _nbytes(result):
+	if isinstance(result, np.ndarray):
+		return result.nbytes
+	if isinstance(result, (tuple, list)):
+		return sum(_nbytes(x) for x in result)
+	return 0
+
+# Number of calls that were only aggregated
+def _dropped():
+	with _lock:
+		return sum(s['dropped'] for s in _stats.values())
@@ -0,0 +1,94 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Smallest number of pixels that is filtered in parallel, smaller images are
+# filtered serially since starting the workers costs more than it saves
+PARALLEL_MIN_PIXELS = 512 * 512
+
+# Filter Image in Parallel
+###############################################################################
+# INPUT
+# img:			Input image
+# func:			Filter applied to each strip, a module level function such as
+#				median_filter, called as func(strip, *args, **kwargs)
+# halo:			Number of rows above and below a strip that the filter reads
+#				(s//2 for an s x s filter window)
+# args:			Further positional arguments of func
+# kwargs:		Keyword arguments of func
+# workers:		Number of worker processes (default is the number of CPUs)
+# strips:		Number of horizontal strips (default is the number of workers)
+###############################################################################
+# OUTPUT
+# result:		Output image, identical to func(img, *args, **kwargs) for
+#				filters that only read pixels within the halo, with the same
+#				exception as filter_tiled: float images filtered by
+#				mean_filter or adaptive_lnr_filter with windows larger than
+#				BOX_SUM_DIRECT_MAX are only equal up to rounding, since their
+#				cumulative window sums start at the strip.
+###############################################################################
+def filter_parallel(img, func, halo, args=(), kwargs=None, workers=None, strips=None):
+	img = np.ascontiguousarray(img)
+	kwargs = {} if kwargs is None else kwargs
+	M, N = img.shape
+
+	if workers is None:
+		workers = os.cpu_count() or 1
+	if strips is None:
+		strips = workers
+	strips = max(1, min(strips, M))
+
+	# Filter small images serially
+	if workers <= 1 or strips == 1 or img.size < PARALLEL_MIN_PIXELS:
+		return func(img, *args, **kwargs)
+
+	# Get output data type by filtering a small corner of the image
+	probe = img[:min(M, 2*halo + 1), :min(N, 2*halo + 1)]
+	dtype = np.asarray(func(probe, *args, **kwargs)).dtype
+
+	# Share input and output images with the workers instead of pickling them
+	shm_in = shared_memory.SharedMemory(create=True, size=max(img.nbytes, 1))
+	shm_out = shared_memory.SharedMemory(create=True, size=max(M * N * dtype.itemsize, 1))
+	try:
+		np.ndarray(img.shape, img.dtype, buffer=shm_in.buf)[:] = img
+
+		# Split rows into strips of nearly equal height
+		bounds = np.linspace(0, M, strips + 1).astype(int)
+		tasks = [(shm_in.name, img.shape, img.dtype.str, shm_out.name, dtype.str, func, args, kwargs, u0, u1, halo)
+			for u0, u1 in zip(bounds[:-1], bounds[1:])]
+
+		with ProcessPoolExecutor(max_workers=workers) as pool:
+			list(pool.map(_filter_strip, tasks))
+
+		result = np.ndarray((M, N), dtype, buffer=shm_out.buf).copy()
+	finally:
+		for shm in (shm_in, shm_out):
+			shm.close()
+			shm.unlink()
+
+	return result
+
+# Filter rows u0 to u1 of a shared image into a shared output image
+def _filter_strip(task):
+	in_name, shape, in_dtype, out_name, out_dtype, func, args, kwargs, u0, u1, halo = task
+	M = shape[0]
+
+	shm_in = shared_memory.SharedMemory(name=in_name)
+	shm_out = shared_memory.SharedMemory(name=out_name)
+	try:
+		img = np.ndarray(shape, in_dtype, buffer=shm_in.buf)
+		out = np.ndarray(shape, out_dtype, buffer=shm_out.buf)
+
+		# Read strip with a halo, cropped to the image so that the filter
+		# handles the image border in the same way as for the whole image
+		a0, a1 = max(u0 - halo, 0), min(u1 + halo, M)
+		g = func(img[a0:a1], *args, **kwargs)
+		out[u0:u1] = g[u0 - a0:u1 - a0]
+
+		# Release views of the shared buffers before closing them
+		del img, out, g
+	finally:
+		shm_in.close()
+		shm_out.close()
@@ -1,17 +1,67 @@
 import numpy as np
 
-# Convert image to double [0, 1] scale
-def im2double(img):
+from instrumentation import instrumented
+
+# Number of pixels converted at a time, small enough for the cache
+BLOCK_SIZE = 2**16
+
+# Convert image to double [0, 1] scale. dtype is the working precision
+# (np.float64 or np.float32), out an optional C-contiguous output array of
+# that type. A constant image is scaled to all zeros.
+@instrumented(lambda img, dtype=np.float64, out=None: np.dtype(dtype).name)
+def im2double(img, dtype=np.float64, out=None):
+    img = np.asarray(img)
+    out = _output(out, img.shape, dtype)
+
     min_v = np.amin(img)
     max_v = np.amax(img)
+    range_v = np.float64(max_v) - np.float64(min_v)
+
+    if range_v == 0:
+        out.fill(0)
+        return out
+
+    # Integers of up to 16 bits are exact in float32, so they are subtracted
+    # in the working precision, other images in float64
+    work = out.dtype if img.dtype.kind in 'ui' and img.dtype.itemsize <= 2 else np.float64
+    np.subtract(img, min_v, out=out, dtype=work, casting='same_kind')
+    np.divide(out, out.dtype.type(range_v), out=out)
+    return out
+
+# Convert image to uint8 [0, 255] scale (assumes img is scaled in range [0,1]).
+# Float32 images are scaled in float32, others in float64. out is an optional
+# C-contiguous uint8 output array.
+@instrumented(lambda img, out=None: 'float32' if np.asarray(img).dtype == np.float32 else 'float64')
+def im2uint8(img, out=None):
+    img = np.asarray(img)
+    out = _output(out, img.shape, np.uint8)
+
+    dtype = np.float32 if img.dtype == np.float32 else np.float64
+    src = img.reshape(-1)
+    dst = out.reshape(-1)
+    tmp = np.empty(min(BLOCK_SIZE, src.size), dtype=dtype)
+
+    # Scale, round and clip one block at a time, so that the block stays in
+    # the cache between the steps
+    for k in range(0, src.size, BLOCK_SIZE):
+        t = tmp[:min(BLOCK_SIZE, src.size - k)]
+
+        # Scale to [0, 255] and round off to nearest integer
+        np.multiply(src[k:k + len(t)], 255, out=t, dtype=dtype, casting='unsafe')
+        np.around(t, out=t)
+
+        # Clip values outside range [0, 255]
+        np.clip(t, 0, 255, out=t)
+        np.copyto(dst[k:k + len(t)], t, casting='unsafe')
 
-    out = (img.astype(np.float64) - min_v) / (max_v - min_v)
     return out
 
-# Convert image to uint8 [0, 255] scale (assumes img is scaled in range [0,1])
-def im2uint8(img):
-    # Scale to [0, 255] and round off to nearest integer
-    out = np.around(255*img)
-    # Clip values outside range [0, 255]
-    out = np.clip(out, a_min=0, a_max=255)
-    return out.astype(np.uint8)
+# Check or allocate output array
+def _output(out, shape, dtype):
+    if out is None:
+        return np.empty(shape, dtype=dtype)
+    if out.shape != shape or out.dtype != dtype:
+        raise ValueError("Output array must have shape %s and type %s" % (shape, np.dtype(dtype)))
+    if not out.flags.c_contiguous:
+        raise ValueError("Output array must be C-contiguous")
+    return out
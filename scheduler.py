@@ -0,0 +1,155 @@
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from freq_filters import FILTER_DEFAULTS, _filter_for_image, _forward, _inverse
+from image_io import imread
+
+# Stages of a frequency domain filtering job, in order
+STAGES = ('load', 'transfer', 'forward', 'multiply', 'inverse')
+
+# Default number of jobs waiting between two stages
+QUEUE_SIZE = 4
+
+# Parameters of a job and their defaults, as for filter_image_freq
+JOB_DEFAULTS = dict(FILTER_DEFAULTS, mode='complex', padding='double', support=None)
+
+# Run Frequency Domain Filtering Jobs
+###############################################################################
+# INPUT
+# jobs:			Iterable of jobs, each a dict with the input image under 'img'
+#				(an array, a function returning the image, or the path of
+#				an image file read by imread) and any parameters of filter_image_freq
+#				('fclass', 'ftype', 'd0', 'w', 'n', 'u_k', 'v_k', 'mode',
+#				'padding', 'support' or 'notches')
+# workers:		Number of threads for each stage (default is the number of
+#				CPUs). NumPy releases the GIL in the transforms and products,
+#				so the stages of different jobs run at the same time.
+# queue_size:	Number of jobs waiting between two stages, which bounds the
+#				number of transforms held in memory
+###############################################################################
+# OUTPUT
+# G:		   List of output images, in the order of the jobs, the same as
+#			   filter_image_freq would return
+# stats:	   Timings of each stage in seconds: 'time' is the time spent
+#			   working summed over threads, 'wait' the time spent blocked
+#			   on a full queue to the next stage, 'count' the number of jobs.
+#			   'wall' is the total elapsed time. The stage with the most time
+#			   per thread limits the throughput.
+###############################################################################
+def run_freq_jobs(jobs, workers=None, queue_size=QUEUE_SIZE):
+	if workers is None:
+		workers = os.cpu_count() or 1
+
+	stats = dict((stage, {'time': 0.0, 'wait': 0.0, 'count': 0}) for stage in STAGES)
+	results = {}
+	errors = []
+	lock = threading.Lock()
+
+	# One bounded queue in front of each stage, the first one is fed below
+	queues = [queue.Queue(maxsize=queue_size) for _ in STAGES]
+	remaining = [workers] * len(STAGES)
+
+	def work(k):
+		stage = STAGES[k]
+		while True:
+			item = queues[k].get()
+			if item is None:
+				break
+
+			# After an error, drain the queue without doing any more work
+			if errors:
+				continue
+
+			start = time.time()
+			try:
+				_run_stage(stage, item, results)
+			except Exception as e:
+				with lock:
+					errors.append(e)
+				continue
+			elapsed = time.time() - start
+
+			wait = 0.0
+			if k + 1 < len(STAGES):
+				start = time.time()
+				queues[k + 1].put(item)
+				wait = time.time() - start
+
+			with lock:
+				stats[stage]['time'] += elapsed
+				stats[stage]['wait'] += wait
+				stats[stage]['count'] += 1
+
+		# The last thread of a stage to finish stops the next stage
+		with lock:
+			remaining[k] -= 1
+			last = remaining[k] == 0
+		if last and k + 1 < len(STAGES):
+			for _ in range(workers):
+				queues[k + 1].put(None)
+
+	threads = [threading.Thread(target=work, args=(k,)) for k in range(len(STAGES)) for _ in range(workers)]
+	for thread in threads:
+		thread.daemon = True
+		thread.start()
+
+	wall = time.time()
+	count = 0
+	try:
+		for job in jobs:
+			if errors:
+				break
+			queues[0].put({'index': count, 'job': job})
+			count += 1
+	finally:
+		for _ in range(workers):
+			queues[0].put(None)
+		for thread in threads:
+			thread.join()
+	stats['wall'] = time.time() - wall
+
+	if errors:
+		raise errors[0]
+
+	return [results[k] for k in range(count)], stats
+
+# Run one stage of a job, keeping the intermediate results in the job item
+def _run_stage(stage, item, results):
+	if stage == 'load':
+		job = item['job']
+		unknown = set(job) - set(JOB_DEFAULTS) - set(['img'])
+		if unknown:
+			raise ValueError("Unknown job parameters %s" % ', '.join(sorted(unknown)))
+		item['params'] = dict(JOB_DEFAULTS, **dict((k, v) for k, v in job.items() if k != 'img'))
+		item['img'] = _load(job['img'])
+
+	elif stage == 'transfer':
+		# Create a filter with the job parameters, or reuse a cached one
+		p = item['params']
+		item['H'], item['shape'] = _filter_for_image(item['img'].shape, p['fclass'], p['ftype'], p['d0'], p['w'], p['n'],
+			p['u_k'], p['v_k'], p['mode'], p['padding'], p['support'], p['notches'])
+
+	elif stage == 'forward':
+		img = item.pop('img')
+		item['img_shape'] = img.shape
+		item['F'] = _forward(img, item['shape'], item['params']['mode'])
+
+	elif stage == 'multiply':
+		# Form product of image with filter, reusing the transform
+		item['F'] *= item.pop('H')
+
+	elif stage == 'inverse':
+		img_shape = item.pop('img_shape')
+		results[item['index']] = _inverse(item.pop('F'), img_shape, item['shape'], item['params']['mode'])
+
+# Get input image of a job
+def _load(img):
+	if callable(img):
+		return np.asarray(img())
+	if isinstance(img, str):
+		return np.asarray(imread(img))
+	return np.asarray(img)
@@ -1,15 +1,110 @@
 import numpy as np
 
+from instrumentation import instrumented, report_backend
+
+# Kernel sizes (number of taps) at which spatial_convolution2d switches method
+SEPARABLE_MIN_TAPS = 25
+FFT_MIN_TAPS = 81
+
+# Available convolution methods
+CONVOLUTION_METHODS = ('loop', 'direct', 'separable', 'fft')
+
+# Separable kernel decomposition
+###############################################################################
+# INPUT
+# w:		   Input filter
+# tol:		   Relative tolerance for the second singular value
+###############################################################################
+# OUTPUT
+# col:		   Column filter (m values), or None if w is not separable
+# row:		   Row filter (n values), or None if w is not separable
+###############################################################################
+def separable_kernel(w, tol=1e-12):
+	# Rank 1 filters are the outer product of a column and a row filter
+	U, S, V = np.linalg.svd(np.asarray(w, dtype=np.float64))
+
+	if S[0] == 0 or (len(S) > 1 and S[1] > tol * S[0]):
+		return None, None
+
+	scale = np.sqrt(S[0])
+	return U[:, 0] * scale, V[0, :] * scale
+
+# Select convolution method
+###############################################################################
+# INPUT
+# w:		   Input filter
+# method:	   Requested method ('auto', 'loop', 'direct', 'separable' or 'fft')
+# dtype:	   Data type of the image
+###############################################################################
+# OUTPUT
+# method:	   Method used by spatial_convolution2d for this filter and image
+###############################################################################
+def convolution_method(w, method='auto', dtype=np.float64):
+	if method != 'auto':
+		if method not in CONVOLUTION_METHODS:
+			raise ValueError("Unknown convolution method '%s'" % method)
+		return method
+
+	# Integer images are accumulated directly, which converts to the image
+	# type after each tap like the loop does
+	if not np.issubdtype(dtype, np.floating):
+		return 'direct'
+
+	m, n = np.shape(w)
+	taps = m * n
+
+	# Rank 1 filters can be applied as two 1-dimensional passes
+	if taps >= SEPARABLE_MIN_TAPS and separable_kernel(w)[0] is not None:
+		return 'separable'
+
+	# Large filters are cheapest in the frequency domain
+	if taps >= FFT_MIN_TAPS:
+		return 'fft'
+
+	# Small filters are accumulated directly, giving the same result as the loop
+	return 'direct'
+
 # 2-Dimensional Convolution in spatial domain
 ###############################################################################
 # INPUT
 # f:		   Input image
 # w:		   Input filter
+# method:	   Convolution method ('auto', 'loop', 'direct', 'separable' or 'fft').
+#			   'auto' only uses separable and fft for float images, integer
+#			   images get the result of the loop.
 ###############################################################################
 # OUTPUT
-# result:	   Output image
+# result:	   Output image. 'direct' (and 'auto' for integer images and float
+#			   filters under SEPARABLE_MIN_TAPS taps) is bit-identical to the
+#			   loop. 'separable' and 'fft' (and 'auto' for larger float
+#			   filters) round differently, so they only agree with the loop
+#			   to within 256 (separable) or 1024 (fft) ulps of the largest
+#			   output value.
 ###############################################################################
-def spatial_convolution2d(f, w):
+@instrumented()
+def spatial_convolution2d(f, w, method='auto'):
+	w = np.asarray(w)
+	method = convolution_method(w, method, f.dtype)
+	report_backend(method)
+
+	if method == 'loop':
+		return _convolution_loop(f, w)
+	elif method == 'direct':
+		return _convolution_direct(f, w)
+	elif method == 'separable':
+		col, row = separable_kernel(w)
+		if col is None:
+			raise ValueError("Filter is not separable")
+		return _convolution_separable(f, col, row)
+	elif method == 'fft':
+		return _convolution_fft(f, w)
+
+# Zero pad image so that each filter tap can be applied as a shifted slice
+def _pad_for_filter(f, m, n):
+	return np.pad(f, ((m//2, m - 1 - m//2), (n//2, n - 1 - n//2)), 'constant', constant_values=0)
+
+# Convolution with a loop over every pixel and every filter tap
+def _convolution_loop(f, w):
 	# Get filter size
 	m, n = w.shape
 
@@ -19,8 +114,8 @@ def spatial_convolution2d(f, w):
 	# Get padded f size
 	x, y = f.shape
 
-	edgex = m/2
-	edgey = n/2
+	edgex = m//2
+	edgey = n//2
 
 	# Initialize result image
 	result = np.zeros_like(f)
@@ -42,64 +137,368 @@ def spatial_convolution2d(f, w):
 
 	return result
 
+# Convolution by accumulating one shifted image per filter tap
+def _convolution_direct(f, w):
+	m, n = w.shape
+	x, y = f.shape
+
+	# Pad image and rotate filter 180 degrees
+	f_pad = _pad_for_filter(f, m, n)
+	rot_w = np.flipud(np.fliplr(w))
+
+	# Initialize result image
+	result = np.zeros_like(f)
+
+	# Add the contribution of each filter tap for all pixels at once, in the
+	# same order as the loop so that the sums are identical
+	for s in range(m):
+		for t in range(n):
+			np.add(result, rot_w[s, t] * f_pad[s:s + x, t:t + y], out=result, casting='unsafe')
+
+	return result
+
+# Convolution with a column filter followed by a row filter
+def _convolution_separable(f, col, row):
+	m = len(col)
+	n = len(row)
+	x, y = f.shape
+
+	f_pad = _pad_for_filter(f.astype(np.float64), m, n)
+
+	# Filter columns of the padded image
+	tmp = np.zeros((x, y + n - 1))
+	for s in range(m):
+		tmp += col[m - 1 - s] * f_pad[s:s + x, :]
+
+	# Filter rows of the column filtered image
+	result = np.zeros((x, y))
+	for t in range(n):
+		result += row[n - 1 - t] * tmp[:, t:t + y]
+
+	return _to_dtype(result, f.dtype)
+
+# Convolution as a product in the frequency domain
+def _convolution_fft(f, w):
+	m, n = w.shape
+	x, y = f.shape
+
+	# Linear convolution needs transforms of at least the full output size
+	shape = (x + m - 1, y + n - 1)
+	result = np.fft.irfft2(np.fft.rfft2(f, shape) * np.fft.rfft2(w, shape), shape)
+
+	# Crop the full convolution back to the original size
+	result = result[(m-1)//2:(m-1)//2 + x, (n-1)//2:(n-1)//2 + y]
+
+	return _to_dtype(result, f.dtype)
+
+# Convert a float result to the image type, rounding off for integer images
+def _to_dtype(result, dtype):
+	if not np.issubdtype(dtype, np.floating):
+		result = np.around(result)
+	return result.astype(dtype)
+
+# Maximum number of intensity levels for the histogram median method
+MEDIAN_HISTOGRAM_LEVELS = 256
+
+# Number of intensity levels the histogram median method handles in the time
+# the sort method spends on one window value. Measured on 256 x 256 uint8
+# images: sorting costs about 1.0 ms per window value and the histogram about
+# 0.55 ms per level, e.g. 256 levels at s=15 take 0.15 s with the histogram
+# and 0.22 s with sorting, while at s=11 they take 0.15 s and 0.11 s.
+MEDIAN_LEVELS_PER_VALUE = 1.8
+
+# Number of window values processed at a time by window based filters
+WINDOW_BLOCK_SIZE = 2**22
+
+# Largest window whose float sums are added up value by value instead of from
+# cumulative sums. Every window is then summed in the same order wherever the
+# image starts, so tiles and strips get the sums of the whole image. Up to
+# s=7 this is also faster (2000 x 1500 float64 images: 0.057 s against
+# 0.067 s at s=5, 0.084 s against 0.069 s at s=11).
+BOX_SUM_DIRECT_MAX = 9
+
+# All s x s windows that lie fully inside the image, shape (x-s+1, y-s+1, s, s)
+def _sliding_windows(img, s):
+	x, y = img.shape
+	shape = (max(0, x - s + 1), max(0, y - s + 1), s, s)
+	strides = img.strides + img.strides
+	return np.lib.stride_tricks.as_strided(img, shape=shape, strides=strides, writeable=False)
+
+# Coordinates of pixels whose s x s window crosses the image border
+def _border_pixels(x, y, s):
+	r = s//2
+	border = np.ones((x, y), dtype=bool)
+	border[r:x - (s - 1 - r), r:y - (s - 1 - r)] = False
+	return np.nonzero(border)
+
+# Sum of the values inside the image in each s x s window, using cumulative
+# sums along columns and then along rows. Unsigned counts wrap around, but the
+# window sums are still exact. Floating point sums only accumulate rounding
+# errors from one column or row at a time rather than from the whole image.
+# Infinite and NaN values are summed separately, since a cumulative sum would
+# carry them into every later window of the row or column. Float sums of
+# windows up to BOX_SUM_DIRECT_MAX are added up directly.
+def _box_sum(a, s, dtype=None):
+	x, y = a.shape
+	r = s//2
+
+	if dtype is None:
+		dtype = np.uint16 if s * s < 2**16 else np.uint32
+
+	if np.issubdtype(dtype, np.floating) and np.issubdtype(a.dtype, np.floating):
+		finite = np.isfinite(a)
+		if not finite.all():
+			return _box_sum_nonfinite(a, s, dtype, finite)
+
+	if np.issubdtype(dtype, np.floating) and s <= BOX_SUM_DIRECT_MAX:
+		return _box_sum_direct(a, s, dtype)
+
+	# Sum over the window rows, with a leading row of zeros
+	c = np.zeros((x + s, y), dtype=dtype)
+	c[r + 1:r + 1 + x] = a
+	np.cumsum(c, axis=0, out=c)
+	rows = c[s:s + x] - c[0:x]
+
+	# Sum over the window columns, with a leading column of zeros
+	c = np.zeros((x, y + s), dtype=dtype)
+	c[:, r + 1:r + 1 + y] = rows
+	np.cumsum(c, axis=1, out=c)
+
+	return c[:, s:s + y] - c[:, 0:y]
+
+# Window sums added up one row and then one column of the window at a time,
+# with zeros outside the image
+def _box_sum_direct(a, s, dtype):
+	x, y = a.shape
+	r = s//2
+
+	c = np.zeros((x + s - 1, y), dtype=dtype)
+	c[r:r + x] = a
+	rows = c[0:x].copy()
+	for u in range(1, s):
+		rows += c[u:u + x]
+
+	c = np.zeros((x, y + s - 1), dtype=dtype)
+	c[:, r:r + y] = rows
+	result = c[:, 0:y].copy()
+	for v in range(1, s):
+		result += c[:, v:v + y]
+
+	return result
+
+# Window sums of an image with infinite or NaN values, which give the sum of
+# the window values like a loop would: NaN if the window has a NaN or both
+# infinities, else the infinity it has
+def _box_sum_nonfinite(a, s, dtype, finite):
+	result = _box_sum(np.where(finite, a, 0), s, dtype)
+	nan = _box_sum(np.isnan(a), s) > 0
+	pos = _box_sum(a == np.inf, s) > 0
+	neg = _box_sum(a == -np.inf, s) > 0
+	result[pos] = np.inf
+	result[neg] = -np.inf
+	result[nan | (pos & neg)] = np.nan
+	return result
+
+# Map image to indices into its sorted intensity levels, if there are few enough
+def _quantize(img):
+	levels, idx = np.unique(img, return_inverse=True)
+	if len(levels) > MEDIAN_HISTOGRAM_LEVELS:
+		return None, None
+	return levels, idx.reshape(img.shape)
+
+# Mean and variance of the values inside the image in each s x s window,
+# from integral images of x and x**2
+def _local_mean_var(img, s):
+	x, y = img.shape
+
+	if _exact_sums(img, s):
+		# Integer sums are exact, so the mean is the same as the loop's and
+		# the variance is only rounded once
+		f = img.astype(np.int64)
+		count = _box_sum(np.ones((x, y), dtype=np.int64), s, np.int64)
+		total = _box_sum(f, s, np.int64)
+		mean_l = total / count
+		var_l = (count * _box_sum(f * f, s, np.int64) - total * total) / (count * count).astype(np.float64)
+		return mean_l, var_l
+
+	count = _box_sum(np.ones((x, y)), s, np.float64)
+
+	# Subtract the image mean first for cumulative sums, so that the sums of
+	# squares stay small and the variance does not lose precision to
+	# cancellation. Direct sums only add up the window, and keep the image
+	# values so that they do not depend on the rest of the image.
+	offset = 0.0
+	if s > BOX_SUM_DIRECT_MAX:
+		finite = np.isfinite(img)
+		offset = np.mean(img[finite], dtype=np.float64) if finite.any() else 0.0
+	f = img.astype(np.float64) - offset
+
+	mean_l = _box_sum(f, s, np.float64) / count
+	with np.errstate(invalid='ignore'):
+		var_l = _box_sum(f * f, s, np.float64) / count - mean_l**2
+
+	return mean_l + offset, np.maximum(var_l, 0)
+
+# Whether the window sums of x and x**2 of an image can be computed exactly in
+# int64, which holds for integer images with values of up to 16 bits
+def _exact_sums(img, s):
+	if not (np.issubdtype(img.dtype, np.integer) or img.dtype == bool) or img.size == 0:
+		return False
+	v = max(abs(int(np.amin(img))), abs(int(np.amax(img))))
+	return (s * s * v)**2 < 2**62
+
+# Median of the s x s window around each pixel, with the precision of np.median
+def _local_median(img, s, method='auto'):
+	levels, idx = _quantize(img)
+	if method == 'auto':
+		method = _median_method(levels, s)
+
+	if method == 'histogram':
+		return _median_histogram(img, s, levels, idx)
+	return _median_sort(img, s)
+
+# Minimum or maximum in each s x s window, ignoring values outside the image
+def _window_extreme(img, s, func):
+	x, y = img.shape
+	r = s//2
+
+	# Pad with a value that never wins the comparison
+	if np.issubdtype(img.dtype, np.floating):
+		fill = np.inf if func is np.minimum else -np.inf
+	else:
+		info = np.iinfo(img.dtype)
+		fill = info.max if func is np.minimum else info.min
+	f_pad = np.pad(img, ((r, s - 1 - r), (r, s - 1 - r)), 'constant', constant_values=fill)
+
+	# Compare along columns, then along rows
+	tmp = f_pad[0:x, :].copy()
+	for u in range(1, s):
+		func(tmp, f_pad[u:u + x, :], out=tmp)
+	result = tmp[:, 0:y].copy()
+	for v in range(1, s):
+		func(result, tmp[:, v:v + y], out=result)
+
+	return result
+
 
 # Mean Filter
 ###############################################################################
 # INPUT
 # img:			Input image
 # s:		  	Shape of filter (default is 3x3)
-# ftype:		Filter type ('arithmetic' or 'geometric')
+# ftype:		Filter type ('arithmetic', 'geometric', 'harmonic' or 'contraharmonic')
+# method:		Filter method ('integral' or 'loop')
+# q:			Order of filter (only applies for contraharmonic filters)
+# eps:			Value used in place of zero pixels (only applies for
+#				geometric, harmonic and negative order contraharmonic filters)
 ###############################################################################
 # OUTPUT
-# result:		Output image
+# result:		Output image. For integer images the arithmetic mean is
+#				truncated as in the loop, the other means are rounded off.
 ###############################################################################
-def mean_filter(img, s=3, ftype='geometric'):
+@instrumented()
+def mean_filter(img, s=3, ftype='geometric', method='integral', q=1.5, eps=0):
+	if method == 'loop':
+		if ftype not in ('arithmetic', 'geometric'):
+			raise ValueError("Loop method only supports arithmetic and geometric filters")
+		return _mean_loop(img, s, ftype)
+	elif method != 'integral':
+		raise ValueError("Unknown mean method '%s'" % method)
+
+	# Initialize result image
+	result = np.zeros_like(img)
+
+	if ftype == 'arithmetic':
+		result[...], _ = _local_mean_var(img, s)
+		return result
+
+	# Zero pixels are replaced by eps. Zeros that remain are replaced by ones
+	# here, and the windows containing them are set to zero afterwards.
+	f = np.maximum(img.astype(np.float64), eps)
+	zero = f == 0
+	f[zero] = 1
+
+	count = _box_sum(np.ones(f.shape), s, np.float64)
+
+	if ftype == 'geometric':
+		# Get geometric mean value as the exponent of the mean logarithm
+		mean = np.exp(_box_sum(np.log(f), s, np.float64) / count)
+		zero = _box_sum(zero, s) > 0
+	elif ftype == 'harmonic':
+		# Get harmonic mean value
+		mean = count / _box_sum(1.0 / f, s, np.float64)
+		zero = _box_sum(zero, s) > 0
+	elif ftype == 'contraharmonic':
+		# Get contraharmonic mean value. Zeros only dominate for negative
+		# orders, otherwise only windows that are all zero have a zero mean.
+		if q >= 0:
+			f[zero] = 0
+			zero = _box_sum(~zero, s) == 0
+		else:
+			zero = _box_sum(zero, s) > 0
+		with np.errstate(divide='ignore', invalid='ignore'):
+			mean = _box_sum(f**(q + 1), s, np.float64) / _box_sum(f**q, s, np.float64)
+	else:
+		raise ValueError("Unknown mean filter type '%s'" % ftype)
+
+	mean[zero] = 0
+
+	# Round off to closest integer for integer images, the float means of
+	# constant windows can lie just below their value
+	if not np.issubdtype(result.dtype, np.floating):
+		mean = np.around(mean)
+	result[...] = mean
+
+	return result
+
+# Mean filter with a loop over every pixel
+def _mean_loop(img, s, ftype):
 	x, y = img.shape
 	# Initialize result image
 	result = np.zeros_like(img)
 
-	filter_edge = s/2
+	filter_edge = s//2
 
 	# Traverse through image
 	for i in range(0,x):
 		for j in range(0,y):
 
-		 	 if ftype == 'arithmetic':
- 				sum_values = 0
- 			 elif ftype=='geometric':
+			if ftype == 'arithmetic':
+				sum_values = 0
+			elif ftype=='geometric':
 				product_values = 1
 
-			 count = 0
-
-			 # Traverse through filter
-			 for u in range(s):
-				 for v in range(s):
-					 # Get current position
-					 cur_x = (i + u - filter_edge)
-					 cur_y = (j + v - filter_edge)
-
-					 # Stay inside image boundaries
-					 if((cur_x >= 0) and (cur_y >= 0) and (cur_x < x) and (cur_y < y)):
-					 	 if ftype == 'arithmetic':
- 							 # Get sum of values
- 							 sum_values += img[cur_x, cur_y]
-						 elif ftype=='geometric':
-							 # Get product of values
-							 product_values *= img[cur_x, cur_y]
-
-
-						 count+=1
-
-			 if ftype == 'arithmetic':
-				 # Get arithmetic mean value
-				 mean = sum_values/count
-			 elif ftype=='geometric':
-				 # Get geometric mean value
-				 mean = product_values**(1.0/count)
+			count = 0
+
+			# Traverse through filter
+			for u in range(s):
+				for v in range(s):
+					# Get current position
+					cur_x = (i + u - filter_edge)
+					cur_y = (j + v - filter_edge)
+
+					# Stay inside image boundaries
+					if((cur_x >= 0) and (cur_y >= 0) and (cur_x < x) and (cur_y < y)):
+						if ftype == 'arithmetic':
+							# Get sum of values
+							sum_values += img[cur_x, cur_y]
+						elif ftype=='geometric':
+							# Get product of values
+							product_values *= img[cur_x, cur_y]
+
+
+						count+=1
+
+			if ftype == 'arithmetic':
+				# Get arithmetic mean value
+				mean = sum_values/count
+			elif ftype=='geometric':
+				# Get geometric mean value
+				mean = product_values**(1.0/count)
 				#  print mean
 
-			 # Round off to closest integer
-			 result[i, j] = mean
+			# Round off to closest integer
+			result[i, j] = mean
 
 	return result
 
@@ -108,11 +507,59 @@ def mean_filter(img, s=3, ftype='geometric'):
 # INPUT
 # img:			Input image
 # s:		  	Shape of filter (default is 3x3)
+# method:		Median method ('auto', 'loop', 'sort' or 'histogram')
 ###############################################################################
 # OUTPUT
 # result:		Output image
 ###############################################################################
-def median_filter(img, s=3):
+@instrumented()
+def median_filter(img, s=3, method='auto'):
+	# Intensity levels are needed both to choose and to run the histogram method
+	if method in ('auto', 'histogram'):
+		levels, idx = _quantize(img)
+
+	if method == 'auto':
+		method = _median_method(levels, s)
+	report_backend(method)
+
+	if method == 'loop':
+		return _median_loop(img, s)
+
+	# Initialize result image
+	result = np.zeros_like(img)
+
+	if method == 'sort':
+		result[...] = _median_sort(img, s)
+	elif method == 'histogram':
+		if levels is None:
+			raise ValueError("Image has more than %d intensity levels" % MEDIAN_HISTOGRAM_LEVELS)
+		result[...] = _median_histogram(img, s, levels, idx)
+	else:
+		raise ValueError("Unknown median method '%s'" % method)
+
+	return result
+
+# Select median method
+###############################################################################
+# INPUT
+# img:			Input image
+# s:		  	Shape of filter
+###############################################################################
+# OUTPUT
+# method:		Method used by median_filter for this image and filter size
+###############################################################################
+def median_method(img, s):
+	return _median_method(_quantize(img)[0], s)
+
+def _median_method(levels, s):
+	# The histogram method makes one pass per intensity level regardless of
+	# filter size, while sorting costs about one pass per window value
+	if levels is not None and len(levels) <= MEDIAN_LEVELS_PER_VALUE * s * s:
+		return 'histogram'
+	return 'sort'
+
+# Median with a loop over every pixel
+def _median_loop(img, s):
 
 	x, y = img.shape
 	# Initialize result image
@@ -122,30 +569,141 @@ def median_filter(img, s=3):
 	for i in range(0, x):
 		for j in range(0, y):
 
-			 # Create new filter list
-			 filtr = []
-			 filter_edge = s/2
+			# Create new filter list
+			filtr = []
+			filter_edge = s//2
+
+			# Traverse through filter
+			for u in range(s):
+				for v in range(s):
+					# Get current position
+					cur_x = (i + u - filter_edge)
+					cur_y = (j + v - filter_edge)
+
+					# Stay inside image boundaries
+					if((cur_x >= 0) and (cur_y >= 0) and (cur_x < x) and (cur_y < y)):
+						# Append value to filter list
+						filtr.append(img[cur_x, cur_y])
 
-			 # Traverse through filter
-			 for u in range(s):
-				 for v in range(s):
-					 # Get current position
-					 cur_x = (i + u - filter_edge)
-					 cur_y = (j + v - filter_edge)
+			# Convert filter list to numpy array
+			filtr = np.asarray(filtr)
+			# Output median value in filter region
+			result[i, j] = np.median(filtr)
 
-					 # Stay inside image boundaries
-					 if((cur_x >= 0) and (cur_y >= 0) and (cur_x < x) and (cur_y < y)):
-						 # Append value to filter list
-						 filtr.append(img[cur_x, cur_y])
+	return result
+
+# Median by sorting all windows at once
+def _median_sort(img, s):
+	x, y = img.shape
+	r = s//2
+
+	# Medians have the precision that np.median gives
+	result = np.zeros((x, y), dtype=_median_dtype(img))
 
-			 # Convert filter list to numpy array
-			 filtr = np.asarray(filtr)
-			 # Output median value in filter region
-			 result[i, j] = np.median(filtr)
+	# Windows that lie fully inside the image have the same number of values
+	# and can be handed to np.median directly, a block of rows at a time
+	interior = _sliding_windows(img, s)
+	rows = max(1, WINDOW_BLOCK_SIZE // max(1, interior.shape[1] * s * s))
+	for i in range(0, interior.shape[0], rows):
+		block = interior[i:i + rows]
+		result[r + i:r + i + block.shape[0], r:r + block.shape[1]] = np.median(block.reshape(block.shape[:2] + (s*s,)), axis=2)
+
+	# Windows crossing the border only use values inside the image
+	rows, cols = _border_pixels(x, y, s)
+	if len(rows) > 0:
+		_, result[rows, cols], _ = _window_stats(img, s, rows, cols)
 
 	return result
 
+# Median by counting window values at or below each intensity level
+def _median_histogram(img, s, levels, idx):
+	x, y = img.shape
+
+	# Number of values in each window and the ranks of the two middle values
+	count = _box_sum(np.ones((x, y), dtype=np.uint8), s)
+	rank_lo = (count - 1)//2
+	rank_hi = count//2
+
+	# The value at rank k is the number of levels with at most k window values
+	# at or below it
+	below = np.zeros_like(count)
+	lo = np.zeros_like(count)
+	hi = np.zeros_like(count)
+	for level in range(len(levels) - 1):
+		below += _box_sum(idx == level, s)
+		lo += below <= rank_lo
+		hi += below <= rank_hi
+
+	# Median is the mean of the two middle values
+	return _middle_mean(levels[lo], levels[hi])
+
+# Data type of np.median for an image
+def _median_dtype(img):
+	if np.issubdtype(img.dtype, np.floating):
+		return img.dtype
+	return np.float64
+
+# Mean of the two middle values, with the same precision as np.median
+def _middle_mean(lo, hi):
+	lo = lo.astype(_median_dtype(lo))
+	return (lo + hi) / 2
+
+# Minimum, median and maximum of the s x s windows around the given pixels,
+# ignoring the values outside the image
+def _window_stats(img, s, rows, cols):
+	r = s//2
+	dtype = _median_dtype(img)
+
+	z_min = np.empty(len(rows), dtype=dtype)
+	z_med = np.empty(len(rows), dtype=dtype)
+	z_max = np.empty(len(rows), dtype=dtype)
+
+	# Pad with NaN, which sorts after all other values
+	f_pad = np.pad(img.astype(dtype), ((r, s - 1 - r), (r, s - 1 - r)), 'constant', constant_values=np.nan)
+	all_windows = _sliding_windows(f_pad, s)
+
+	# Sort the windows of a block of pixels at a time
+	block = max(1, WINDOW_BLOCK_SIZE // (s*s))
+	for i in range(0, len(rows), block):
+		windows = all_windows[rows[i:i + block], cols[i:i + block]].reshape(-1, s*s)
+		windows.sort(axis=1)
+
+		# Pick the two middle values among the values inside the image
+		count = np.sum(~np.isnan(windows), axis=1)
+		k = np.arange(len(windows))
+		z_min[i:i + block] = windows[:, 0]
+		z_med[i:i + block] = _middle_mean(windows[k, (count - 1)//2], windows[k, count//2])
+		z_max[i:i + block] = windows[k, count - 1]
+
+	return z_min, z_med, z_max
+
+# Max Filter
+###############################################################################
+# INPUT
+# img:			Input image
+# s:		  	Shape of filter (default is 3x3)
+###############################################################################
+# OUTPUT
+# result:		Output image
+###############################################################################
+@instrumented()
+def max_filter(img, s=3):
+	# Output maximum value in filter region, only using pixels inside the image
+	return _window_extreme(img, s, np.maximum)
 
+# Min Filter
+###############################################################################
+# INPUT
+# img:			Input image
+# s:		  	Shape of filter (default is 3x3)
+###############################################################################
+# OUTPUT
+# result:		Output image
+###############################################################################
+@instrumented()
+def min_filter(img, s=3):
+	# Output minimum value in filter region, only using pixels inside the image
+	return _window_extreme(img, s, np.minimum)
 
 # Adaptive Median Filter
 ###############################################################################
@@ -153,11 +711,74 @@ def median_filter(img, s=3):
 # img:			Input image
 # s:		  	Start shape of filter (default is 3x3)
 # s_max:		Maximum shape of filter (default is 7x7)
+# method:		Filter method ('vectorized' or 'loop')
 ###############################################################################
 # OUTPUT
 # result:		Output image
 ###############################################################################
-def adaptive_median_filter(img, s=3, s_max=7):
+@instrumented()
+def adaptive_median_filter(img, s=3, s_max=7, method='vectorized'):
+	if s > s_max:
+		raise ValueError("Start shape of filter is larger than maximum shape")
+
+	if method == 'loop':
+		return _adaptive_median_loop(img, s, s_max)
+	elif method != 'vectorized':
+		raise ValueError("Unknown adaptive median method '%s'" % method)
+
+	x, y = img.shape
+	# Initialize result image
+	result = np.zeros_like(img)
+
+	# Minimum and maximum of the starting windows for the whole image
+	z_min = _window_extreme(img, s, np.minimum)
+	z_max = _window_extreme(img, s, np.maximum)
+
+	# Median of the starting windows for the whole image
+	z_med = _local_median(img, s)
+
+	# Pixels that have not yet been given an output value
+	rows, cols = np.nonzero(np.ones((x, y), dtype=bool))
+	z_min_cur = z_min.ravel()
+	z_med_cur = z_med.ravel()
+	z_max_cur = z_max.ravel()
+
+	s_cur = s
+	while True:
+		z_xy = img[rows, cols]
+
+		# If z_med is not an impulse: output z_xy if it is not an impulse
+		# either, else output z_med
+		stage_a = (z_min_cur < z_med_cur) & (z_med_cur < z_max_cur)
+		stage_b = (z_min_cur < z_xy) & (z_xy < z_max_cur)
+		result[rows[stage_a], cols[stage_a]] = np.where(stage_b[stage_a], z_xy[stage_a], z_med_cur[stage_a])
+
+		# Output median value if maximum window size has been surpassed
+		if s_cur + 2 > s_max:
+			result[rows[~stage_a], cols[~stage_a]] = z_med_cur[~stage_a]
+			break
+
+		# Increase window size for the remaining pixels. A window two pixels
+		# larger is the union of the smaller windows around its centre
+		# 3 x 3 neighbourhood, so the minimum and maximum are updated for the
+		# whole image and the median is only computed where it is needed.
+		s_cur += 2
+		z_min = _window_extreme(z_min, 3, np.minimum)
+		z_max = _window_extreme(z_max, 3, np.maximum)
+
+		rows = rows[~stage_a]
+		cols = cols[~stage_a]
+		if len(rows) == 0:
+			break
+
+		z_min_cur = z_min[rows, cols]
+		z_max_cur = z_max[rows, cols]
+		_, z_med_cur, _ = _window_stats(img, s_cur, rows, cols)
+
+	return result
+
+# Adaptive median with a loop over every pixel
+def _adaptive_median_loop(img, s, s_max):
 
 	x, y = img.shape
 	# Initialize result image
@@ -166,54 +787,54 @@ def adaptive_median_filter(img, s=3, s_max=7):
 	# Traverse through image
 	for i in range(0, x):
 		for j in range(0, y):
-			 # Set current filter size to starting filter size
-			 s_cur = s
-			 # While current filter size is smaller or equal to maximum filter size
-			 while s_cur <= s_max:
-				 # Create new filter list
-				 filtr = []
-
-				 filter_edge = s_cur/2
-
-				 # Traverse through filter
-				 for u in range(s_cur):
-					 for v in range(s_cur):
-						 # Get current position
-						 cur_x = (i + u - filter_edge)
-						 cur_y = (j + v - filter_edge)
-
-						 # Stay inside image boundaries
-						 if((cur_x >= 0) and (cur_y >= 0) and (cur_x < x) and (cur_y < y)):
-							 # Append value to filter list
-							 filtr.append(img[cur_x, cur_y])
-
-							 # Get value in center of filter region
-							 if cur_x == i and cur_y == j:
-								 z_xy = filtr[-1]
-
-				 # Convert filter list to numpy array
-				 filtr = np.asarray(filtr)
-				 # Get minimum value in filter region
-				 z_min = np.amin(filtr)
-				 # Get maximum value in filter region
-				 z_max = np.amax(filtr)
-				 # Get median value in filter region
-				 z_med = np.median(filtr)
-
-				 # If z_med is not an impulse: check next case. else: increase window size
-				 if z_min < z_med < z_max:
-					 # If z_xy is not an impulse: output z_xy. else: output z_med
-					 if z_min < z_xy < z_max:
-						 result[i, j] = z_xy
-					 else:
-						 result[i, j] = z_med
-					 # Break to exit while loop
-					 break
-				 else:
-					 s_cur += 2
-
-			 else:
-				 result[i, j] = z_med # Output median value if maximum window size has been surpassed
+			# Set current filter size to starting filter size
+			s_cur = s
+			# While current filter size is smaller or equal to maximum filter size
+			while s_cur <= s_max:
+				# Create new filter list
+				filtr = []
+
+				filter_edge = s_cur//2
+
+				# Traverse through filter
+				for u in range(s_cur):
+					for v in range(s_cur):
+						# Get current position
+						cur_x = (i + u - filter_edge)
+						cur_y = (j + v - filter_edge)
+
+						# Stay inside image boundaries
+						if((cur_x >= 0) and (cur_y >= 0) and (cur_x < x) and (cur_y < y)):
+							# Append value to filter list
+							filtr.append(img[cur_x, cur_y])
+
+							# Get value in center of filter region
+							if cur_x == i and cur_y == j:
+								z_xy = filtr[-1]
+
+				# Convert filter list to numpy array
+				filtr = np.asarray(filtr)
+				# Get minimum value in filter region
+				z_min = np.amin(filtr)
+				# Get maximum value in filter region
+				z_max = np.amax(filtr)
+				# Get median value in filter region
+				z_med = np.median(filtr)
+
+				# If z_med is not an impulse: check next case. else: increase window size
+				if z_min < z_med < z_max:
+					# If z_xy is not an impulse: output z_xy. else: output z_med
+					if z_min < z_xy < z_max:
+						result[i, j] = z_xy
+					else:
+						result[i, j] = z_med
+					# Break to exit while loop
+					break
+				else:
+					s_cur += 2
+
+			else:
+				result[i, j] = z_med # Output median value if maximum window size has been surpassed
 
 	return result
 
@@ -223,50 +844,74 @@ def adaptive_median_filter(img, s=3, s_max=7):
 # img:			Input image
 # var_g:		Estimate of overall noise variance in image
 # s:			Shape of filter (default is 3x3)
+# method:		Filter method ('integral' or 'loop')
 ###############################################################################
 # OUTPUT
 # result:		Output image
 ###############################################################################
-def adaptive_lnr_filter(img, var_g, s=3):
+@instrumented()
+def adaptive_lnr_filter(img, var_g, s=3, method='integral'):
+	if method == 'loop':
+		return _adaptive_lnr_loop(img, var_g, s)
+	elif method != 'integral':
+		raise ValueError("Unknown adaptive local noise reduction method '%s'" % method)
+
+	# Initialize result image
+	result = np.zeros_like(img)
+
+	# Get local mean and variance for every pixel
+	mean_l, var_l = _local_mean_var(img, s)
+
+	# If local variance is smaller than global variance, set ratio to 1
+	with np.errstate(divide='ignore', invalid='ignore'):
+		r = np.where(var_g <= var_l, var_g / var_l, 1.0)
+
+	# Get the output value
+	result[...] = img - (r * (img - mean_l))
+
+	return result
+
+# Adaptive local noise reduction with a loop over every pixel
+def _adaptive_lnr_loop(img, var_g, s):
 
 	x, y = img.shape
 	# Initialize result image
 	result = np.zeros_like(img)
 
-	filter_edge = s/2
+	filter_edge = s//2
 
 	# Traverse through image
 	for i in range(0,x):
 		for j in range(0,y):
-			 # Create new filter list
-			 filtr = []
-
-			 # Traverse through filter
-			 for u in range(s):
-				 for v in range(s):
-					 # Get current position
-					 cur_x = (i + u - filter_edge)
-					 cur_y = (j + v - filter_edge)
-
-					 # Stay inside image boundaries
-					 if((cur_x >= 0) and (cur_y >= 0) and (cur_x < x) and (cur_y < y)):
-						 # Append value to filter list
-						 filtr.append(img[cur_x, cur_y])
-
-			 # Convert filter list to numpy array
-			 filtr = np.array(filtr)
-			 # Get local mean from filter
-			 mean_l = np.mean(filtr)
-			 # Get local variance from filter
-			 var_l = np.var(filtr)
-
-			 # If local variance is smaller than global variance, set ratio to 1
-			 if var_g <= var_l:
-				 r = var_g / var_l
-			 else:
-				 r = 1
-
-			 # Get the output value and round off to nearest integer
-			 result[i, j] = img[i, j] - (r * (img[i, j] - mean_l))
+			# Create new filter list
+			filtr = []
+
+			# Traverse through filter
+			for u in range(s):
+				for v in range(s):
+					# Get current position
+					cur_x = (i + u - filter_edge)
+					cur_y = (j + v - filter_edge)
+
+					# Stay inside image boundaries
+					if((cur_x >= 0) and (cur_y >= 0) and (cur_x < x) and (cur_y < y)):
+						# Append value to filter list
+						filtr.append(img[cur_x, cur_y])
+
+			# Convert filter list to numpy array
+			filtr = np.array(filtr)
+			# Get local mean from filter
+			mean_l = np.mean(filtr)
+			# Get local variance from filter
+			var_l = np.var(filtr)
+
+			# If local variance is smaller than global variance, set ratio to 1
+			if var_g <= var_l:
+				r = var_g / var_l
+			else:
+				r = 1
+
+			# Get the output value and round off to nearest integer
+			result[i, j] = img[i, j] - (r * (img[i, j] - mean_l))
 
 	return result
@@ -0,0 +1,64 @@
+import os
+
+import numpy as np
+
+from batch import RECIPES, find_images, process_file, process_files
+from image_io import imread, imwrite
+
+def _write_images(directory, count):
+	rng = np.random.RandomState(0)
+	paths = []
+	for k in range(count):
+		path = os.path.join(directory, 'img%d.png' % k)
+		imwrite(path, rng.randint(0, 256, (40, 30 + k)).astype(np.uint8))
+		paths.append(path)
+	return paths
+
+def test_find_images(tmp_path):
+	paths = _write_images(str(tmp_path), 3)
+	(tmp_path / 'notes.txt').write_text('not an image')
+	assert find_images([str(tmp_path)]) == paths
+	assert find_images([str(tmp_path / 'img*.png'), paths[0]]) == paths
+
+def test_process_files_serial_and_parallel(tmp_path):
+	paths = _write_images(str(tmp_path), 3)
+	for workers in (1, 2):
+		output = str(tmp_path / ('out%d' % workers))
+		results, stats = process_files(paths, '3E', output, workers=workers, verbose=False)
+		assert [r['path'] for r in results] == paths
+		assert stats['files'] == 3 and stats['failed'] == 0
+		assert stats['pixels'] == sum(40 * (30 + k) for k in range(3))
+		for result in results:
+			assert result['error'] is None
+			assert [os.path.basename(p) for p in result['outputs']] == [
+				os.path.basename(result['path'])[:-4] + '_3E_%s.png' % name for name in ('adaptive_median', 'median')]
+
+	# Both runs write the same images
+	for name in os.listdir(str(tmp_path / 'out1')):
+		assert np.array_equal(imread(str(tmp_path / 'out1' / name)), imread(str(tmp_path / 'out2' / name)))
+
+def test_process_file_errors(tmp_path):
+	path = str(tmp_path / 'broken.png')
+	with open(path, 'wb') as f:
+		f.write(b'not a png')
+	result = process_file(path, '1B', str(tmp_path))
+	assert result['error'] is not None and result['outputs'] == []
+
+	rgb = str(tmp_path / 'rgb.png')
+	imwrite(rgb, np.zeros((8, 8, 3), dtype=np.uint8))
+	results, stats = process_files([rgb, _write_images(str(tmp_path), 1)[0]], '1B', str(tmp_path / 'out'), workers=1, verbose=False)
+	assert 'grayscale' in results[0]['error']
+	assert stats['failed'] == 1 and results[1]['error'] is None
+
+def test_recipes_write_uint8(tmp_path):
+	path = _write_images(str(tmp_path), 1)[0]
+	for recipe in sorted(RECIPES):
+		result = process_file(path, recipe, str(tmp_path), ext='.npy')
+		assert result['error'] is None, (recipe, result['error'])
+		for out in result['outputs']:
+			img = np.load(out)
+			assert img.dtype == np.uint8 and img.shape == (40, 30)
+
+	result = process_file(path, '3B', str(tmp_path), plots=True)
+	assert result['error'] is None
+	assert result['outputs'][-1].endswith('img0_3B_plot.png') and os.path.exists(result['outputs'][-1])
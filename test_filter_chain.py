@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from freq_filters import filter_image_freq, transfer_function, power_spectrum
+from filter_chain import FilterChain, filter_chains
+
+LOWPASS = {'fclass': 'lowpass', 'ftype': 'butterworth', 'd0': 12, 'n': 2}
+NOTCH = {'fclass': 'notchreject', 'ftype': 'gaussian', 'd0': 4, 'u_k': 9, 'v_k': 7}
+
+def _freq(img, mode='complex', **params):
+	return filter_image_freq(img, mode=mode, spectrum=False, transfer=False, **params)[0]
+
+def test_single_stage_is_filter_image_freq():
+	img = np.random.RandomState(0).rand(30, 40)
+	for mode in ('complex', 'real'):
+		for params in (LOWPASS, NOTCH):
+			assert np.array_equal(FilterChain([params], mode=mode)(img), _freq(img, mode, **params))
+
+def test_fused_stages_are_product_filter():
+	img = np.random.RandomState(1).rand(30, 40)
+	chain = FilterChain([LOWPASS, NOTCH])
+	assert len(chain.groups) == 1
+
+	# Double padding to 60 x 80, filtered with the product of both filters
+	H = transfer_function((60, 80), **LOWPASS) * transfer_function((60, 80), **NOTCH)
+	assert np.allclose(chain.transfer(img.shape), np.abs(H), rtol=1e-14, atol=0)
+	padded = np.zeros((60, 80))
+	padded[:30, :40] = img
+	G = np.abs(np.fft.ifft2(np.fft.fft2(padded) * np.fft.ifftshift(H)))[:30, :40]
+	assert np.allclose(chain(img), G, rtol=0, atol=1e-12)
+
+def test_spatial_stages_split_groups():
+	img = np.random.RandomState(2).rand(30, 40)
+	square = lambda f: f * f
+	chain = FilterChain([LOWPASS, square, NOTCH])
+	assert len(chain.groups) == 3
+	assert np.array_equal(chain(img), _freq(square(_freq(img, **LOWPASS)), **NOTCH))
+	with pytest.raises(ValueError):
+		FilterChain([LOWPASS], mode='hartley')
+
+def test_filter_chains_share_transform():
+	img = np.random.RandomState(3).rand(30, 40)
+	chains = [FilterChain([LOWPASS]), FilterChain([NOTCH]), FilterChain([LOWPASS, NOTCH]), FilterChain([NOTCH], mode='real')]
+	G, P = filter_chains(img, chains, spectrum=True)
+	for g, chain in zip(G, chains):
+		assert np.array_equal(g, chain(img))
+	assert np.allclose(P, power_spectrum(img), rtol=1e-12, atol=0)
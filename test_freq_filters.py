@@ -0,0 +1,14 @@
+import warnings
+
+import numpy as np
+
+import freq_filters
+
+def test_find_noise_peaks_noiseless_pattern():
+	u, v = np.meshgrid(np.arange(128), np.arange(128), indexing='ij')
+	for (a, b), expected in (((0, 16), (0, 32)), ((16, 24), (32, 48))):
+		img = 0.5 + 0.2 * np.sin(2 * np.pi * (a * u + b * v) / 128)
+		with warnings.catch_warnings():
+			warnings.simplefilter('error')
+			notches = freq_filters.find_noise_peaks(img)
+		assert notches[0][:2] == expected
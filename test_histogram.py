@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from histogram import histogram, equalization_lut, equalize_histogram, clahe, specify_histogram, match_histogram, apply_lut
+
+# Equalization of 1B, with the cumulative sum and the mapping as loops
+def _equalize_loop(img, levels):
+	n = np.bincount(img.ravel(), minlength=levels).astype(np.float64)
+	s = np.zeros_like(n)
+	su = 0
+	for j in range(levels):
+		su += n[j]
+		s[j] = su
+	s = np.around(s * (levels - 1) / img.size)
+
+	img_eq = np.zeros_like(img)
+	for i in range(img.shape[0]):
+		for j in range(img.shape[1]):
+			img_eq[i, j] = s[img[i, j]]
+	return img_eq
+
+def test_equalize_matches_loop():
+	rng = np.random.RandomState(0)
+	img = rng.randint(90, 140, (37, 41)).astype(np.uint8)
+	assert np.array_equal(equalize_histogram(img), _equalize_loop(img, 256))
+
+	img16 = rng.randint(0, 4096, (20, 30)).astype(np.uint16)
+	assert np.array_equal(equalize_histogram(img16, 4096), _equalize_loop(img16, 4096))
+
+def test_equalize_stack_per_image():
+	rng = np.random.RandomState(1)
+	stack = np.stack([rng.randint(0, 64, (15, 17)), rng.randint(100, 250, (15, 17))]).astype(np.uint8)
+	assert np.array_equal(histogram(stack)[1], histogram(stack[1]))
+	lut = equalization_lut(stack)
+	assert lut.shape == (2, 256)
+	for k in range(2):
+		assert np.array_equal(lut[k], equalization_lut(stack[k]))
+		assert np.array_equal(equalize_histogram(stack)[k], equalize_histogram(stack[k]))
+
+def test_apply_lut():
+	img = np.arange(256, dtype=np.uint8).reshape(16, 16)
+	lut = (255 - np.arange(256)).astype(np.uint8)
+	assert np.array_equal(apply_lut(img, lut), 255 - img)
+	with pytest.raises(ValueError):
+		apply_lut(img.astype(np.int32), lut)
+	with pytest.raises(ValueError):
+		apply_lut(img, lut[:100])
+
+def test_specify_and_match_histogram():
+	rng = np.random.RandomState(2)
+	img = rng.randint(0, 256, (64, 64)).astype(np.uint8)
+
+	# A flat histogram leaves an evenly distributed image almost unchanged,
+	# and all mass at one level maps every pixel to it
+	assert np.abs(specify_histogram(img, np.ones(256)).astype(int) - img).max() <= 4
+	hist = np.zeros(256)
+	hist[77] = 1
+	assert np.all(specify_histogram(img, hist) == 77)
+
+	# Matching an image to itself only moves levels that the rounded tables
+	# merge down to the first of them, and matching to a dark reference makes
+	# it dark
+	matched = match_histogram(img, img)
+	assert np.all(matched <= img) and np.all(matched >= img.astype(int) - 1)
+	dark = rng.randint(0, 50, (30, 30)).astype(np.uint8)
+	assert match_histogram(img, dark).max() <= 49
+	with pytest.raises(ValueError):
+		match_histogram(img, dark.astype(np.uint16))
+
+def test_clahe_one_tile_is_equalization():
+	rng = np.random.RandomState(3)
+	img = rng.randint(90, 140, (37, 41)).astype(np.uint8)
+	assert np.array_equal(clahe(img, tiles=(1, 1), clip_limit=1e9), equalize_histogram(img))
+
+	img16 = rng.randint(0, 4096, (40, 30)).astype(np.uint16)
+	assert np.array_equal(clahe(img16, tiles=(1, 1), clip_limit=1e9, levels=4096), equalize_histogram(img16, 4096))
+
+def test_clahe_small_images():
+	# Tiles are reduced to at least 8 x 8 pixels, a 5 x 7 image is one tile
+	img = np.arange(35, dtype=np.uint8).reshape(5, 7) * 3 + 60
+	assert np.array_equal(clahe(img), clahe(img, tiles=(1, 1)))
+	assert len(np.unique(clahe(img))) == 35
+	assert np.array_equal(clahe(np.tile(img, (4, 4))), clahe(np.tile(img, (4, 4)), tiles=(2, 3)))
+	with pytest.raises(ValueError):
+		clahe(img, tiles=(0, 2))
+
+def test_clahe_stretches_narrow_histogram():
+	rng = np.random.RandomState(4)
+	img = (rng.rand(128, 128) * 48 + 91).astype(np.uint8)
+	g = clahe(img)
+	assert g.min() < 40 and g.max() > 215
+	f = clahe(img / 255.0)
+	assert f.dtype == np.float64
+	assert np.abs(f * 255 - g).max() <= 0.5 + 1e-9
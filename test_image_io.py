@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from image_io import imread, imwrite, convert_dtype, LazyImage, _tiff_layout
+from scaling_functions import im2uint8
+
+def test_tiff_memory_mapped(tmp_path):
+	img = np.arange(12 * 7, dtype=np.uint16).reshape(12, 7)
+	path = str(tmp_path / 'img.tif')
+	imwrite(path, img)
+	assert _tiff_layout(path) is not None
+	assert np.array_equal(imread(path), img)
+
+def test_tiff_photometric_falls_back_to_pil(tmp_path):
+	img = np.arange(256, dtype=np.uint8).reshape(16, 16)
+	# Palette images are read as RGB colors instead of indices
+	path = str(tmp_path / 'palette.tif')
+	im = Image.fromarray(img).convert('P')
+	im.save(path)
+	assert _tiff_layout(path) is None
+	assert np.array_equal(imread(path), np.array(im.convert('RGB')))
+
+	# WhiteIsZero images are inverted, as PIL shows them. The photometric tag
+	# (262, short, one value) written by imwrite is set to 0.
+	path = str(tmp_path / 'white_is_zero.tif')
+	imwrite(path, img)
+	with open(path, 'r+b') as f:
+		data = bytearray(f.read())
+		k = data.index(bytes([6, 1, 3, 0, 1, 0, 0, 0, 1]))
+		data[k + 8] = 0
+		f.seek(0)
+		f.write(data)
+	assert _tiff_layout(path) is None
+	assert np.array_equal(imread(path), 255 - img)
+
+def test_convert_dtype_scales(tmp_path):
+	img = np.array([[0, 1, 128, 257], [32896, 65280, 65534, 65535]], dtype=np.uint16)
+	path = str(tmp_path / 'img.tif')
+	imwrite(path, img)
+	expected = np.array([[0, 0, 0, 1], [128, 254, 255, 255]], dtype=np.uint8)
+	assert np.array_equal(imread(path, np.uint8), expected)
+	assert np.array_equal(LazyImage(path, np.uint8)[1:], expected[1:])
+	assert np.array_equal(np.asarray(LazyImage(path, np.uint8)), expected)
+
+	img8 = np.arange(256, dtype=np.uint8)
+	assert np.array_equal(convert_dtype(img8, np.uint16), img8.astype(np.uint16) * 257)
+	assert np.array_equal(convert_dtype(convert_dtype(img8, np.float32), np.uint8), img8)
+	assert np.array_equal(convert_dtype(convert_dtype(img8, np.int64), np.uint8), img8)
+
+	f = np.linspace(-0.5, 1.5, 101)
+	assert np.array_equal(convert_dtype(f, np.uint8), im2uint8(f))
+	assert np.array_equal(convert_dtype(np.array([-1.0, 2.0]), np.int64), [-2**63, 2**63 - 1024])
+	assert np.array_equal(convert_dtype(np.array([True, False]), np.uint8), [255, 0])
+
+	with pytest.raises(ValueError):
+		convert_dtype(np.zeros(3, dtype=np.complex64), np.uint8)
+	with pytest.raises(ValueError):
+		convert_dtype(img8, bool)
@@ -0,0 +1,35 @@
+import numpy as np
+
+import instrumentation
+import spatial_filters
+from scaling_functions import im2double
+
+def test_records_chosen_backend(monkeypatch):
+	calls = []
+	separable_kernel = spatial_filters.separable_kernel
+	monkeypatch.setattr(spatial_filters, 'separable_kernel', lambda w: calls.append(w) or separable_kernel(w))
+
+	img = np.random.RandomState(0).randint(0, 256, (40, 40)).astype(np.uint8)
+	spatial_filters.spatial_convolution2d(img.astype(np.float64), np.ones((9, 9)))
+	unrecorded = len(calls)
+	with instrumentation.recording():
+		spatial_filters.spatial_convolution2d(img.astype(np.float64), np.ones((9, 9)))
+		spatial_filters.spatial_convolution2d(img, np.ones((9, 9)))
+		spatial_filters.median_filter(img // 64, 3)
+		spatial_filters.median_filter(img, 3, 'sort')
+		im2double(img, np.float32)
+	summary = instrumentation.summary()
+
+	# Recording does not decompose the filter again to name the backend
+	assert len(calls) == 2 * unrecorded
+	assert summary['spatial_filters.spatial_convolution2d[separable]']['calls'] == 1
+	assert summary['spatial_filters.spatial_convolution2d[direct]']['calls'] == 1
+	assert summary['spatial_filters.median_filter[histogram]']['calls'] == 1
+	assert summary['spatial_filters.median_filter[sort]']['calls'] == 1
+	assert summary['scaling_functions.im2double[float32]']['pixels'] == img.size
+
+def test_disabled_records_nothing():
+	instrumentation.reset()
+	spatial_filters.median_filter(np.zeros((8, 8)), 3)
+	instrumentation.report_backend('ignored')
+	assert instrumentation.summary() == {}
@@ -0,0 +1,17 @@
+import numpy as np
+
+import parallel
+from spatial_filters import mean_filter, median_filter, adaptive_lnr_filter
+
+def test_filter_parallel_integer_identical(monkeypatch):
+	monkeypatch.setattr(parallel, 'PARALLEL_MIN_PIXELS', 0)
+	rng = np.random.RandomState(0)
+	img = rng.randint(0, 256, (70, 53)).astype(np.uint8)
+	for func, args in ((mean_filter, (5, 'arithmetic')), (adaptive_lnr_filter, (100.0, 5)), (median_filter, (5,))):
+		assert np.array_equal(parallel.filter_parallel(img, func, 2, args, workers=2, strips=5), func(img, *args))
+
+def test_filter_parallel_float_identical(monkeypatch):
+	monkeypatch.setattr(parallel, 'PARALLEL_MIN_PIXELS', 0)
+	img = np.random.RandomState(0).rand(70, 53)
+	for func, args in ((mean_filter, (5, 'arithmetic')), (mean_filter, (5, 'harmonic')), (adaptive_lnr_filter, (0.01, 5))):
+		assert np.array_equal(parallel.filter_parallel(img, func, 2, args, workers=2, strips=5), func(img, *args))
@@ -0,0 +1,19 @@
+import numpy as np
+
+from scaling_functions import im2double, im2uint8
+
+def test_im2double_matches_float64_formula():
+    img = np.random.RandomState(0).randint(3, 250, (40, 30)).astype(np.uint8)
+    expected = (img.astype(np.float64) - img.min()) / (float(img.max()) - float(img.min()))
+    assert np.array_equal(im2double(img), expected)
+    assert np.array_equal(im2double(img, np.float32), expected.astype(np.float32))
+
+    out = np.empty(img.shape, dtype=np.float32)
+    assert im2double(img, np.float32, out) is out
+    assert np.array_equal(im2double(np.full((4, 4), 7, dtype=np.uint8)), np.zeros((4, 4)))
+
+def test_im2uint8_round_trip():
+    img = np.arange(256, dtype=np.uint8).reshape(16, 16)
+    for dtype in (np.float32, np.float64):
+        assert np.array_equal(im2uint8(im2double(img, dtype)), img)
+    assert np.array_equal(im2uint8(np.array([-0.5, 0.499 / 255, 0.501 / 255, 1.5])), [0, 0, 1, 255])
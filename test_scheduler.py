@@ -0,0 +1,55 @@
+import threading
+
+import numpy as np
+import pytest
+
+from freq_filters import filter_image_freq
+from scheduler import run_freq_jobs, STAGES
+
+def _reference(img, **params):
+	return filter_image_freq(img, spectrum=False, transfer=False, **params)[0]
+
+def test_run_freq_jobs_matches_filter_image_freq(tmp_path):
+	rng = np.random.RandomState(0)
+	imgs = [rng.rand(40 + k, 50) for k in range(5)]
+	path = str(tmp_path / 'img.npy')
+	np.save(path, imgs[0])
+	params = [{'fclass': 'lowpass', 'ftype': 'gaussian', 'd0': 10}, {'fclass': 'highpass', 'mode': 'real'},
+		{'fclass': 'notchreject', 'd0': 5, 'u_k': 8, 'v_k': 6}, {'padding': 'fast'}, {}]
+	jobs = [dict(p, img=img) for p, img in zip(params, imgs)]
+	jobs[0]['img'] = path
+	jobs[1]['img'] = lambda: imgs[1]
+
+	G, stats = run_freq_jobs(jobs, workers=2, queue_size=1)
+	assert len(G) == len(jobs)
+	for g, p, img in zip(G, params, imgs):
+		assert np.array_equal(g, _reference(img, **p))
+	assert all(stats[stage]['count'] == len(jobs) for stage in STAGES)
+	assert stats['wall'] > 0
+
+def test_run_freq_jobs_raises_job_errors():
+	threads = threading.active_count()
+	img = np.zeros((16, 16))
+	with pytest.raises(ValueError):
+		run_freq_jobs([{'img': img}, {'img': img, 'cutoff': 3}, {'img': img}], workers=2, queue_size=1)
+
+	def fail():
+		raise RuntimeError("cannot load")
+	with pytest.raises(RuntimeError):
+		run_freq_jobs([{'img': img}] * 10 + [{'img': fail}] + [{'img': img}] * 10, workers=2, queue_size=1)
+	assert threading.active_count() == threads
+
+def test_run_freq_jobs_raising_generator():
+	threads = threading.active_count()
+	def jobs():
+		for _ in range(3):
+			yield {'img': np.ones((16, 16))}
+		raise KeyError("no more images")
+	with pytest.raises(KeyError):
+		run_freq_jobs(jobs(), workers=2, queue_size=1)
+	assert threading.active_count() == threads
+
+def test_run_freq_jobs_no_jobs():
+	G, stats = run_freq_jobs(iter([]), workers=2)
+	assert G == []
+	assert all(stats[stage]['count'] == 0 for stage in STAGES)
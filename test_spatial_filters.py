@@ -0,0 +1,62 @@
+import numpy as np
+
+import spatial_filters
+
+def test_convolution_auto_integer_matches_loop():
+	rng = np.random.RandomState(0)
+	f = rng.randint(0, 256, (23, 19)).astype(np.int64)
+	for w in (np.ones((9, 9)), np.ones((5, 5)) / 25):
+		assert spatial_filters.convolution_method(w, dtype=f.dtype) == 'direct'
+		assert np.array_equal(spatial_filters.spatial_convolution2d(f, w), spatial_filters.spatial_convolution2d(f, w, 'loop'))
+
+def test_convolution_separable_fft_integer_rounds():
+	f = np.ones((20, 20), dtype=np.int64)
+	w = np.ones((9, 9))
+	for method in ('separable', 'fft'):
+		assert spatial_filters.spatial_convolution2d(f, w, method)[10, 10] == 81
+
+def test_median_method_crossover():
+	rng = np.random.RandomState(0)
+	img = rng.randint(0, 256, (64, 64)).astype(np.uint8)
+	img.flat[:256] = np.arange(256)
+	assert spatial_filters.median_method(img, 11) == 'sort'
+	assert spatial_filters.median_method(img, 15) == 'histogram'
+
+def test_adaptive_median_blocks(monkeypatch):
+	rng = np.random.RandomState(0)
+	img = rng.randint(0, 4, (30, 41)).astype(np.uint8) * 85
+	expected = spatial_filters.adaptive_median_filter(img, 3, 9, 'loop')
+	monkeypatch.setattr(spatial_filters, 'WINDOW_BLOCK_SIZE', 100)
+	assert np.array_equal(spatial_filters.adaptive_median_filter(img, 3, 9), expected)
+
+def test_mean_lnr_integer_match_loop():
+	rng = np.random.RandomState(0)
+	f = rng.randint(0, 256, (40, 37)).astype(np.int64)
+	for s in (3, 5):
+		assert np.array_equal(spatial_filters.mean_filter(f, s, 'arithmetic'), spatial_filters.mean_filter(f, s, 'arithmetic', 'loop'))
+		assert np.array_equal(spatial_filters.adaptive_lnr_filter(f, 100.0, s), spatial_filters.adaptive_lnr_filter(f, 100.0, s, 'loop'))
+
+def test_mean_nonfinite_only_affects_its_windows():
+	f = np.random.RandomState(0).rand(20, 20)
+	f[5, 5] = np.inf
+	f[10, 3] = np.nan
+	with np.errstate(invalid='ignore'):
+		result = spatial_filters.mean_filter(f, 3, 'arithmetic')
+	assert np.isinf(result).sum() == 9
+	assert np.isnan(result).sum() == 9
+	assert np.allclose(result[15:, :], spatial_filters.mean_filter(f[14:, :], 3, 'arithmetic')[1:])
+
+def test_mean_integer_constant_images():
+	for dtype in (np.uint8, np.int64):
+		for value in range(256):
+			img = np.full((6, 7), value, dtype=dtype)
+			for ftype in ('arithmetic', 'geometric', 'harmonic', 'contraharmonic'):
+				result = spatial_filters.mean_filter(img, 3, ftype)
+				assert result.dtype == dtype
+				assert np.all(result == value), (ftype, dtype, value)
+
+def test_mean_integer_rounds_geometric():
+	rng = np.random.RandomState(0)
+	f = rng.randint(1, 256, (30, 30)).astype(np.int64)
+	expected = np.around(spatial_filters.mean_filter(f.astype(np.float64), 3, 'geometric', 'loop'))
+	assert np.array_equal(spatial_filters.mean_filter(f, 3, 'geometric'), expected)
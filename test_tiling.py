@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+import spatial_filters
+from spatial_filters import mean_filter, median_filter, adaptive_lnr_filter
+from freq_filters import filter_image_freq
+from tiling import filter_tiled, filter_image_freq_tiled
+
+def test_filter_tiled_integer_identical():
+	rng = np.random.RandomState(0)
+	img = rng.randint(0, 256, (70, 53)).astype(np.uint8)
+	for s in (3, 5):
+		for func in (lambda f: mean_filter(f, s, 'arithmetic'),
+			lambda f: adaptive_lnr_filter(f, 100.0, s), lambda f: median_filter(f, s)):
+			assert np.array_equal(filter_tiled(img, func, s//2, tile=16), func(img))
+
+def test_filter_tiled_float_identical():
+	rng = np.random.RandomState(0)
+	for dtype in (np.float32, np.float64):
+		img = rng.rand(70, 53).astype(dtype)
+		for s in (3, spatial_filters.BOX_SUM_DIRECT_MAX):
+			for func in [lambda f, ftype=ftype: mean_filter(f, s, ftype) for ftype in ('arithmetic', 'geometric', 'harmonic', 'contraharmonic')] + [
+				lambda f: adaptive_lnr_filter(f, 0.01, s)]:
+				assert np.array_equal(filter_tiled(img, func, s//2, tile=16), func(img))
+
+def test_filter_tiled_float_large_windows_close():
+	img = np.random.RandomState(0).rand(70, 53)
+	s = spatial_filters.BOX_SUM_DIRECT_MAX + 2
+	for func in (lambda f: mean_filter(f, s, 'arithmetic'), lambda f: adaptive_lnr_filter(f, 0.01, s)):
+		assert np.allclose(filter_tiled(img, func, s//2, tile=16), func(img), rtol=1e-12, atol=0)
+
+def test_filter_image_freq_tiled_bounded_halo():
+	img = np.random.RandomState(0).rand(256, 256)
+	ref = filter_image_freq(img, 'lowpass', 'gaussian', 20, spectrum=False, transfer=False)[0]
+	assert np.abs(filter_image_freq_tiled(img, 'lowpass', 'gaussian', 20, tile=64) - ref).max() <= 1e-6 * img.max()
+
+	# The kernel of the ideal filter decays too slowly for halos of one tile
+	with pytest.raises(ValueError):
+		filter_image_freq_tiled(img, 'lowpass', 'ideal', 20, tile=64)
+	ref = filter_image_freq(img, 'lowpass', 'ideal', 20, spectrum=False, transfer=False)[0]
+	assert np.abs(filter_image_freq_tiled(img, 'lowpass', 'ideal', 20, tile=64, max_radius=256) - ref).max() <= 1e-6 * img.max()
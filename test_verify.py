@@ -0,0 +1,23 @@
+import pytest
+
+import verify
+
+NAMES = [check[0] for check in verify.image_checks()] + [check[0] for check in verify.builder_checks()]
+
+@pytest.fixture(scope='module')
+def images():
+	return verify.test_images()
+
+@pytest.mark.parametrize('name', NAMES)
+def test_matches_reference(name, images):
+	results = [r for r in verify.run_checks(images, [name]) if r['check'] == name]
+	assert results
+	failed = verify.failures(results)
+	assert not failed, '\n'.join('%(backend)s %(input)s %(dtype)s max_abs=%(max_abs)g max_ulp=%(max_ulp)g' % r for r in failed)
+
+def test_verify_frames():
+	import numpy as np
+	frames = [np.random.RandomState(k).rand(70, 90) for k in range(4)]
+	results = verify.verify_frames(frames, rate=1.0, names=['median_filter/s=3'], seed=0)
+	assert len(results) == 4 * 3 * len(verify.DTYPES)
+	assert not verify.failures(results)
@@ -0,0 +1,165 @@
+import numpy as np
+
+from freq_filters import spatial_kernel, next_fast_len
+from image_io import imread
+
+# Default shape of the tiles processed at a time
+TILE_SIZE = 1024
+
+# Filter Image in Tiles
+###############################################################################
+# INPUT
+# src:			Input image, as an array, a memory-mapped array, a LazyImage or
+#				the path of an image file (.npy and uncompressed TIFF files
+#				are memory-mapped)
+# func:			Filter applied to each tile, taking and returning an image of
+#				the same shape, e.g. lambda f: median_filter(f, 5)
+# halo:			Number of pixels around a tile that the filter reads, as a
+#				number or a pair (s//2 for an s x s filter window)
+# out:			Output image, as an array, a memory-mapped array or the path
+#				of a .npy file which is created (default is a new array)
+# tile:			Shape of the tiles, as a number or a pair
+###############################################################################
+# OUTPUT
+# out:			Filtered image, identical to func(src) for filters that only
+#				read pixels within the halo. The one exception are float
+#				images filtered by mean_filter or adaptive_lnr_filter with
+#				windows larger than BOX_SUM_DIRECT_MAX, whose cumulative
+#				window sums start at the tile and are only equal up to
+#				rounding (about 1e-12 relative for s=11 on 1000 x 1000
+#				images, more where the harmonic mean divides by values near
+#				zero).
+###############################################################################
+def filter_tiled(src, func, halo, out=None, tile=TILE_SIZE):
+	src = _open_source(src)
+	M, N = src.shape
+	h_u, h_v = _pair(halo)
+
+	result = None
+	for (u0, u1), (v0, v1) in _tiles(src.shape, tile):
+		# Read tile with a halo, cropped to the image so that the filter
+		# handles the image border in the same way as for the whole image
+		a0, a1 = max(u0 - h_u, 0), min(u1 + h_u, M)
+		b0, b1 = max(v0 - h_v, 0), min(v1 + h_v, N)
+		g = func(np.asarray(src[a0:a1, b0:b1]))
+
+		# Output data type is only known after filtering the first tile
+		if result is None:
+			result = _open_output(out, src.shape, g.dtype)
+
+		result[u0:u1, v0:v1] = g[u0 - a0:u1 - a0, v0 - b0:v1 - b0]
+
+	return _flush(result)
+
+# Filter Image in Frequency Domain in Tiles
+###############################################################################
+# INPUT
+# src:			Input image, as an array, a memory-mapped array, a LazyImage or
+#				the path of an image file (.npy and uncompressed TIFF files
+#				are memory-mapped)
+# fclass:		Filter class ('lowpass', 'highpass', 'bandreject', 'bandpass',
+#				'notchreject' or 'notchpass')
+# ftype:		Filter type ('ideal', 'butterworth' or 'gaussian')
+# d0:			Cutoff frequency
+# w:			Width of the band (only applies for bandpass/bandreject filters)
+# n:			Order of filter (only applies for butterworth filters)
+# u_k:			u position of notch pair (only applies for notch filters)
+# v_k:			v position of notch pair (only applies for notch filters)
+# notches:		List of (u_k, v_k, d0) for each notch pair, used instead of
+#				d0, u_k and v_k (only applies for notch filters)
+# mode:			Transform mode of the matching filter_image_freq call
+#				('complex' or 'real')
+# out:			Output image, as an array, a memory-mapped array or the path
+#				of a .npy file which is created (default is a new array)
+# tile:			Shape of the tiles, as a number or a pair
+# tol:			Largest part of the absolute kernel sum left out of the halo
+# max_radius:	Largest halo. Filters whose kernel needs a larger halo to
+#				leave out at most tol raise ValueError, as slowly decaying
+#				kernels (e.g. ideal filters) would read most of the image for
+#				every tile (default is the larger side of a tile, so a tile
+#				with its halo is at most 3 x 3 tiles)
+###############################################################################
+# OUTPUT
+# out:			Filtered image, equal to the output image of filter_image_freq
+#				up to tol times the largest absolute image value, but not
+#				bit-identical since the kernel is cropped
+###############################################################################
+def filter_image_freq_tiled(src, fclass='lowpass', ftype='butterworth', d0=160, w=20, n=2, u_k=0, v_k=0, notches=None, mode='complex', out=None, tile=TILE_SIZE, tol=1e-6, max_radius=None):
+	if mode not in ('complex', 'real'):
+		raise ValueError("Unknown transform mode '%s'" % mode)
+	src = _open_source(src)
+	M, N = src.shape
+	t_u, t_v = _pair(tile)
+	t_u, t_v = min(t_u, M), min(t_v, N)
+	if max_radius is None:
+		max_radius = max(t_u, t_v)
+
+	# Filtering the zero padded image in the frequency domain is a linear
+	# convolution with the spatial kernel of the filter. The kernel is cropped
+	# one pixel beyond max_radius, so that larger kernels show in its shape.
+	h = spatial_kernel(src.shape, fclass, ftype, d0, w, n, u_k, v_k, notches, tol, max_radius + 1)
+	r_u, r_v = h.shape[0]//2, h.shape[1]//2
+	if max(r_u, r_v) > max_radius:
+		raise ValueError("Filter kernel needs a halo of more than %d pixels for tol=%g, increase tol, tile or max_radius" % (max_radius, tol))
+
+	# Overlap-save: every block holds a tile with its halo, and the transform
+	# of the kernel is shared by all blocks of the same shape
+	shape = (next_fast_len(t_u + 2*r_u), next_fast_len(t_v + 2*r_v))
+	H = np.fft.rfft2(h, shape)
+
+	result = _open_output(out, src.shape, np.float64)
+	block = np.zeros(shape)
+	for (u0, u1), (v0, v1) in _tiles(src.shape, (t_u, t_v)):
+		# Read tile with a halo, with zeros outside the image as in the
+		# padding of the whole image
+		a0, a1 = max(u0 - r_u, 0), min(u1 + r_u, M)
+		b0, b1 = max(v0 - r_v, 0), min(v1 + r_v, N)
+		block.fill(0)
+		block[a0 - (u0 - r_u):a1 - (u0 - r_u), b0 - (v0 - r_v):b1 - (v0 - r_v)] = src[a0:a1, b0:b1]
+
+		# Circular convolution, where the outputs that have seen the whole
+		# kernel without wrapping around start at offset 2r
+		g = np.fft.irfft2(np.fft.rfft2(block) * H, shape)
+		g = g[2*r_u:2*r_u + u1 - u0, 2*r_v:2*r_v + v1 - v0]
+
+		# Complex mode takes the magnitude of the output
+		result[u0:u1, v0:v1] = np.abs(g) if mode == 'complex' else g
+
+	return _flush(result)
+
+# Open input image, memory-mapping .npy and uncompressed TIFF files
+def _open_source(src):
+	if isinstance(src, str):
+		src = imread(src)
+	if np.ndim(src) != 2:
+		raise ValueError("Tiled filtering needs an M x N image")
+	return src
+
+# Open output image, creating memory-mapped .npy files
+def _open_output(out, shape, dtype):
+	if out is None:
+		return np.empty(shape, dtype=dtype)
+	if isinstance(out, str):
+		return np.lib.format.open_memmap(out, mode='w+', dtype=dtype, shape=shape)
+	if out.shape != shape:
+		raise ValueError("Output shape %s does not match image shape %s" % (out.shape, shape))
+	return out
+
+# Write memory-mapped output to disk
+def _flush(out):
+	if isinstance(out, np.memmap):
+		out.flush()
+	return out
+
+# Start and end rows and columns of each tile, row by row
+def _tiles(shape, tile):
+	M, N = shape
+	t_u, t_v = _pair(tile)
+	for u0 in range(0, M, t_u):
+		for v0 in range(0, N, t_v):
+			yield (u0, min(u0 + t_u, M)), (v0, min(v0 + t_v, N))
+
+# Pair of integers from a number or a pair
+def _pair(x):
+	a, b = np.broadcast_to(x, (2,))
+	return int(a), int(b)
@@ -0,0 +1,364 @@
+import argparse
+import glob
+import os
+import sys
+
+import numpy as np
+
+import freq_filters
+import spatial_filters
+from filter_chain import FilterChain
+from image_io import imread
+from tiling import filter_tiled, filter_image_freq_tiled
+
+# Shape of the crops of data/ images and production frames, which keeps the
+# loop references fast
+CROP_SIZE = 48
+
+# Shapes the filter builders are checked for, including odd sizes
+BUILDER_SHAPES = [(64, 64), (37, 52)]
+
+# Data types of the input images. The loops accumulate uint8 sums and
+# products in uint8, so the sum based filters are checked with int64 instead.
+DTYPES = ['uint8', 'int64', 'float32', 'float64']
+SUM_DTYPES = ['int64', 'float32', 'float64']
+
+# Checks of image filters, as (name, data types, reference, backends). The
+# reference is the loop implementation, and each backend maps a name to
+# (function, ulps, atol): the backend passes if its largest difference from
+# the reference is at most ulps units in the last place or atol, both
+# relative to the largest reference value (at least 1). Integer outputs may
+# only differ by atol intensity levels, so they must match exactly for the
+# tolerances used here.
+def image_checks():
+	box = np.ones((5, 5)) / 25
+	ones = np.ones((9, 9))
+	laplacian = np.array([[0, 1, 0], [1, -4, 1], [0, 1, 0]], dtype=np.float64)
+	conv = spatial_filters.spatial_convolution2d
+
+	checks = [
+		('spatial_convolution2d/box', ['float32', 'float64'], lambda f: conv(f, box, 'loop'), {
+			'direct': (lambda f: conv(f, box, 'direct'), 0, 0),
+			'separable': (lambda f: conv(f, box, 'separable'), 64, 0),
+			'fft': (lambda f: conv(f, box, 'fft'), 1024, 0)}),
+		# The loop converts integer sums to the image type after each tap,
+		# which only the direct method does too
+		('spatial_convolution2d/box/integer', ['int64'], lambda f: conv(f, box, 'loop'), {
+			'direct': (lambda f: conv(f, box, 'direct'), 0, 0),
+			'auto': (lambda f: conv(f, box), 0, 0)}),
+		# Integer filters give exact integer results with every method
+		('spatial_convolution2d/ones', SUM_DTYPES, lambda f: conv(f, ones, 'loop'), {
+			'auto': (lambda f: conv(f, ones), 256, 0),
+			'direct': (lambda f: conv(f, ones, 'direct'), 0, 0),
+			'separable': (lambda f: conv(f, ones, 'separable'), 256, 0),
+			'fft': (lambda f: conv(f, ones, 'fft'), 1024, 0)}),
+		('spatial_convolution2d/laplacian', SUM_DTYPES, lambda f: conv(f, laplacian, 'loop'), {
+			'direct': (lambda f: conv(f, laplacian, 'direct'), 0, 0),
+			'fft': (lambda f: conv(f, laplacian, 'fft'), 1024, 0)}),
+	]
+
+	for ftype in ('arithmetic', 'geometric'):
+		for s in (3, 5):
+			checks.append(('mean_filter/%s/s=%d' % (ftype, s), SUM_DTYPES,
+				lambda f, ftype=ftype, s=s: _mean_reference(f, s, ftype), {
+				'integral': (lambda f, ftype=ftype, s=s: spatial_filters.mean_filter(f, s, ftype, 'integral'), 256, 0)}))
+
+	for s in (3, 5):
+		checks.append(('median_filter/s=%d' % s, DTYPES, lambda f, s=s: spatial_filters.median_filter(f, s, 'loop'), {
+			'sort': (lambda f, s=s: spatial_filters.median_filter(f, s, 'sort'), 0, 0),
+			'histogram': (lambda f, s=s: spatial_filters.median_filter(f, s, 'histogram'), 0, 0),
+			'tiled': (lambda f, s=s: filter_tiled(f, lambda t: spatial_filters.median_filter(t, s), s//2, tile=16), 0, 0)}))
+
+	checks.append(('adaptive_median_filter', DTYPES, lambda f: spatial_filters.adaptive_median_filter(f, 3, 7, 'loop'), {
+		'vectorized': (lambda f: spatial_filters.adaptive_median_filter(f, 3, 7), 0, 0)}))
+
+	# Noise variance of 0.01 for images in [0,1], and the same for [0,255]
+	var_g = lambda f: 0.01 if np.issubdtype(f.dtype, np.floating) else 0.01 * 255**2
+	checks.append(('adaptive_lnr_filter', SUM_DTYPES, lambda f: spatial_filters.adaptive_lnr_filter(f, var_g(f), 5, 'loop'), {
+		'integral': (lambda f: spatial_filters.adaptive_lnr_filter(f, var_g(f), 5), 64, 1e-9),
+		'tiled': (lambda f: filter_tiled(f, lambda t: spatial_filters.adaptive_lnr_filter(t, var_g(f), 5), 2, tile=16), 64, 1e-9)}))
+
+	# The real transform and the tiled spatial kernel only keep the Hermitian
+	# part of the filter. The notch filter is not Hermitian at the Nyquist
+	# frequencies of the even padded grid, which the complex transform keeps.
+	# The kernels for the small test images are larger than the tiles, so the
+	# halo is only bounded by the image size.
+	for params, atol in (({'fclass': 'lowpass', 'ftype': 'butterworth', 'd0': 20, 'n': 2}, 0),
+		({'fclass': 'highpass', 'ftype': 'gaussian', 'd0': 15}, 0),
+		({'fclass': 'notchreject', 'ftype': 'butterworth', 'd0': 8, 'n': 2, 'u_k': 20, 'v_k': 12}, 1e-2)):
+		name = 'filter_image_freq/%s/%s' % (params['fclass'], params['ftype'])
+		freq = lambda f, mode='complex', params=params: freq_filters.filter_image_freq(f, mode=mode, spectrum=False, transfer=False, **params)[0]
+		checks.append((name, ['float64'], lambda f, params=params: _filter_image_freq_reference(f, **params), {
+			'complex': (freq, 1024, 0),
+			'real': (lambda f, freq=freq: np.abs(freq(f, 'real')), 1024, atol),
+			'chain': (lambda f, params=params: FilterChain([params])(f), 1024, 0),
+			'tiled': (lambda f, params=params: filter_image_freq_tiled(f, tile=16, max_radius=max(f.shape), **params), 0, max(atol, 1e-6))}))
+
+	return checks
+
+# Checks of filter builders, as (name, reference, backends) like image_checks,
+# with functions of the filter shape
+def builder_checks():
+	checks = []
+	notches = [(20, 12, 8), (-15, 25, 5)]
+	for ftype in ('ideal', 'butterworth', 'gaussian'):
+		lowpass = lambda shape, ftype=ftype: freq_filters.lowpass_filter(shape, 20, ftype, 2, method='loop')
+		bandreject = lambda shape, ftype=ftype: freq_filters.bandreject_filter(shape, 20, 8, ftype, 2, method='loop')
+		notch_reject = lambda shape, u_k, v_k, d0, ftype=ftype: _notch_reject_reference(shape, d0, ftype, u_k, v_k)
+		multi_reject = lambda shape, notch_reject=notch_reject: np.prod([notch_reject(shape, *notch) for notch in notches], axis=0)
+		checks += [
+			('lowpass_filter/%s' % ftype, lowpass, {
+				'vectorized': (lambda shape, ftype=ftype: freq_filters.lowpass_filter(shape, 20, ftype, 2), 8, 0)}),
+			('highpass_filter/%s' % ftype, lambda shape, lowpass=lowpass: 1.0 - lowpass(shape), {
+				'vectorized': (lambda shape, ftype=ftype: freq_filters.highpass_filter(shape, 20, ftype, 2), 8, 0)}),
+			('bandreject_filter/%s' % ftype, bandreject, {
+				'vectorized': (lambda shape, ftype=ftype: freq_filters.bandreject_filter(shape, 20, 8, ftype, 2), 8, 0)}),
+			('bandpass_filter/%s' % ftype, lambda shape, bandreject=bandreject: 1.0 - bandreject(shape), {
+				'vectorized': (lambda shape, ftype=ftype: freq_filters.bandpass_filter(shape, 20, 8, ftype, 2), 8, 0)}),
+			('notch_reject_filter/%s' % ftype, lambda shape, notch_reject=notch_reject: notch_reject(shape, *notches[0]), {
+				'vectorized': (lambda shape, ftype=ftype: freq_filters.notch_reject_filter(shape, 8, ftype, 2, 20, 12), 8, 0)}),
+			('multi_notch_reject_filter/%s' % ftype, multi_reject, {
+				'vectorized': (lambda shape, ftype=ftype: freq_filters.multi_notch_reject_filter(shape, notches, ftype, 2), 8, 1e-5)}),
+		]
+	return checks
+
+# Test images as (name, image in [0,1]): randomized inputs with odd sizes,
+# constant regions, extreme values and impulses, and crops of the data/ images
+def test_images(seed=0, with_data=True):
+	rng = np.random.RandomState(seed)
+
+	# Piecewise constant blocks
+	blocks = np.kron(rng.randint(0, 4, (5, 5)) / 3.0, np.ones((8, 8)))
+
+	# Smooth gradient with salt and pepper noise
+	x, y = np.meshgrid(np.linspace(0, 1, 39), np.linspace(0, 1, 41))
+	impulses = (x + y) / 2
+	noise = rng.rand(*impulses.shape)
+	impulses[noise < 0.125] = 0
+	impulses[noise > 0.875] = 1
+
+	images = [
+		('odd', rng.rand(37, 53)),
+		('constant', np.full((29, 31), 0.5)),
+		('blocks', blocks),
+		('extremes', rng.randint(0, 2, (33, 35)).astype(np.float64)),
+		('impulses', impulses),
+		('tiny', rng.rand(2, 3)),
+	]
+
+	if with_data:
+		for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', '*.*'))):
+			img = imread(path, np.float64)
+			if img.ndim == 2:
+				images.append((os.path.basename(path), _crop(img, CROP_SIZE)))
+
+	return images
+
+# Convert image in [0,1] to a data type, quantized to 256 levels
+def as_dtype(img, dtype):
+	img8 = np.around(img * 255).astype(np.uint8)
+	if dtype in ('uint8', 'int64'):
+		return img8.astype(dtype)
+	return (img8 / 255.0).astype(dtype)
+
+# Run Checks
+###############################################################################
+# INPUT
+# images:		List of (name, image in [0,1]) to check the image filters on
+#				(default is test_images())
+# names:		Names of the checks to run, or prefixes of them (default is
+#				all checks)
+# builders:		Whether to check the filter builders
+###############################################################################
+# OUTPUT
+# results:		List of dicts with the check, backend, input, data type, the
+#				largest absolute difference 'max_abs' and difference in
+#				units in the last place 'max_ulp', and whether it 'passed'
+###############################################################################
+def run_checks(images=None, names=None, builders=True):
+	if images is None:
+		images = test_images()
+	selected = lambda name: names is None or any(name.startswith(prefix) for prefix in names)
+
+	results = []
+	for name, dtypes, reference, backends in image_checks():
+		if not selected(name):
+			continue
+		for img_name, img in images:
+			for dtype in dtypes:
+				f = as_dtype(img, dtype)
+				ref = reference(f)
+				for backend, (func, ulps, atol) in sorted(backends.items()):
+					results.append(_compare(name, backend, img_name, dtype, ref, func(f), ulps, atol))
+
+	if builders:
+		for name, reference, backends in builder_checks():
+			if not selected(name):
+				continue
+			for shape in BUILDER_SHAPES:
+				ref = reference(shape)
+				for backend, (func, ulps, atol) in sorted(backends.items()):
+					results.append(_compare(name, backend, '%dx%d' % shape, 'float64', ref, func(shape), ulps, atol))
+
+	return results
+
+# Verify Frames
+###############################################################################
+# INPUT
+# frames:		Iterable of production images in [0,1] (floats) or uint8
+# rate:			Fraction of the frames that are checked
+# names:		Names of the checks to run, or prefixes of them (default is
+#				all image checks)
+# size:			Shape of the random crop of a frame that is checked
+# seed:			Seed of the random sampling
+###############################################################################
+# OUTPUT
+# results:		Results as for run_checks, with the index of the frame in
+#				the input name
+###############################################################################
+def verify_frames(frames, rate=0.01, names=None, size=CROP_SIZE, seed=None):
+	rng = np.random.RandomState(seed)
+
+	results = []
+	for k, frame in enumerate(frames):
+		if rng.rand() >= rate:
+			continue
+		img = np.asarray(frame)
+		if img.dtype == np.uint8:
+			img = img / 255.0
+
+		# Check a random crop, the loop references are too slow for a frame
+		u0 = rng.randint(0, max(img.shape[0] - size, 0) + 1)
+		v0 = rng.randint(0, max(img.shape[1] - size, 0) + 1)
+		crop = img[u0:u0 + size, v0:v0 + size]
+
+		results += run_checks([('frame%d[%d:%d,%d:%d]' % (k, u0, u0 + crop.shape[0], v0, v0 + crop.shape[1]), crop)],
+			names, builders=False)
+
+	return results
+
+# Results that did not pass
+def failures(results):
+	return [r for r in results if not r['passed']]
+
+# Largest difference in units in the last place between two arrays of the same
+# type. NaNs match each other, and any other value infinitely badly.
+def ulp_difference(a, b):
+	a = np.asarray(a)
+	b = np.asarray(b)
+	if a.size == 0:
+		return 0
+	if not np.issubdtype(a.dtype, np.floating):
+		return int(np.max(np.abs(a.astype(np.int64) - b.astype(np.int64))))
+
+	dtype = np.result_type(a, b)
+	itype = np.int32 if dtype == np.float32 else np.int64
+	a = a.astype(dtype)
+	b = b.astype(dtype)
+
+	# Map the floats to integers in the same order, with -0 and +0 equal
+	ia = a.view(itype).astype(np.int64)
+	ib = b.view(itype).astype(np.int64)
+	sign = np.int64(np.iinfo(itype).min)
+	ia = np.where(ia < 0, sign - ia, ia)
+	ib = np.where(ib < 0, sign - ib, ib)
+
+	diff = np.abs(ia - ib).astype(np.float64)
+	nan_a = np.isnan(a)
+	nan_b = np.isnan(b)
+	diff[nan_a & nan_b] = 0
+	diff[nan_a ^ nan_b] = np.inf
+	return float(diff.max())
+
+# Compare the output of a backend with the reference
+def _compare(name, backend, img_name, dtype, ref, out, ulps, atol):
+	ref = np.asarray(ref)
+	out = np.asarray(out)
+
+	if ref.shape != out.shape:
+		return {'check': name, 'backend': backend, 'input': img_name, 'dtype': dtype,
+			'max_abs': np.inf, 'max_ulp': np.inf, 'passed': False}
+
+	both_nan = np.isnan(ref) & np.isnan(out) if np.issubdtype(ref.dtype, np.floating) else False
+	diff = np.abs(ref.astype(np.float64) - out.astype(np.float64))
+	diff = np.where(both_nan, 0, diff)
+	max_abs = float(np.nanmax(np.where(np.isnan(diff), np.inf, diff))) if diff.size else 0.0
+	max_ulp = ulp_difference(ref, out.astype(ref.dtype) if out.dtype != ref.dtype else out)
+
+	# Allowed difference, relative to the largest reference value
+	if np.issubdtype(ref.dtype, np.floating):
+		scale = max(1.0, float(np.nanmax(np.abs(ref)))) if ref.size and not np.all(np.isnan(ref)) else 1.0
+		passed = max_abs <= max(ulps * np.finfo(ref.dtype).eps, atol) * scale
+	else:
+		passed = max_abs <= atol
+
+	return {'check': name, 'backend': backend, 'input': img_name, 'dtype': dtype,
+		'max_abs': max_abs, 'max_ulp': max_ulp, 'passed': bool(passed)}
+
+# Frequency domain filtering of the original implementation, a filter built
+# with loops applied to the padded complex transform
+def _filter_image_freq_reference(img, fclass, ftype, d0=160, n=2, u_k=0, v_k=0):
+	M, N = img.shape
+	shape = (2*M, 2*N)
+
+	if fclass == 'lowpass':
+		H = freq_filters.lowpass_filter(shape, d0, ftype, n, method='loop')
+	elif fclass == 'highpass':
+		H = 1.0 - freq_filters.lowpass_filter(shape, d0, ftype, n, method='loop')
+	elif fclass == 'notchreject':
+		H = _notch_reject_reference(shape, d0, ftype, u_k, v_k, n)
+	else:
+		raise ValueError("No reference for filter class '%s'" % fclass)
+
+	F = np.fft.fftshift(np.fft.fft2(img, s=shape))
+	G = np.abs(np.fft.ifft2(np.fft.ifftshift(F * H)))
+	return G[0:M, 0:N]
+
+# Mean filter with the loop. The loop geometric mean multiplies all values of a
+# window, which underflows in float32 for dark windows and overflows integers,
+# so it is computed in float64 and rounded off for integer images like the
+# integral method does. The arithmetic loop sums integers exactly.
+def _mean_reference(img, s, ftype):
+	if img.dtype == np.float64 or (ftype == 'arithmetic' and img.dtype != np.float32):
+		return spatial_filters.mean_filter(img, s, ftype, 'loop')
+	result = spatial_filters.mean_filter(img.astype(np.float64), s, ftype, 'loop')
+	if not np.issubdtype(img.dtype, np.floating):
+		result = np.around(result)
+	return result.astype(img.dtype)
+
+# Notch reject filter as the product of loop built highpass filters at
+# (-u_k, -v_k) and (u_k, v_k)
+def _notch_reject_reference(shape, d0, ftype, u_k, v_k, n=2):
+	lowpass = lambda u, v: freq_filters.lowpass_filter(shape, d0, ftype, n, u, v, method='loop')
+	return (1.0 - lowpass(-u_k, -v_k)) * (1.0 - lowpass(u_k, v_k))
+
+# Center crop of an image
+def _crop(img, size):
+	u0 = max(img.shape[0] - size, 0) // 2
+	v0 = max(img.shape[1] - size, 0) // 2
+	return img[u0:u0 + size, v0:v0 + size]
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Check the fast filters against the loop reference implementations")
+	parser.add_argument('names', nargs='*', help="names or prefixes of the checks to run (default is all)")
+	parser.add_argument('--seed', type=int, default=0, help="seed of the randomized inputs")
+	parser.add_argument('--no-data', action='store_true', help="skip the crops of the images in data/")
+	parser.add_argument('--frames', help="glob of production images to cross-check instead of the test images")
+	parser.add_argument('--rate', type=float, default=1.0, help="fraction of the production images to check")
+	parser.add_argument('--verbose', action='store_true', help="print passing results too")
+	args = parser.parse_args()
+
+	names = args.names or None
+	if args.frames:
+		results = verify_frames((imread(path, np.float64) for path in sorted(glob.glob(args.frames))), args.rate, names, seed=args.seed)
+	else:
+		results = run_checks(test_images(args.seed, not args.no_data), names)
+
+	for r in results:
+		if args.verbose or not r['passed']:
+			print("%-4s %-40s %-10s %-40s %-8s max_abs=%.3g max_ulp=%.3g" % ('ok' if r['passed'] else 'FAIL',
+				r['check'], r['backend'], r['input'], r['dtype'], r['max_abs'], r['max_ulp']))
+
+	failed = failures(results)
+	print("%d of %d checks passed" % (len(results) - len(failed), len(results)))
+	sys.exit(1 if failed else 0)